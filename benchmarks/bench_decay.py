@@ -0,0 +1,130 @@
+# Бенчмарк рейтинга с затуханием: полный пересчет по всем оценкам (сумма exp(...) по таблице ratings
+# для каждого места) против прохода decay_ratings (score из сумм места без чтения оценок,
+# перезаписываются только заметно изменившиеся места) и обновления одного места в add_rating.
+# Оценки за последние три года генерируются сразу в базу, суммы мест заполняются полным пересчетом.
+# Сохраненный score всех мест сравнивается с полным пересчетом на тот же момент времени:
+# через 30 дней и через 5 лет, когда проход переносит точку отсчета.
+# Запуск из корня репозитория: python -m benchmarks.bench_decay [количество мест] [количество оценок]
+
+import asyncio
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from benchmarks.bench_import import reset
+import databases.database as database
+
+
+DAY = 86400
+NEW_RATINGS = 2000
+
+# Полный пересчет: веса всех оценок относительно :now заново по таблице ratings
+RECOMPUTE_SCORES = '''
+    UPDATE places SET decay_sum = totals.decay_sum, decay_weight = totals.decay_weight,
+                      score = (totals.decay_sum + :prior_sum) / (totals.decay_weight + :prior_weight)
+    FROM (
+        SELECT name, SUM(rating * exp(:rate * (rated_at - :now))) AS decay_sum,
+               SUM(exp(:rate * (rated_at - :now))) AS decay_weight
+        FROM ratings GROUP BY name
+    ) AS totals
+    WHERE places.name = totals.name
+'''
+SELECT_RECOMPUTED_SCORES = '''
+    SELECT places.name, places.score,
+           (COALESCE(SUM(ratings.rating * exp(:rate * (rated_at - :now))), 0) + :prior_sum)
+           / (COALESCE(SUM(exp(:rate * (rated_at - :now))), 0) + :prior_weight)
+    FROM places LEFT JOIN ratings ON ratings.name = places.name
+    GROUP BY places.name
+'''
+
+
+def parameters(now: float) -> dict[str, float]:
+    decay = database.rating_decay
+    return {'rate': decay.rate, 'now': now, 'prior_sum': decay.prior * decay.prior_weight,
+            'prior_weight': decay.prior_weight}
+
+
+async def fill(size: int, ratings: int, now: float, rng: random.Random) -> None:
+    names = [f'место {number}' for number in range(size)]
+    rows = {}
+    for _ in range(ratings):
+        rows[rng.choice(names), rng.randrange(ratings // 5)] = (rng.randint(1, 10), now - rng.uniform(0, 3 * 365 * DAY))
+    async with database.db.transaction() as connection:
+        await connection.executemany(database.INSERT_PLACE, [(name, 'адрес', None, None, database.RATING_PRIOR)
+                                                             for name in names])
+        await connection.executemany(database.UPSERT_RATING, [(name, user_id, rating, rated_at)
+                                                              for (name, user_id), (rating, rated_at) in rows.items()])
+        await connection.executemany(database.INSERT_RATING_EVENT, [(name, user_id, rating, rated_at) for
+                                                                    (name, user_id), (rating, rated_at) in rows.items()])
+        await connection.execute('UPDATE places SET rating_count = 1')
+
+
+async def recompute(now: float) -> None:
+    async with database.db.transaction() as connection:
+        await connection.execute(RECOMPUTE_SCORES, parameters(now))
+        await connection.execute(database.UPDATE_RATING_LANDMARK, (now,))
+
+
+async def measure(label: str, count: int, coroutine) -> None:
+    started = time.perf_counter()
+    result = await coroutine
+    elapsed = time.perf_counter() - started
+    line = f'  {label:48} {elapsed * 1000:9.1f} мс'
+    if count:
+        line += f'  ({elapsed / count * 1000:.3f} мс на оценку)'
+    elif result is not None:
+        line += f'  (изменился score у {result} мест)'
+    print(line)
+
+
+async def compare(label: str, now: float) -> None:
+    rows = await database.db.fetchall(SELECT_RECOMPUTED_SCORES, parameters(now))
+    worst = max(abs(stored - expected) for _, stored, expected in rows)
+    cached = max(abs(database.catalog.get(name).score - stored) for name, stored, _ in rows)
+    print(f'  расхождение score с полным пересчетом {label}: {worst:.1e} (кэш каталога: {cached:.1e})')
+
+
+async def add_ratings(size: int, now: float, rng: random.Random) -> None:
+    for number in range(NEW_RATINGS):
+        await database.add_rating(f'место {rng.randrange(size)}', 10 ** 9 + number, rng.randint(1, 10), now)
+
+
+async def hourly(started: float, hours: int) -> int:
+    # Проходы раз в час, как в RatingDecayTask; возвращает, сколько раз перезаписывался score
+    changed = 0
+    for hour in range(1, hours + 1):
+        changed += await database.decay_ratings(started + hour * 3600)
+    return changed
+
+
+async def run(size: int, ratings: int) -> None:
+    rng = random.Random(42)
+    now = time.time()
+    with tempfile.TemporaryDirectory() as directory:
+        await reset(Path(directory) / 'decay.db')
+        await fill(size, ratings, now, rng)
+        await database.load_places()
+        print(f'{size} мест, {ratings} оценок за три года')
+
+        await measure('полный пересчет по всем оценкам', 0, recompute(now))
+        await database.load_places()
+        await measure('проход decay_ratings через час', 0, database.decay_ratings(now + 3600))
+        await measure('24 прохода decay_ratings раз в час', 0, hourly(now, 24))
+        await measure(f'{NEW_RATINGS} новых оценок через add_rating', NEW_RATINGS, add_ratings(size, now + DAY, rng))
+        await measure('проход decay_ratings через 30 дней', 0, database.decay_ratings(now + 30 * DAY))
+        await compare('через 30 дней', now + 30 * DAY)
+        await measure('проход decay_ratings через 5 лет (перенос)', 0, database.decay_ratings(now + 5 * 365 * DAY))
+        await compare('через 5 лет', now + 5 * 365 * DAY)
+        await database.db.close()
+
+
+def main() -> None:
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    ratings = int(sys.argv[2]) if len(sys.argv) > 2 else 1_000_000
+    asyncio.run(run(size, ratings))
+
+
+if __name__ == '__main__':
+    main()
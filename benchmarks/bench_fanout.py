@@ -0,0 +1,71 @@
+# Бенчмарк рассылки опросов по многим чатам: последовательная рассылка против fan_out.
+# Каждый чат получает два опроса через OutboundDispatcher с лимитами Telegram по умолчанию
+# (30 запросов/с на бота, 20 запросов в минуту на группу с запасом 3); ответ Telegram имитируется задержкой.
+# Проверяется, что при любой параллельности лимиты не превышаются.
+# Запуск из корня репозитория: python -m benchmarks.bench_fanout [чатов] [задержка Telegram, мс]
+
+import asyncio
+import bisect
+import sys
+import time
+from collections import defaultdict
+from types import SimpleNamespace
+
+from services.fanout import fan_out
+from services.outbound import PRIORITY_SCHEDULED, OutboundDispatcher
+
+
+class StubBot:
+    # Вместо Telegram: запоминает время каждого запроса и отвечает через latency секунд
+
+    def __init__(self, latency: float) -> None:
+        self.latency = latency
+        self.calls: list[tuple[float, int]] = []
+        self._poll_ids = iter(range(1, 10 ** 9))
+
+    async def send_poll(self, chat_id: int, **kwargs):
+        self.calls.append((time.monotonic(), chat_id))
+        await asyncio.sleep(self.latency)
+        return SimpleNamespace(poll=SimpleNamespace(id=str(next(self._poll_ids)), options=[]))
+
+
+def max_in_window(times: list[float], window: float = 1.0) -> int:
+    # Наибольшее число запросов за любые window секунд
+    times = sorted(times)
+    return max((bisect.bisect_left(times, start + window) - index for index, start in enumerate(times)), default=0)
+
+
+async def run(chats: int, latency: float, concurrency: int) -> None:
+    bot = StubBot(latency)
+    outbound = OutboundDispatcher(bot)
+    outbound.start()
+
+    async def send_chat_poll(chat_id: int) -> None:
+        await outbound.send_poll(chat_id, question='Время', options=['a', 'b'], priority=PRIORITY_SCHEDULED)
+        await outbound.send_poll(chat_id, question='Место', options=['x', 'y'], priority=PRIORITY_SCHEDULED)
+
+    started = time.perf_counter()
+    errors = await fan_out(range(-1000, -1000 - chats, -1), send_chat_poll, concurrency)
+    elapsed = time.perf_counter() - started
+    await outbound.stop()
+
+    per_chat = defaultdict(list)
+    for moment, chat_id in bot.calls:
+        per_chat[chat_id].append(moment)
+    failed = sum(error is not None for error in errors.values())
+    print(f'  параллельно {concurrency:3} чатов: {elapsed:6.1f} с, {len(bot.calls) / elapsed:5.1f} запросов/с, '
+          f'максимум за 1 с: {max_in_window([moment for moment, _ in bot.calls])} всего, '
+          f'{max(max_in_window(times) for times in per_chat.values())} в одном чате, ошибок: {failed}')
+
+
+async def main() -> None:
+    chats = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    latency = float(sys.argv[2]) / 1000 if len(sys.argv) > 2 else 0.15
+
+    print(f'{chats} чатов, по 2 опроса, ответ Telegram через {latency * 1000:.0f} мс')
+    for concurrency in (1, 20):
+        await run(chats, latency, concurrency)
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,55 @@
+# Бенчмарк хранилищ состояний FSM: MemoryStorage против SQLiteStorage.
+# Каждый шаг диалога - то же, что делает state.proxy(): get_state + get_data, затем set_state + set_data.
+# Запуск из корня репозитория: python -m benchmarks.bench_fsm [количество пользователей] [шагов на пользователя]
+
+import asyncio
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from aiogram.contrib.fsm_storage.memory import MemoryStorage
+
+from databases.fsm_storage import SQLiteStorage
+from databases.migrations import migrate
+from databases.pool import ConnectionPool
+
+
+async def dialogue_steps(storage, users: int, steps: int) -> float:
+    # Возвращает количество шагов диалога в секунду
+    started = time.perf_counter()
+    for step in range(steps):
+        for user in range(users):
+            await storage.get_state(chat=-100, user=user)
+            data = await storage.get_data(chat=-100, user=user)
+            data.setdefault('messages_to_delete', []).append(step)
+            await storage.set_state(chat=-100, user=user, state=f'Place:step{step}')
+            await storage.set_data(chat=-100, user=user, data=data)
+    if isinstance(storage, SQLiteStorage):
+        await storage.flush()
+    return users * steps / (time.perf_counter() - started)
+
+
+async def main() -> None:
+    users = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    steps = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+
+    print(f'{users} пользователей, {steps} шагов диалога')
+    print(f'  MemoryStorage:                   {await dialogue_steps(MemoryStorage(), users, steps):10.0f} шагов/с')
+
+    with tempfile.TemporaryDirectory() as directory:
+        pool = ConnectionPool(str(Path(directory) / 'fsm.db'))
+        await pool.open()
+        async with pool.acquire() as connection:
+            await migrate(connection)
+
+        for label, cache_size in (('SQLiteStorage, все в кэше', users), ('SQLiteStorage, кэш 10%', users // 10)):
+            storage = SQLiteStorage(pool, cache_size=cache_size)
+            storage.start()
+            print(f'  {label + ":":<32} {await dialogue_steps(storage, users, steps):10.0f} шагов/с')
+            await storage.close()
+        await pool.close()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
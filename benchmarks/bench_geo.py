@@ -0,0 +1,91 @@
+# Бенчмарк поиска ближайших мест: PlaceGeoIndex (k-d дерево в памяти) против полного перебора
+# с формулой гаверсинусов. Места сгенерированы вокруг нескольких центров (как районы города),
+# часть - далеко за городом; запросы - в городе и в пустых местах далеко от всех мест.
+# Заодно проверяется, что результаты совпадают с перебором, и измеряется стоимость
+# добавления и удаления места в индексе.
+# Запуск из корня репозитория: python -m benchmarks.bench_geo [количество мест] [количество запросов]
+
+import math
+import random
+import sys
+import time
+
+from databases.geo import EARTH_RADIUS_KM, PlaceGeoIndex
+
+
+K = 5
+CENTERS = [(41.7151, 44.8271), (41.7225, 44.7925), (41.6938, 44.8015), (41.7580, 44.7760), (41.6580, 44.9450)]
+
+
+def make_points(size: int, rng: random.Random) -> list[tuple[int, float, float]]:
+    points = []
+    for rowid in range(1, size + 1):
+        if rowid % 100 == 0:
+            latitude, longitude = rng.uniform(40.0, 43.5), rng.uniform(40.0, 46.7)
+        else:
+            latitude, longitude = rng.choice(CENTERS)
+            latitude, longitude = rng.gauss(latitude, 0.03), rng.gauss(longitude, 0.04)
+        points.append((rowid, latitude, longitude))
+    return points
+
+
+def distance_km(latitude: float, longitude: float, other_latitude: float, other_longitude: float) -> float:
+    # Формула гаверсинусов
+    lat1, lat2 = math.radians(latitude), math.radians(other_latitude)
+    a = (math.sin((lat2 - lat1) / 2) ** 2
+         + math.cos(lat1) * math.cos(lat2) * math.sin(math.radians(other_longitude - longitude) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def brute_force(points: list[tuple[int, float, float]], latitude: float, longitude: float, k: int) -> list:
+    return sorted((distance_km(latitude, longitude, lat, lon), rowid) for rowid, lat, lon in points)[:k]
+
+
+def measure(label: str, function, queries: list[tuple[float, float]]) -> list:
+    started = time.perf_counter()
+    results = [function(latitude, longitude) for latitude, longitude in queries]
+    elapsed = time.perf_counter() - started
+    print(f'  {label:34} {elapsed / len(queries) * 1e6:10.1f} мкс на запрос')
+    return results
+
+
+def main() -> None:
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    rng = random.Random(42)
+    points = make_points(size, rng)
+
+    started = time.perf_counter()
+    index = PlaceGeoIndex()
+    index.load(points)
+    print(f'{len(index)} мест, индекс построен за {time.perf_counter() - started:.2f} с, {count} запросов, k = {K}')
+
+    city = [(rng.gauss(41.715, 0.05), rng.gauss(44.82, 0.06)) for _ in range(count)]
+    remote = [(rng.uniform(35.0, 39.0), rng.uniform(30.0, 50.0)) for _ in range(count // 10)]
+
+    for label, queries in (('в городе', city), ('далеко от мест', remote)):
+        print(f' запросы {label}:')
+        found = measure('PlaceGeoIndex.nearest', lambda lat, lon: index.nearest(lat, lon, K), queries)
+        found_50 = measure('PlaceGeoIndex.nearest, до 50 км', lambda lat, lon: index.nearest(lat, lon, K, 50), queries)
+        sample = queries[:max(1, len(queries) // 20)]
+        expected = measure('полный перебор', lambda lat, lon: brute_force(points, lat, lon, K), sample)
+        mismatches = sum([rowid for _, rowid in got] != [rowid for _, rowid in want]
+                         for got, want in zip(found, expected))
+        within = sum(len(result) for result in found_50)
+        print(f'  расхождений с перебором: {mismatches} из {len(sample)}; найдено в пределах 50 км: {within}')
+
+    # Добавление и удаление мест (индекс обновляется при /add и /del)
+    extra = make_points(count, rng)
+    started = time.perf_counter()
+    for rowid, latitude, longitude in extra:
+        index.add(size + rowid, latitude, longitude)
+    added = time.perf_counter() - started
+    started = time.perf_counter()
+    for rowid, _, _ in extra:
+        index.remove(size + rowid)
+    removed = time.perf_counter() - started
+    print(f'  добавление места {added / count * 1e6:.1f} мкс, удаление {removed / count * 1e6:.1f} мкс')
+
+
+if __name__ == '__main__':
+    main()
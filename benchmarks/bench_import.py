@@ -0,0 +1,115 @@
+# Бенчмарк импорта и экспорта каталога мест: построчное добавление через add_place
+# (отдельная транзакция на каждое место) против import_places (executemany пачками
+# по IMPORT_CHUNK_SIZE мест в одной транзакции) для CSV и JSON, повторный импорт того же файла
+# (все места обновляются) и потоковый экспорт в CSV. Для каждого шага печатаются строки в секунду
+# Отдельно измеряется пик памяти Python (tracemalloc) при разборе файлов и при экспорте,
+# чтобы видеть, что файл не читается в память целиком: при импорте память растет из-за кэшей
+# каталога и поискового индекса, а tracemalloc сильно замедляет их заполнение.
+# Запуск из корня репозитория: python -m benchmarks.bench_import [количество мест] [мест для add_place]
+
+import asyncio
+import csv
+import json
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+from benchmarks.bench_search import make_name
+import databases.database as database
+from services.transfer import export_places, import_places, read_places
+
+
+def write_files(directory: Path, size: int) -> tuple[Path, Path]:
+    rng = random.Random(42)
+    names = list(dict.fromkeys(make_name(rng) for _ in range(size * 2)))[:size]
+    places = [(name, f'ул. {make_name(rng)}, {rng.randint(1, 200)}') for name in names]
+
+    csv_path = directory / 'places.csv'
+    with open(csv_path, 'w', newline='', encoding='utf-8') as file:
+        writer = csv.writer(file)
+        writer.writerow(('name', 'address'))
+        writer.writerows(places)
+
+    json_path = directory / 'places.json'
+    with open(json_path, 'w', encoding='utf-8') as file:
+        file.write('[\n')
+        file.write(',\n'.join(json.dumps({'name': name, 'address': address}, ensure_ascii=False)
+                              for name, address in places))
+        file.write('\n]\n')
+    return csv_path, json_path
+
+
+async def reset(path: Path) -> None:
+    # Чистая база и пустые кэши перед каждым шагом
+    await database.db.close()
+    for suffix in ('', '-wal', '-shm'):
+        Path(f'{path}{suffix}').unlink(missing_ok=True)
+    database.db.path = str(path)
+    await database.db.open()
+    await database.migrate_db()
+    await database.load_places()
+
+
+async def measure(label: str, rows: int, coroutine, trace: bool = False) -> None:
+    if trace:
+        tracemalloc.start()
+    started = time.perf_counter()
+    await coroutine
+    elapsed = time.perf_counter() - started
+    line = f'  {label:40} {elapsed:7.2f} с  {rows / elapsed:9.0f} строк/с'
+    if trace:
+        line += f'  пик памяти {tracemalloc.get_traced_memory()[1] / 2 ** 20:6.1f} МБ'
+        tracemalloc.stop()
+    print(line)
+
+
+async def parse_only(path: Path) -> None:
+    for _ in read_places(path, path.name):
+        pass
+
+
+async def add_one_by_one(path: Path, limit: int) -> None:
+    with open(path, newline='', encoding='utf-8') as file:
+        reader = csv.reader(file)
+        next(reader)
+        for _, (name, address) in zip(range(limit), reader):
+            await database.add_place(name, address)
+
+
+async def run(size: int, single: int) -> None:
+    with tempfile.TemporaryDirectory() as directory:
+        directory = Path(directory)
+        csv_path, json_path = write_files(directory, size)
+        db_path = directory / 'bench.db'
+        print(f'{size} мест: CSV {csv_path.stat().st_size / 2 ** 20:.1f} МБ, '
+              f'JSON {json_path.stat().st_size / 2 ** 20:.1f} МБ')
+
+        await measure('разбор CSV', size, parse_only(csv_path), trace=True)
+        await measure('разбор JSON', size, parse_only(json_path), trace=True)
+
+        await reset(db_path)
+        await measure(f'add_place, первые {single}', single, add_one_by_one(csv_path, single))
+
+        await reset(db_path)
+        await measure('import_places CSV', size, import_places(csv_path, csv_path.name))
+        await measure('import_places CSV повторно (обновление)', size, import_places(csv_path, csv_path.name))
+
+        await reset(db_path)
+        await measure('import_places JSON', size, import_places(json_path, json_path.name))
+
+        export_path = directory / 'export.csv'
+        await measure('export_places CSV', size, export_places(export_path), trace=True)
+        await database.db.close()
+
+
+def main() -> None:
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    single = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+    asyncio.run(run(size, single))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+# Бенчмарк поиска места по названию до и после миграций с индексами.
+# Запуск из корня репозитория: python -m benchmarks.bench_lookup [количество мест]
+
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from databases.migrations import MIGRATIONS, migration_script
+
+
+RATINGS_PER_PLACE = 3
+LOOKUPS = 2000
+
+
+def build_db(path: Path, places: int, versions: int) -> sqlite3.Connection:
+    # Создает базу, применяя только первые versions миграций, и наполняет ее данными
+    connection = sqlite3.connect(path, isolation_level=None)
+    for version, sql in MIGRATIONS[:versions]:
+        connection.executescript(migration_script(version, sql))
+
+    connection.execute('BEGIN')
+    connection.executemany('INSERT INTO places (name, address) VALUES (?, ?)',
+                           ((f'place {i}', f'address {i}') for i in range(places)))
+    connection.executemany('INSERT INTO ratings (name, rating) VALUES (?, ?)',
+                           ((f'place {i}', random.randint(1, 10))
+                            for i in range(places) for _ in range(RATINGS_PER_PLACE)))
+    connection.execute('COMMIT')
+    return connection
+
+
+def measure(connection: sqlite3.Connection, sql: str, names: list[str]) -> float:
+    # Среднее время одного запроса в микросекундах
+    started = time.perf_counter()
+    for name in names:
+        connection.execute(sql, (name,)).fetchone()
+    return (time.perf_counter() - started) / len(names) * 1e6
+
+
+def main() -> None:
+    places = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    names = [f'place {random.randrange(places)}' for _ in range(LOOKUPS)]
+    queries = {
+        'place by name': 'SELECT name, address, rating FROM places WHERE name = ?',
+        'avg rating': 'SELECT AVG(rating) FROM ratings WHERE name = ?',
+    }
+
+    with tempfile.TemporaryDirectory() as directory:
+        for label, versions in (('без индексов', 1), ('после миграций', len(MIGRATIONS))):
+            connection = build_db(Path(directory) / f'{versions}.db', places, versions)
+            # Без индексов запросы медленные, поэтому для них хватает меньшей выборки
+            sample = names if versions > 1 else names[:50]
+            for query_name, sql in queries.items():
+                print(f'{places} мест, {label:>15}: {query_name:<14} {measure(connection, sql, sample):10.1f} мкс/запрос')
+            connection.close()
+
+
+if __name__ == '__main__':
+    main()
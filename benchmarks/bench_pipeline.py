@@ -0,0 +1,143 @@
+# Бенчмарк очереди обработки обновлений (UpdatePipeline) на синтетической нагрузке без Telegram:
+# много чатов, в каждом несколько пользователей присылают пачку сообщений одновременно.
+# Несколько "медленных" чатов обрабатываются долго (как чат, упершийся в лимиты Telegram),
+# остальные быстро. Сравниваются три способа:
+#   - задача на каждое обновление без ограничений (aiogram по умолчанию при polling);
+#   - задачи с общим семафором (прежний вебхук);
+#   - UpdatePipeline: очереди по (чат, пользователь), общий пул обработчиков, лимит на чат.
+# Для каждого способа печатаются пропускная способность, задержки в быстрых и медленных чатах
+# (справедливость), пик одновременно обрабатываемых обновлений и число случаев, когда
+# два обновления одного пользователя обрабатывались одновременно (гонка за состояние диалога).
+# Отдельно проверяется объединение одинаковых команд (SingleFlight).
+# Запуск из корня репозитория: python -m benchmarks.bench_pipeline [чатов] [медленных чатов]
+
+import asyncio
+import random
+import statistics
+import sys
+import time
+from collections import defaultdict
+
+from aiogram import types
+
+from benchmarks.fake_bot_api import message_update
+from services.pipeline import SingleFlight, UpdatePipeline, update_key
+
+
+USERS_PER_CHAT = 5
+MESSAGES_PER_USER = 10
+FAST_WORK = 0.002    # обработка обновления в обычном чате, с
+SLOW_WORK = 0.1      # в медленном чате
+WORKERS = 64
+
+
+class FakeDispatcher:
+    # Вместо aiogram: обработчик только ждет (как ожидание базы и Telegram) и собирает статистику
+    def __init__(self, slow_chats: set[int]) -> None:
+        self.updates_handler = self
+        self.slow_chats = slow_chats
+        self.received: dict[int, float] = {}
+        self.latencies: dict[bool, list[float]] = defaultdict(list)
+        self.active: dict[tuple, int] = defaultdict(int)
+        self.in_flight = 0
+        self.peak = 0
+        self.overlaps = 0
+        self.rng = random.Random(1)
+
+    async def notify(self, update: types.Update) -> None:
+        key = update_key(update)
+        if self.active[key]:
+            self.overlaps += 1
+        self.active[key] += 1
+        self.in_flight += 1
+        self.peak = max(self.peak, self.in_flight)
+        slow = key[0] in self.slow_chats
+        await asyncio.sleep((SLOW_WORK if slow else FAST_WORK) * self.rng.uniform(0.5, 1.5))
+        self.in_flight -= 1
+        self.active[key] -= 1
+        self.latencies[slow].append(time.perf_counter() - self.received[update.update_id])
+
+
+def make_updates(chats: int) -> list[types.Update]:
+    # Сообщения пользователей перемешаны между собой, но у каждого пользователя идут по порядку
+    rng = random.Random(42)
+    streams = [[(chat, user)] * MESSAGES_PER_USER for chat in range(1, chats + 1) for user in range(USERS_PER_CHAT)]
+    order = [stream[0] for stream in streams for _ in range(MESSAGES_PER_USER)]
+    rng.shuffle(order)
+    return [types.Update(**message_update(update_id, -chat, 1000 + user, 'текст'))
+            for update_id, (chat, user) in enumerate(order, 1)]
+
+
+async def unbounded(dp: FakeDispatcher, updates: list[types.Update]) -> None:
+    await asyncio.gather(*(dp.notify(update) for update in updates))
+
+
+async def semaphore(dp: FakeDispatcher, updates: list[types.Update]) -> None:
+    limit = asyncio.Semaphore(WORKERS)
+
+    async def process(update: types.Update) -> None:
+        async with limit:
+            await dp.notify(update)
+
+    await asyncio.gather(*(process(update) for update in updates))
+
+
+async def pipeline(dp: FakeDispatcher, updates: list[types.Update]) -> None:
+    queue = UpdatePipeline(dp, workers=WORKERS)
+    queue.start()
+    for update in updates:
+        await queue.submit(update)
+    await queue.stop()
+
+
+def percentile(values: list[float], q: int) -> float:
+    return statistics.quantiles(values, n=100, method='inclusive')[q - 1] * 1000 if len(values) > 1 else 0.0
+
+
+async def measure(label: str, run, chats: int, slow: int) -> None:
+    updates = make_updates(chats)
+    dp = FakeDispatcher({-chat for chat in range(1, slow + 1)})
+    started = time.perf_counter()
+    for update in updates:
+        dp.received[update.update_id] = started
+    await run(dp, updates)
+    elapsed = time.perf_counter() - started
+    fast, slow_latencies = dp.latencies[False], dp.latencies[True]
+    print(f'  {label:22} {len(updates) / elapsed:7.0f} обн/с  '
+          f'быстрые чаты p50 {percentile(fast, 50):7.0f} p95 {percentile(fast, 95):7.0f} мс  '
+          f'медленные p50 {percentile(slow_latencies, 50):7.0f} p95 {percentile(slow_latencies, 95):7.0f} мс  '
+          f'пик {dp.peak:5}  гонок {dp.overlaps}')
+
+
+async def coalescing() -> None:
+    # Десять пользователей чата одновременно отправляют /place: список отправляется один раз
+    flight = SingleFlight(window=1.0)
+    renders = 0
+
+    async def render(chat_id: int) -> None:
+        nonlocal renders
+        renders += 1
+        await asyncio.sleep(0.02)
+
+    await asyncio.gather(*(flight.run(('place', chat), render, chat) for chat in range(100) for _ in range(10)))
+    print(f'  SingleFlight: 1000 команд /place в 100 чатах - {renders} отправок списка, '
+          f'{flight.coalesced} объединено')
+
+
+async def run(chats: int, slow: int) -> None:
+    print(f'{chats} чатов ({slow} медленных), по {USERS_PER_CHAT} пользователей и {MESSAGES_PER_USER} сообщений, '
+          f'{WORKERS} обработчиков')
+    await measure('задача на обновление', unbounded, chats, slow)
+    await measure('семафор', semaphore, chats, slow)
+    await measure('UpdatePipeline', pipeline, chats, slow)
+    await coalescing()
+
+
+def main() -> None:
+    chats = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    slow = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    asyncio.run(run(chats, slow))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+# Бенчмарк выбора мест для опроса: SELECT ... ORDER BY RANDOM() LIMIT 7 в SQLite
+# против RandomPlacePicker.sample_for_poll (взвешенный выбор методом отбора)
+# и reservoir_for_poll (взвешенный резервуар за один проход).
+# Заодно проверяется, что места из последних опросов чата не повторяются
+# и что места с высоким рейтингом предлагаются чаще.
+# Запуск из корня репозитория: python -m benchmarks.bench_poll_sampling [количество мест ...]
+
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from collections import Counter
+from pathlib import Path
+
+from benchmarks.bench_random import build_db
+from databases.sampler import RandomPlacePicker
+
+
+OPTIONS = 7
+POLLS = 200
+
+
+def order_by_random(connection: sqlite3.Connection, polls: int) -> None:
+    # Прежний способ: случайный ключ каждой строке и сортировка всей таблицы
+    for _ in range(polls):
+        connection.execute(f'SELECT name, address, rating FROM places ORDER BY RANDOM() LIMIT {OPTIONS}').fetchall()
+
+
+def picker_polls(connection: sqlite3.Connection, picker: RandomPlacePicker, sample, polls: int) -> None:
+    for poll in range(polls):
+        chat_id = poll % 10
+        rowids = sample(chat_id, OPTIONS)
+        for rowid in rowids:
+            connection.execute('SELECT name, address, rating FROM places WHERE rowid = ?', (rowid,)).fetchone()
+        picker.record_poll(chat_id, rowids)
+
+
+def measure(polls: int, func, *args) -> float:
+    # Время выбора мест для одного опроса в микросекундах
+    started = time.perf_counter()
+    func(*args, polls)
+    return (time.perf_counter() - started) / polls * 1e6
+
+
+def check_distribution(connection: sqlite3.Connection) -> None:
+    # Много опросов одного чата: нет повторов из прошлого опроса, частота растет с рейтингом
+    picker = RandomPlacePicker(poll_exclude=1, rng=random.Random(7))
+    picker.load(connection.execute('SELECT rowid, rating FROM places'))
+    ratings = dict(connection.execute('SELECT rowid, rating FROM places'))
+
+    offered, previous, repeats = Counter(), set(), 0
+    for _ in range(2000):
+        rowids = picker.sample_for_poll(0, OPTIONS)
+        repeats += len(previous & set(rowids))
+        offered.update(rowids)
+        picker.record_poll(0, rowids)
+        previous = set(rowids)
+
+    by_rating = Counter()
+    places_by_rating = Counter(int(rating) for rating in ratings.values())
+    for rowid, count in offered.items():
+        by_rating[int(ratings[rowid])] += count
+    frequencies = ', '.join(f'{rating}: {by_rating[rating] / places_by_rating[rating]:.2f}'
+                            for rating in sorted(places_by_rating))
+    print(f'  повторов из прошлого опроса: {repeats}; предложений на место по рейтингу: {frequencies}')
+
+
+def main() -> None:
+    sizes = [int(arg) for arg in sys.argv[1:]] or [1_000, 100_000]
+
+    with tempfile.TemporaryDirectory() as directory:
+        for places in sizes:
+            random.seed(42)
+            connection = build_db(Path(directory) / f'{places}.db', places)
+
+            picker = RandomPlacePicker(poll_exclude=1, rng=random.Random(42))
+            picker.load(connection.execute('SELECT rowid, rating FROM places'))
+            results = {
+                'ORDER BY RANDOM() LIMIT 7': measure(POLLS, order_by_random, connection),
+                'sample_for_poll': measure(POLLS, picker_polls, connection, picker, picker.sample_for_poll),
+                'reservoir_for_poll': measure(POLLS, picker_polls, connection, picker, picker.reservoir_for_poll),
+            }
+            print(f'{places} мест, {POLLS} опросов по {OPTIONS} мест')
+            for label, micros in results.items():
+                print(f'  {label:<26} {micros:12.1f} мкс на опрос')
+            if places <= 10_000:
+                check_distribution(connection)
+            connection.close()
+
+
+if __name__ == '__main__':
+    main()
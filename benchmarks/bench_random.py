@@ -0,0 +1,81 @@
+# Бенчмарк выбора случайного места: чтение всей таблицы и random.choice
+# против RandomPlacePicker с выборкой одной строки по rowid.
+# Запуск из корня репозитория: python -m benchmarks.bench_random [количество мест ...]
+
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+from databases.migrations import MIGRATIONS, migration_script
+from databases.sampler import RandomPlacePicker
+
+
+PICKS = 200
+
+
+def build_db(path: Path, places: int) -> sqlite3.Connection:
+    connection = sqlite3.connect(path, isolation_level=None)
+    for version, sql in MIGRATIONS:
+        connection.executescript(migration_script(version, sql))
+
+    connection.execute('BEGIN')
+    connection.executemany('INSERT INTO places (name, address, rating) VALUES (?, ?, ?)',
+                           ((f'place {i}', f'address {i}', random.randint(0, 10)) for i in range(places)))
+    connection.execute('COMMIT')
+    return connection
+
+
+def fetchall_choice(connection: sqlite3.Connection, picks: int) -> None:
+    # Текущий путь: SELECT всей таблицы и random.choice
+    for _ in range(picks):
+        random.choice(connection.execute('SELECT name, address, rating FROM places').fetchall())
+
+
+def picker_choice(connection: sqlite3.Connection, picker: RandomPlacePicker, weighted: bool, picks: int) -> None:
+    for chat_id in range(picks):
+        rowid = picker.pick_for_chat(chat_id % 10, weighted=weighted)
+        connection.execute('SELECT name, address, rating FROM places WHERE rowid = ?', (rowid,)).fetchone()
+
+
+def measure(picks: int, func, *args) -> tuple[float, float]:
+    # Время одного выбора в микросекундах и пик выделенной памяти в мегабайтах
+    tracemalloc.start()
+    started = time.perf_counter()
+    func(*args, picks)
+    elapsed = time.perf_counter() - started
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed / picks * 1e6, peak / 2 ** 20
+
+
+def main() -> None:
+    sizes = [int(arg) for arg in sys.argv[1:]] or [10_000, 1_000_000]
+
+    with tempfile.TemporaryDirectory() as directory:
+        for places in sizes:
+            connection = build_db(Path(directory) / f'{places}.db', places)
+
+            started = time.perf_counter()
+            picker = RandomPlacePicker()
+            picker.load(connection.execute('SELECT rowid, rating FROM places'))
+            load_ms = (time.perf_counter() - started) * 1e3
+
+            # Полная выборка на миллионе строк медленная, поэтому для нее хватает меньшего числа повторов
+            slow_picks = max(1, PICKS * 10_000 // places)
+            results = {
+                'fetchall + random.choice': measure(slow_picks, fetchall_choice, connection),
+                'picker': measure(PICKS, picker_choice, connection, picker, False),
+                'picker, weighted': measure(PICKS, picker_choice, connection, picker, True),
+            }
+            print(f'{places} мест: загрузка picker {load_ms:.0f} мс')
+            for label, (micros, megabytes) in results.items():
+                print(f'  {label:<26} {micros:12.1f} мкс/выбор, пик памяти {megabytes:8.2f} МБ')
+            connection.close()
+
+
+if __name__ == '__main__':
+    main()
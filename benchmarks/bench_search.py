@@ -0,0 +1,70 @@
+# Бенчмарк поиска мест: точный поиск по названию против PlaceSearchIndex
+# (подсказки при опечатке и автодополнение для inline-режима) на синтетическом каталоге.
+# Запуск из корня репозитория: python -m benchmarks.bench_search [количество мест] [количество запросов]
+
+import random
+import sys
+import time
+
+from databases.search import PlaceSearchIndex
+
+
+# Слоги вида согласная + гласная (+ согласная) дают названия, похожие на настоящие
+CONSONANTS = 'бвгджзклмнпрстфхцчш'
+VOWELS = 'аеиоуыэюя'
+SYLLABLES = [c + v for c in CONSONANTS for v in VOWELS] + [c + v + e for c in CONSONANTS for v in VOWELS for e in 'лмнрст']
+
+
+def make_name(rng: random.Random) -> str:
+    words = [''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))) for _ in range(rng.randint(1, 3))]
+    return ' '.join(words)
+
+
+def with_typo(name: str, rng: random.Random) -> str:
+    # Одна опечатка: замена, пропуск или лишняя буква
+    position = rng.randrange(len(name))
+    letter = rng.choice('абвгдежзиклмнопрстуфх')
+    kind = rng.randrange(3)
+    if kind == 0:
+        return name[:position] + letter + name[position + 1:]
+    if kind == 1:
+        return name[:position] + name[position + 1:]
+    return name[:position] + letter + name[position:]
+
+
+def measure(label: str, function, queries: list[str]) -> list:
+    started = time.perf_counter()
+    results = [function(query) for query in queries]
+    elapsed = time.perf_counter() - started
+    print(f'  {label:34} {elapsed / len(queries) * 1e6:9.1f} мкс на запрос')
+    return results
+
+
+def main() -> None:
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+    rng = random.Random(42)
+
+    names = list(dict.fromkeys(make_name(rng) for _ in range(size)))
+    rows = [(rowid, name, f'ул. {make_name(rng)}, {rng.randint(1, 200)}') for rowid, name in enumerate(names, 1)]
+
+    started = time.perf_counter()
+    index = PlaceSearchIndex()
+    index.load(rows)
+    print(f'{len(index)} мест, индекс построен за {time.perf_counter() - started:.1f} с, {count} запросов')
+
+    by_name = {name: rowid for rowid, name, _ in rows}
+    targets = rng.sample(names, count)
+    typos = [with_typo(name, rng) for name in targets]
+    prefixes = [name[:rng.randint(2, max(2, len(name) - 1))] for name in targets]
+
+    measure('точный поиск (dict)', by_name.get, targets)
+    found = measure('поиск с опечаткой', lambda query: index.search(query, 3), typos)
+    measure('автодополнение по началу', lambda query: index.search(query, 10), prefixes)
+
+    recall = sum(any(hit.name == target for hit in hits) for target, hits in zip(targets, found)) / count
+    print(f'  нужное место среди 3 подсказок при опечатке: {recall:.1%}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+# Бенчмарк промежуточных итогов опросов: сколько запросов editMessageText уходит в Telegram,
+# пока в несколько чатов приходят тысячи голосов. Голоса поступают пачками, как их записывает
+# VoteAggregator (раз в flush_interval), часть голосов отзывается и отдается снова.
+# Сравнивается правка на каждый голос с StandingsBoard (не чаще раза в interval на чат,
+# без правки, если текст не изменился). Время сжато: interval и длительность голосования
+# в секундах бенчмарка соответствуют минутам реального опроса.
+# Запуск из корня репозитория: python -m benchmarks.bench_standings [голосов] [чатов] [interval, с]
+
+import asyncio
+import random
+import sys
+import tempfile
+import time
+from collections import Counter
+from pathlib import Path
+from types import SimpleNamespace
+
+from benchmarks.bench_import import reset
+import databases.database as database
+import services.standings as standings_module
+from services.standings import StandingsBoard
+
+
+DURATION = 3.0        # сколько длится голосование, с
+FLUSH_INTERVAL = 0.05  # как часто VoteAggregator записывает голоса и вызывает apply, с
+TIME_OPTIONS = [f'Суббота | {hour}:00' for hour in (11, 12, 15, 16, 17)]
+PLACE_OPTIONS = [f'Место: место {number} | Рейтинг: 7.5' for number in range(7)]
+
+
+class FakeOutbound:
+    # Вместо OutboundDispatcher: считает запросы и запоминает последний текст каждого сообщения
+    def __init__(self) -> None:
+        self.calls = Counter()
+        self.edits_per_chat = Counter()
+        self.texts: dict[int, str] = {}
+        self._message_ids = iter(range(1, 10 ** 9))
+
+    async def send_message(self, chat_id: int, text: str, **kwargs) -> SimpleNamespace:
+        self.calls['sendMessage'] += 1
+        self.texts[chat_id] = text
+        return SimpleNamespace(message_id=next(self._message_ids))
+
+    async def edit_message_text(self, chat_id: int, message_id: int, text: str, **kwargs) -> None:
+        self.calls['editMessageText'] += 1
+        self.edits_per_chat[chat_id] += 1
+        self.texts[chat_id] = text
+
+    async def pin_chat_message(self, chat_id: int, message_id: int, **kwargs) -> bool:
+        self.calls['pinChatMessage'] += 1
+        return True
+
+    async def unpin_chat_message(self, chat_id: int, message_id: int, **kwargs) -> bool:
+        self.calls['unpinChatMessage'] += 1
+        return True
+
+
+def make_votes(count: int, chats: int, rng: random.Random) -> list[tuple[str, int, int]]:
+    # Голоса (poll_id, option_id, +1/-1): каждый десятый голос потом отзывается
+    votes = []
+    for _ in range(count):
+        chat_id = rng.randrange(chats)
+        kind, options = rng.choice((('t', TIME_OPTIONS), ('p', PLACE_OPTIONS)))
+        vote = (f'{chat_id}{kind}', rng.randrange(len(options)), 1)
+        votes.append(vote)
+        if rng.random() < 0.1:
+            votes.append((vote[0], vote[1], -1))
+    return votes
+
+
+async def run(count: int, chats: int, interval: float) -> None:
+    with tempfile.TemporaryDirectory() as directory:
+        await reset(Path(directory) / 'standings.db')
+        await vote(count, chats, interval)
+        await database.db.close()
+
+
+async def vote(count: int, chats: int, interval: float) -> None:
+    outbound = FakeOutbound()
+    board = StandingsBoard(outbound, interval=interval)
+    for chat_id in range(chats):
+        await board.open(chat_id, [(f'{chat_id}t', 'time', TIME_OPTIONS), (f'{chat_id}p', 'place', PLACE_OPTIONS)])
+
+    votes = make_votes(count, chats, random.Random(42))
+    batches = max(1, int(DURATION / FLUSH_INTERVAL))
+    size = -(-len(votes) // batches)
+    tallies = Counter()
+    started = time.perf_counter()
+    for batch in range(batches):
+        deltas = Counter()
+        for poll_id, option_id, delta in votes[batch * size:(batch + 1) * size]:
+            deltas[poll_id, option_id] += delta
+        tallies.update(deltas)
+        board.apply(deltas)
+        await asyncio.sleep(max(0.0, started + (batch + 1) * FLUSH_INTERVAL - time.perf_counter()))
+    elapsed = time.perf_counter() - started
+
+    for chat_id in range(chats):
+        await board.close(chat_id)
+    await board.stop()
+
+    # Окончательный текст каждого сообщения должен совпадать с итогами по всем голосам
+    expected = {chat_id: standings_module.render_standings(
+        [(f'{chat_id}t', 'time', TIME_OPTIONS), (f'{chat_id}p', 'place', PLACE_OPTIONS)],
+        {poll_id: Counter({option_id: tallies[poll_id, option_id] for option_id in range(len(options))})
+         for poll_id, options in ((f'{chat_id}t', TIME_OPTIONS), (f'{chat_id}p', PLACE_OPTIONS))})
+        for chat_id in range(chats)}
+    wrong = sum(outbound.texts[chat_id] != text for chat_id, text in expected.items())
+
+    limit = chats * (int(elapsed / interval) + 2)
+    print(f'{len(votes)} голосов (с отзывами) в {chats} чатах за {elapsed:.1f} с, interval {interval} с')
+    print(f'  правка на каждый голос:   {len(votes):6} editMessageText')
+    print(f'  StandingsBoard:           {outbound.calls["editMessageText"]:6} editMessageText '
+          f'(предел {limit}, больше всего в одном чате {max(outbound.edits_per_chat.values(), default=0)}), '
+          f'объединено {board.coalesced}, без изменений {board.skipped}')
+    print(f'  окончательный текст не совпал с итогами в {wrong} чатах из {chats}')
+
+
+def main() -> None:
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    chats = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    interval = float(sys.argv[3]) if len(sys.argv) > 3 else 0.25
+    asyncio.run(run(count, chats, interval))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+# Бенчмарк статистики опросов: /stats из накопительных таблиц (get_poll_stats) против подсчета
+# тех же побед и голосов по архиву опросов (json_each по результатам каждого опроса).
+# Каждую "неделю" в каждом чате подводятся два опроса (время и место) через archive_polls,
+# после нескольких размеров истории измеряется время одного /stats обоими способами
+# и среднее время подведения итогов одного чата (архивация вместе с обновлением статистики).
+# Запуск из корня репозитория: python -m benchmarks.bench_stats [чатов] [недель]
+
+import asyncio
+import json
+import random
+import sys
+import tempfile
+import time
+from collections import Counter
+from pathlib import Path
+
+from benchmarks.bench_import import reset
+import databases.database as database
+from services.polls import POLL_PLACE, POLL_TIME, archive_polls, place_option
+
+
+VOTERS = 20
+QUERIES = 200
+SLOTS = ['Суббота | 11:00', 'Суббота | 12:00', 'Суббота | 15:00', 'Воскресенье | 11:00', 'Воскресенье | 12:00']
+PLACES = [f'место {number}' for number in range(300)]
+
+# Победы и голоса мест одного чата, посчитанные по архиву
+SCAN_PLACE_WINS = '''
+    SELECT json_extract(option.value, '$[0]') AS text, COUNT(*) AS offered,
+           SUM(EXISTS (SELECT 1 FROM json_each(archive.winners) AS winner WHERE winner.value = option.key)) AS wins,
+           SUM(json_extract(option.value, '$[1]')) AS votes
+    FROM poll_archive AS archive, json_each(archive.results) AS option
+    WHERE archive.chat_id = ? AND archive.kind = 'place'
+    GROUP BY text ORDER BY wins DESC, votes DESC LIMIT 5
+'''
+
+
+async def poll_round(chat_id: int, week: int, rng: random.Random, started: float) -> None:
+    # Опросы одной недели с голосами VOTERS пользователей, затем подведение итогов
+    places = rng.sample(PLACES, 7)
+    polls = [(f'{chat_id}:{week}:t', chat_id, POLL_TIME, json.dumps(SLOTS), None),
+             (f'{chat_id}:{week}:p', chat_id, POLL_PLACE,
+              json.dumps([place_option(place, rng.randint(0, 10)) for place in places], ensure_ascii=False), None)]
+    await database.save_polls(polls)
+    answers, deltas = {}, Counter()
+    for user_id in range(VOTERS):
+        for poll_id, options in ((polls[0][0], len(SLOTS)), (polls[1][0], len(places))):
+            choice = tuple(sorted(rng.sample(range(options), rng.randint(1, 2))))
+            answers[poll_id, user_id] = choice
+            for option_id in choice:
+                deltas[poll_id, option_id] += 1
+    await database.save_poll_answers(answers, deltas)
+    await archive_polls(chat_id, started + week * 7 * 86400, retention_days=10 ** 6)
+
+
+async def timed(queries: int, function, *args) -> float:
+    started = time.perf_counter()
+    for _ in range(queries):
+        await function(*args)
+    return (time.perf_counter() - started) / queries * 1000
+
+
+async def run(chats: int, weeks: int) -> None:
+    rng = random.Random(42)
+    started = time.time() - weeks * 7 * 86400
+    print(f'{chats} чатов, по два опроса в неделю, {VOTERS} голосующих')
+    with tempfile.TemporaryDirectory() as directory:
+        await reset(Path(directory) / 'stats.db')
+        week = 0
+        for checkpoint in sorted({max(1, weeks // 100), max(1, weeks // 10), weeks}):
+            archive_started = time.perf_counter()
+            rounds = 0
+            while week < checkpoint:
+                for chat_id in range(chats):
+                    await poll_round(chat_id, week, rng, started)
+                    rounds += 1
+                week += 1
+            archived = (time.perf_counter() - archive_started) / rounds * 1000
+            polls = (await database.db.fetchone('SELECT COUNT(*) FROM poll_archive'))[0]
+            stats = await timed(QUERIES, database.get_poll_stats, 0, 5)
+            scan = await timed(max(1, QUERIES // 10), database.db.fetchall, SCAN_PLACE_WINS, (0,))
+            print(f'  {week:5} недель, {polls:6} опросов в архиве: /stats {stats:6.3f} мс, '
+                  f'подсчет по архиву {scan:8.2f} мс, подведение итогов чата {archived:5.2f} мс')
+        await database.db.close()
+
+
+def main() -> None:
+    chats = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    weeks = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+    asyncio.run(run(chats, weeks))
+
+
+if __name__ == '__main__':
+    main()
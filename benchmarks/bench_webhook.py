@@ -0,0 +1,133 @@
+# Бенчмарк получения обновлений: long polling против вебхука (стандартный WebhookRequestHandler
+# и FastWebhookRequestHandler из services/webhook.py) на поддельном Bot API.
+# Обработчик имитирует работу бота: ждет work секунд (база, другие запросы) и отвечает в чат.
+# Задержка - время от появления обновления в "Telegram" до получения ответа бота.
+# Запуск из корня репозитория: python -m benchmarks.bench_webhook [обновлений] [обновлений/с] [work, мс]
+
+import asyncio
+import statistics
+import sys
+import time
+
+from aiogram import Bot, Dispatcher, types
+from aiogram.bot.api import TelegramAPIServer
+from aiogram.dispatcher.webhook import BOT_DISPATCHER_KEY, WebhookRequestHandler
+from aiohttp import web
+
+from benchmarks.fake_bot_api import FakeBotAPI, message_update
+from services.pipeline import UpdatePipeline
+from services.webhook import FastWebhookRequestHandler, create_webhook_app
+
+
+TOKEN = '123456:bench'
+CHATS = 50
+
+
+def make_dispatcher(api: FakeBotAPI, work: float) -> Dispatcher:
+    bot = Bot(TOKEN, server=TelegramAPIServer.from_base(api.url))
+    dp = Dispatcher(bot)
+
+    @dp.message_handler()
+    async def echo(message: types.Message):
+        await asyncio.sleep(work)
+        await message.answer(message.text)
+
+    return dp
+
+
+async def replay(api: FakeBotAPI, updates: int, rate: float) -> list[float]:
+    # Отправляет обновления с заданной частотой и возвращает задержки ответов в секундах
+    pushed: dict[str, float] = {}
+    latencies: list[float] = []
+    done = asyncio.Event()
+
+    def on_call(method: str, params: dict, received: float) -> None:
+        if method == 'sendMessage' and params.get('text') in pushed:
+            latencies.append(received - pushed.pop(params['text']))
+            if len(latencies) == updates:
+                done.set()
+
+    api.listeners.append(on_call)
+    started = time.perf_counter()
+    for update_id in range(1, updates + 1):
+        # Обновления приходят равномерно: ждем момента, когда должно появиться очередное
+        delay = started + update_id / rate - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        text = f'message {update_id}'
+        pushed[text] = time.perf_counter()
+        api.push_update(message_update(update_id, -1000 - update_id % CHATS, update_id % 1000, text))
+
+    await asyncio.wait_for(done.wait(), 120)
+    api.listeners.remove(on_call)
+    return latencies
+
+
+async def run_polling(updates: int, rate: float, work: float) -> list[float]:
+    api = FakeBotAPI()
+    await api.start()
+    dp = make_dispatcher(api, work)
+    polling = asyncio.create_task(dp.start_polling())
+    try:
+        return await replay(api, updates, rate)
+    finally:
+        dp.stop_polling()
+        await polling
+        await (await dp.bot.get_session()).close()
+        await api.stop()
+
+
+async def run_webhook(updates: int, rate: float, work: float, handler) -> list[float]:
+    api = FakeBotAPI()
+    await api.start()
+    dp = make_dispatcher(api, work)
+
+    pipeline = UpdatePipeline(dp, workers=64)
+    if handler is FastWebhookRequestHandler:
+        app = create_webhook_app('secret', pipeline)
+    else:
+        app = web.Application()
+    app[BOT_DISPATCHER_KEY] = dp
+    app['_check_ip'] = False
+    app.router.add_route('*', '/webhook', handler)
+
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+
+    Bot.set_current(dp.bot)
+    Dispatcher.set_current(dp)
+    # Обработчики очереди берут текущие бот и диспетчер из контекста, как при запуске через executor
+    pipeline.start()
+    await dp.bot.set_webhook(f'http://127.0.0.1:{port}/webhook', secret_token='secret')
+    try:
+        return await replay(api, updates, rate)
+    finally:
+        await runner.cleanup()
+        await pipeline.stop()
+        await (await dp.bot.get_session()).close()
+        await api.stop()
+
+
+def report(name: str, latencies: list[float]) -> None:
+    latencies = sorted(latencies)
+    quantiles = statistics.quantiles(latencies, n=100)
+    print(f'  {name:34} p50 {quantiles[49] * 1000:8.1f} мс   p95 {quantiles[94] * 1000:8.1f} мс   '
+          f'p99 {quantiles[98] * 1000:8.1f} мс   max {latencies[-1] * 1000:8.1f} мс')
+
+
+async def main() -> None:
+    updates = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    rate = float(sys.argv[2]) if len(sys.argv) > 2 else 200
+    work = float(sys.argv[3]) / 1000 if len(sys.argv) > 3 else 0.1
+
+    print(f'{updates} обновлений, {rate:.0f} обновлений/с, обработка {work * 1000:.0f} мс')
+    report('long polling', await run_polling(updates, rate, work))
+    report('вебхук, WebhookRequestHandler', await run_webhook(updates, rate, work, WebhookRequestHandler))
+    report('вебхук, FastWebhookRequestHandler', await run_webhook(updates, rate, work, FastWebhookRequestHandler))
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,192 @@
+# Поддельный Telegram Bot API для бенчмарков: aiohttp-сервер, который отвечает на запросы бота
+# так же, как api.telegram.org, и отдает ему заранее подготовленные обновления - через getUpdates
+# (long polling) или POST-запросами на адрес вебхука, как это делает Telegram.
+# Бот направляется на него через Bot(token, server=TelegramAPIServer.from_base(api.url)).
+
+import asyncio
+import itertools
+import json
+import time
+from typing import Callable, Optional
+
+import aiohttp
+from aiohttp import web
+
+
+BOT_USER = {'id': 1, 'is_bot': True, 'first_name': 'Bench', 'username': 'bench_bot'}
+
+# Вызов метода: (имя метода, параметры запроса, время получения по time.perf_counter)
+CallListener = Callable[[str, dict, float], None]
+
+
+def message_update(update_id: int, chat_id: int, user_id: int, text: str) -> dict:
+    # Обновление с текстовым сообщением пользователя в групповом чате
+    return {
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id,
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'supergroup', 'title': 'bench'},
+            'from': {'id': user_id, 'is_bot': False, 'first_name': f'user{user_id}'},
+            'text': text,
+            'entities': [{'type': 'bot_command', 'offset': 0, 'length': len(text.split()[0])}]
+            if text.startswith('/') else [],
+        },
+    }
+
+
+def poll_answer_update(update_id: int, poll_id: str, user_id: int, option_ids: list[int]) -> dict:
+    return {
+        'update_id': update_id,
+        'poll_answer': {
+            'poll_id': poll_id,
+            'user': {'id': user_id, 'is_bot': False, 'first_name': f'user{user_id}'},
+            'option_ids': option_ids,
+        },
+    }
+
+
+class FakeBotAPI:
+    # max_connections - сколько обновлений одновременно отправляется на вебхук
+    # (у Telegram по умолчанию 40, см. параметр max_connections в setWebhook).
+    # latency - искусственная задержка ответа на каждый запрос бота
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, max_connections: int = 40,
+                 latency: float = 0.0) -> None:
+        self.host = host
+        self.port = port
+        self.max_connections = max_connections
+        self.latency = latency
+        self.calls: list[tuple[str, float]] = []
+        self.listeners: list[CallListener] = []
+        self._updates: list[dict] = []
+        self._updates_ready = asyncio.Event()
+        self._webhook_url: Optional[str] = None
+        self._secret_token: Optional[str] = None
+        self._deliveries: asyncio.Queue = asyncio.Queue()
+        self._workers: list[asyncio.Task] = []
+        self._message_ids = itertools.count(1_000_000)
+        self._poll_ids = itertools.count(1)
+        self._runner: Optional[web.AppRunner] = None
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    @property
+    def url(self) -> str:
+        return f'http://{self.host}:{self.port}'
+
+    async def start(self) -> None:
+        app = web.Application()
+        app.router.add_route('*', '/bot{token}/{method}', self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+        self._session = aiohttp.ClientSession()
+
+    async def stop(self) -> None:
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        if self._session is not None:
+            await self._session.close()
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+    def push_update(self, update: dict) -> None:
+        # Новое обновление: уходит на вебхук, если он установлен, иначе ждет getUpdates
+        if self._webhook_url is not None:
+            self._deliveries.put_nowait(update)
+        else:
+            self._updates.append(update)
+            self._updates_ready.set()
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        received = time.perf_counter()
+        method = request.match_info['method']
+        if request.content_type == 'application/json':
+            params = await request.json()
+        else:
+            params = dict(await request.post())
+
+        self.calls.append((method, received))
+        for listener in self.listeners:
+            listener(method, params, received)
+
+        if method == 'getUpdates':
+            result = await self._get_updates(params)
+        else:
+            if self.latency:
+                await asyncio.sleep(self.latency)
+            result = self._respond(method, params)
+        return web.json_response({'ok': True, 'result': result})
+
+    async def _get_updates(self, params: dict) -> list[dict]:
+        offset = int(params.get('offset') or 0)
+        limit = int(params.get('limit') or 100)
+        timeout = float(params.get('timeout') or 0)
+
+        self._updates = [update for update in self._updates if update['update_id'] >= offset]
+        if not self._updates and timeout:
+            self._updates_ready.clear()
+            try:
+                await asyncio.wait_for(self._updates_ready.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        return self._updates[:limit]
+
+    def _respond(self, method: str, params: dict):
+        if method == 'getMe':
+            return BOT_USER
+        if method == 'setWebhook':
+            self._webhook_url = params['url']
+            self._secret_token = params.get('secret_token')
+            self._workers = [asyncio.create_task(self._deliver()) for _ in range(self.max_connections)]
+            return True
+        if method == 'deleteWebhook':
+            self._webhook_url = None
+            return True
+        if method in ('sendMessage', 'editMessageText', 'sendPoll'):
+            chat_id = int(params.get('chat_id', 0))
+            message = {
+                'message_id': next(self._message_ids),
+                'date': int(time.time()),
+                'chat': {'id': chat_id, 'type': 'supergroup', 'title': 'bench'},
+                'from': BOT_USER,
+                'text': params.get('text', ''),
+            }
+            if method == 'sendPoll':
+                options = params['options']
+                message['poll'] = {
+                    'id': str(next(self._poll_ids)),
+                    'question': params['question'],
+                    'options': [{'text': text, 'voter_count': 0}
+                                for text in (json.loads(options) if isinstance(options, str) else options)],
+                    'total_voter_count': 0,
+                    'is_closed': False,
+                    'is_anonymous': False,
+                    'type': 'regular',
+                    'allows_multiple_answers': True,
+                }
+            return message
+        if method == 'stopPoll':
+            return {'id': '0', 'question': '', 'options': [], 'total_voter_count': 0, 'is_closed': True,
+                    'is_anonymous': False, 'type': 'regular', 'allows_multiple_answers': True}
+        if method == 'getChatAdministrators':
+            return [{'user': {'id': 1, 'is_bot': False, 'first_name': 'admin'}, 'status': 'creator'}]
+        if method == 'getChatMember':
+            return {'user': {'id': int(params['user_id']), 'is_bot': False, 'first_name': 'member'},
+                    'status': 'member'}
+        # deleteMessage, deleteMessages, answerCallbackQuery и прочие методы, возвращающие True
+        return True
+
+    async def _deliver(self) -> None:
+        # Как Telegram: каждое соединение отправляет следующее обновление,
+        # только когда бот ответил на предыдущее
+        headers = {'X-Telegram-Bot-Api-Secret-Token': self._secret_token} if self._secret_token else {}
+        while True:
+            update = await self._deliveries.get()
+            async with self._session.post(self._webhook_url, data=json.dumps(update), headers={
+                    **headers, 'Content-Type': 'application/json'}) as response:
+                await response.read()
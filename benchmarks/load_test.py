@@ -0,0 +1,282 @@
+# Нагрузочный тест бота: настоящий dp из main.py обрабатывает синтетические потоки обновлений,
+# а запросы бота уходят на поддельный Bot API (benchmarks/fake_bot_api.py) на localhost.
+# Сценарии: всплески /place и /random, полные диалоги /add и /rating, опросы и тысячи ответов на них.
+# Для каждого шага сценария считаются задержки обработки обновления (p50/p95/p99),
+# пропускная способность, время работы с базой и рост памяти. Результат сохраняется в JSON,
+# чтобы сравнивать коммиты между собой:
+#   python -m benchmarks.load_test --output before.json
+#   python -m benchmarks.load_test --output after.json --baseline before.json
+# По умолчанию лимиты Telegram в OutboundDispatcher сняты, чтобы измерять сам бот;
+# --telegram-limits оставляет их как в работе.
+
+import argparse
+import asyncio
+import gc
+import json
+import os
+import platform
+import statistics
+import subprocess
+import tempfile
+import time
+from collections import defaultdict
+from contextlib import asynccontextmanager
+from pathlib import Path
+
+from aiogram import Bot, Dispatcher, types
+from aiogram.bot.api import TelegramAPIServer
+
+from benchmarks.fake_bot_api import FakeBotAPI, message_update, poll_answer_update
+from services.fanout import fan_out
+
+
+BENCH_CHAT_BASE = -1_000_000_000
+
+# main.py читает конфиг при импорте: чаты теста разрешены для /add и получают опросы
+os.environ.update({'BOT_TOKEN': '123456:load-test', 'ADMIN_IDS': '1'})
+for name in ('DATABASE', 'DB_HOST', 'DB_USER', 'DB_PASSWORD'):
+    os.environ.setdefault(name, 'unused')
+
+
+class Recorder:
+    # Задержки обработки обновлений по шагам сценариев и время работы с базой
+
+    def __init__(self) -> None:
+        self.latencies: dict[str, list[float]] = defaultdict(list)
+        self.db_time = 0.0
+        self.db_uses = 0
+
+    def instrument_pool(self, pool) -> None:
+        # Время, в течение которого обработчики держат соединение с базой
+        acquire = pool.acquire
+
+        @asynccontextmanager
+        async def timed_acquire():
+            async with acquire() as connection:
+                started = time.perf_counter()
+                try:
+                    yield connection
+                finally:
+                    self.db_time += time.perf_counter() - started
+                    self.db_uses += 1
+
+        pool.acquire = timed_acquire
+
+
+def rss_bytes() -> int:
+    # Текущий объем резидентной памяти процесса (Linux), иначе пиковый
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except OSError:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def percentiles(values: list[float]) -> dict[str, float]:
+    values = sorted(values)
+    if len(values) == 1:
+        values = values * 2
+    quantiles = statistics.quantiles(values, n=100, method='inclusive')
+    return {'count': len(values), 'p50_ms': quantiles[49] * 1000, 'p95_ms': quantiles[94] * 1000,
+            'p99_ms': quantiles[98] * 1000, 'max_ms': values[-1] * 1000}
+
+
+class LoadTest:
+    def __init__(self, main, recorder: Recorder, chats: list[int], users: int) -> None:
+        self.main = main
+        self.recorder = recorder
+        self.chats = chats
+        self.users = users
+        self._update_ids = iter(range(1, 10 ** 9))
+        # Обновления, отправленные в очередь обработки, и их завершение
+        self._waiting: dict[int, asyncio.Future] = {}
+        observer = main.pipeline.observer
+
+        def on_processed(update, waited: float, seconds: float) -> None:
+            if observer is not None:
+                observer(update, waited, seconds)
+            future = self._waiting.pop(update.update_id, None)
+            if future is not None:
+                future.set_result(None)
+
+        main.pipeline.observer = on_processed
+
+    async def feed(self, label: str, update: dict) -> None:
+        # Обновление проходит через очередь обработки бота (UpdatePipeline), как при polling и вебхуке.
+        # Задержка - от постановки в очередь до конца обработки
+        started = time.perf_counter()
+        done = self._waiting[update['update_id']] = asyncio.get_running_loop().create_future()
+        if not await self.main.pipeline.submit(types.Update(**update)):
+            del self._waiting[update['update_id']]
+            return
+        await done
+        self.recorder.latencies[label].append(time.perf_counter() - started)
+
+    async def say(self, label: str, chat_id: int, user_id: int, text: str) -> None:
+        await self.feed(label, message_update(next(self._update_ids), chat_id, user_id, text))
+
+    def chat_of(self, user: int) -> int:
+        return self.chats[user % len(self.chats)]
+
+    async def burst(self, label: str, command: str) -> None:
+        # Все пользователи одновременно отправляют команду
+        await asyncio.gather(*(self.say(label, self.chat_of(user), 1000 + user, command)
+                               for user in range(self.users)))
+
+    async def add_dialogues(self) -> None:
+        async def dialogue(user: int) -> None:
+            chat_id, user_id = self.chat_of(user), 1000 + user
+            await self.say('/add', chat_id, user_id, '/add')
+            await self.say('/add: название', chat_id, user_id, f'место {user}')
+            await self.say('/add: адрес', chat_id, user_id, f'ул. Нагрузочная, {user}')
+
+        await asyncio.gather(*(dialogue(user) for user in range(self.users)))
+
+    async def rating_dialogues(self) -> None:
+        async def dialogue(user: int) -> None:
+            chat_id, user_id = self.chat_of(user), 1000 + user
+            await self.say('/rating', chat_id, user_id, '/rating')
+            await self.say('/rating: название', chat_id, user_id, f'место {(user * 7) % self.users}')
+            await self.say('/rating: оценка', chat_id, user_id, str(1 + user % 10))
+
+        await asyncio.gather(*(dialogue(user) for user in range(self.users)))
+
+    async def polls(self, answers: int) -> None:
+        started = time.perf_counter()
+        await self.run_job('send_poll')
+        self.recorder.latencies['send_poll'].append(time.perf_counter() - started)
+
+        polls = [row[0] for row in await self.main.db.fetchall('SELECT poll_id FROM poll_data')]
+        await asyncio.gather(*(
+            self.feed('poll_answer', poll_answer_update(next(self._update_ids), polls[index % len(polls)],
+                                                        1000 + index % (self.users * 10), [index % 5, 5]))
+            for index in range(answers)))
+
+        started = time.perf_counter()
+        await self.run_job('check_poll_results')
+        self.recorder.latencies['check_poll_results'].append(time.perf_counter() - started)
+
+    async def run_job(self, job: str) -> None:
+        # Задание по расписанию во всех чатах, как его выполняет JobScheduler._execute
+        scheduler = self.main.scheduler
+        errors = await fan_out(self.chats, scheduler.jobs[job], scheduler.concurrency, name=job)
+        failed = {chat_id: error for chat_id, error in errors.items() if error is not None}
+        if failed:
+            raise RuntimeError(f'{job} не выполнено в {len(failed)} чатах: {failed}')
+
+
+async def run(args: argparse.Namespace) -> dict:
+    chats = [BENCH_CHAT_BASE - index for index in range(args.chats)]
+    os.environ['ALLOWED_CHAT_ID'] = os.environ['TARGET_CHAT_IDS'] = ','.join(map(str, chats))
+
+    import main
+    from databases.database import catalog
+
+    api = FakeBotAPI(latency=args.api_latency / 1000)
+    await api.start()
+    main.bot.server = TelegramAPIServer.from_base(api.url)
+    if not args.telegram_limits:
+        main.outbound._global.rate = main.outbound._global.burst = 1e9
+        main.outbound.chat_rate = main.outbound.chat_burst = 1e9
+        main.outbound.group_rate = main.outbound.group_burst = 1e9
+
+    recorder = Recorder()
+    directory = tempfile.TemporaryDirectory()
+    main.db.path = str(Path(directory.name) / 'load_test.db')
+    recorder.instrument_pool(main.db)
+    # Как executor при запуске: обработчики берут текущие бот и диспетчер из контекста
+    Bot.set_current(main.bot)
+    Dispatcher.set_current(main.dp)
+    await main.on_startup(main.dp)
+
+    test = LoadTest(main, recorder, chats, args.users)
+    scenarios = [
+        ('/add', test.add_dialogues),
+        ('/place', lambda: test.burst('/place', '/place')),
+        ('/random', lambda: test.burst('/random', '/random')),
+        ('/rating', test.rating_dialogues),
+        ('polls', lambda: test.polls(args.poll_answers)),
+    ]
+
+    gc.collect()
+    memory_before = rss_bytes()
+    report = {'scenarios': {}}
+    started = time.perf_counter()
+    for name, scenario in scenarios:
+        updates_before = sum(map(len, recorder.latencies.values()))
+        db_before = recorder.db_time
+        scenario_started = time.perf_counter()
+        await scenario()
+        elapsed = time.perf_counter() - scenario_started
+        updates = sum(map(len, recorder.latencies.values())) - updates_before
+        report['scenarios'][name] = {'updates': updates, 'seconds': elapsed,
+                                     'updates_per_second': updates / elapsed,
+                                     'db_seconds': recorder.db_time - db_before}
+    total = time.perf_counter() - started
+
+    await main.on_shutdown(main.dp)
+    await (await main.bot.get_session()).close()
+    await api.stop()
+    directory.cleanup()
+    gc.collect()
+
+    report.update({
+        'commit': commit(),
+        'python': platform.python_version(),
+        'parameters': vars(args),
+        'handlers': {label: percentiles(values) for label, values in recorder.latencies.items()},
+        'total': {'updates': sum(map(len, recorder.latencies.values())), 'seconds': total,
+                  'db_seconds': recorder.db_time, 'db_uses': recorder.db_uses,
+                  'api_calls': len(api.calls)},
+        'memory': {'rss_before_mb': memory_before / 2 ** 20, 'rss_after_mb': rss_bytes() / 2 ** 20,
+                   'rss_growth_mb': (rss_bytes() - memory_before) / 2 ** 20},
+        'catalog': catalog.stats(),
+    })
+    return report
+
+
+def commit() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def print_report(report: dict, baseline: dict = None) -> None:
+    print(f"Коммит {report['commit']}, {report['total']['updates']} обновлений за "
+          f"{report['total']['seconds']:.1f} с, база {report['total']['db_seconds']:.2f} с, "
+          f"память +{report['memory']['rss_growth_mb']:.1f} МБ")
+    for name, scenario in report['scenarios'].items():
+        print(f"  {name:10} {scenario['updates']:6} обновлений  {scenario['updates_per_second']:8.0f} в секунду  "
+              f"база {scenario['db_seconds']:.2f} с")
+    for label, stats in report['handlers'].items():
+        line = (f"  {label:20} p50 {stats['p50_ms']:8.2f}  p95 {stats['p95_ms']:8.2f}  "
+                f"p99 {stats['p99_ms']:8.2f}  max {stats['max_ms']:8.2f} мс")
+        previous = (baseline or {}).get('handlers', {}).get(label)
+        if previous:
+            line += f"   p95 {(stats['p95_ms'] / previous['p95_ms'] - 1) * 100:+6.1f}% к {baseline['commit']}"
+        print(line)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Нагрузочный тест бота на поддельном Bot API')
+    parser.add_argument('--users', type=int, default=300, help='пользователей в каждом сценарии')
+    parser.add_argument('--chats', type=int, default=30, help='чатов, между которыми распределены пользователи')
+    parser.add_argument('--poll-answers', type=int, default=5000, help='ответов на опросы')
+    parser.add_argument('--api-latency', type=float, default=0, help='задержка ответа Bot API, мс')
+    parser.add_argument('--telegram-limits', action='store_true', help='не снимать лимиты частоты запросов')
+    parser.add_argument('--output', help='куда сохранить результат в JSON')
+    parser.add_argument('--baseline', help='JSON прошлого запуска для сравнения')
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    baseline = json.loads(Path(args.baseline).read_text()) if args.baseline else None
+    print_report(report, baseline)
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -18,10 +18,53 @@ class TgBot:
     target_chat_ids: list[int]  # Список разрешенных чатов для опроса
 
 
+@dataclass
+class WebhookConfig:
+    enabled: bool         # True - получать обновления через вебхук, False - через long polling
+    base_url: str         # Публичный адрес сервера бота (https://example.com)
+    path: str             # Путь, по которому Telegram присылает обновления
+    host: str             # Адрес, на котором слушает aiohttp-сервер
+    port: int             # Порт aiohttp-сервера
+    secret_token: str     # Секрет для заголовка X-Telegram-Bot-Api-Secret-Token
+
+    @property
+    def url(self) -> str:
+        return self.base_url.rstrip('/') + self.path
+
+
+@dataclass
+class PipelineConfig:
+    workers: int          # Сколько обновлений обрабатывается одновременно
+    chat_concurrency: int  # Сколько из них может относиться к одному чату
+    queue_size: int       # Сколько обновлений одного пользователя в чате может ждать обработки
+    max_pending: int      # Сколько обновлений всего может ждать обработки, дальше новые не принимаются
+
+
+@dataclass
+class MetricsConfig:
+    enabled: bool         # Отдавать метрики в формате Prometheus по адресу http://host:port/metrics
+    host: str             # Адрес сервера метрик (по умолчанию только локальный)
+    port: int             # Порт сервера метрик
+    slow_update_ms: int   # Обновления дольше этого порога профилируются (0 - профилировщик выключен)
+
+
+@dataclass
+class ScheduleConfig:
+    poll_cron: str        # Когда рассылать опросы (crontab: минута час день месяц день_недели)
+    results_cron: str     # Когда подводить итоги опросов
+    chat_schedules: dict[int, dict[str, str]]  # Расписания отдельных чатов: {chat_id: {"send_poll": crontab, ...}}
+    misfire_grace: int    # Насколько (в секундах) пропущенный из-за остановки бота запуск можно выполнить позже
+    timezone: str         # Часовой пояс расписаний (пусто - часовой пояс сервера)
+
+
 @dataclass
 class Config:
     tg_bot: TgBot
     db: DatabaseConfig
+    webhook: WebhookConfig
+    pipeline: PipelineConfig
+    metrics: MetricsConfig
+    schedule: ScheduleConfig
 
 
 def load_config(path: str = None) -> Config:
@@ -40,4 +83,28 @@ def load_config(path: str = None) -> Config:
                   db=DatabaseConfig(database=env('DATABASE'),
                                     db_host=env('DB_HOST'),
                                     db_user=env('DB_USER'),
-                                    db_password=env('DB_PASSWORD')))
+                                    db_password=env('DB_PASSWORD')),
+
+                  webhook=WebhookConfig(enabled=env.bool('WEBHOOK_ENABLED', False),
+                                        base_url=env('WEBHOOK_BASE_URL', ''),
+                                        path=env('WEBHOOK_PATH', '/webhook'),
+                                        host=env('WEBAPP_HOST', '0.0.0.0'),
+                                        port=env.int('WEBAPP_PORT', 8080),
+                                        secret_token=env('WEBHOOK_SECRET_TOKEN', '')),
+
+                  pipeline=PipelineConfig(workers=env.int('UPDATE_WORKERS', 64),
+                                          chat_concurrency=env.int('UPDATE_CHAT_CONCURRENCY', 8),
+                                          queue_size=env.int('UPDATE_QUEUE_SIZE', 100),
+                                          max_pending=env.int('UPDATE_MAX_PENDING', 10_000)),
+
+                  metrics=MetricsConfig(enabled=env.bool('METRICS_ENABLED', False),
+                                        host=env('METRICS_HOST', '127.0.0.1'),
+                                        port=env.int('METRICS_PORT', 9108),
+                                        slow_update_ms=env.int('SLOW_UPDATE_MS', 0)),
+
+                  schedule=ScheduleConfig(poll_cron=env('POLL_CRON', '0 12 * * mon'),
+                                          results_cron=env('RESULTS_CRON', '0 12 * * fri'),
+                                          chat_schedules={int(chat_id): jobs for chat_id, jobs
+                                                          in env.json('CHAT_SCHEDULES', {}).items()},
+                                          misfire_grace=env.int('MISFIRE_GRACE_SECONDS', 6 * 3600),
+                                          timezone=env('SCHEDULE_TIMEZONE', '')))
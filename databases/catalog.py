@@ -0,0 +1,107 @@
+from collections import OrderedDict
+from typing import Iterable, NamedTuple, Optional
+
+
+def normalize_name(name: str) -> str:
+    # Названия мест хранятся в нижнем регистре без пробелов по краям
+    return name.strip().lower()
+
+
+class PlaceRecord(NamedTuple):
+    # Компактная запись о месте. Порядок полей совпадает со строками
+    # SELECT name, address, rating, поэтому запись можно использовать вместо такой строки.
+    # rating - средняя оценка за все время, score - рейтинг с затуханием (см. databases/decay.py)
+    name: str
+    address: str
+    rating: float
+    rowid: int
+    score: float = 0.0
+
+
+class PlaceCatalog:
+    # Кэш каталога мест в памяти процесса, ключ - нормализованное название места.
+    # Загружается один раз при запуске и обновляется сразу после записи в базу
+    # (добавление, удаление и оценка места), поэтому команды чтения не обращаются к базе.
+    # Если задан max_size, хранятся только max_size последних использованных мест (LRU);
+    # после первого вытеснения кэш перестает быть полным и при промахе нужно идти в базу.
+
+    def __init__(self, max_size: Optional[int] = None) -> None:
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._places: OrderedDict[str, PlaceRecord] = OrderedDict()
+        self._names: dict[int, str] = {}
+        self._complete = False
+
+    def __len__(self) -> int:
+        return len(self._places)
+
+    @property
+    def is_complete(self) -> bool:
+        # True, если в кэше лежат все места из базы и отсутствие места в кэше означает его отсутствие в базе
+        return self._complete
+
+    def load(self, records: Iterable[PlaceRecord]) -> None:
+        self._places.clear()
+        self._names.clear()
+        self._complete = True
+        for record in records:
+            self.put(record)
+
+    def get(self, name: str) -> Optional[PlaceRecord]:
+        # Возвращает запись о месте или None
+        key = normalize_name(name)
+        record = self._places.get(key)
+        if record is not None:
+            self._places.move_to_end(key)
+        self._count(record)
+        return record
+
+    def get_by_rowid(self, rowid: int) -> Optional[PlaceRecord]:
+        name = self._names.get(rowid)
+        if name is None:
+            self._count(None)
+            return None
+        return self.get(name)
+
+    def _count(self, record: Optional[PlaceRecord]) -> None:
+        # Промах засчитывается только тогда, когда кэш не может ответить сам
+        # и вызывающему нужно обратиться к базе
+        if record is not None or self._complete:
+            self.hits += 1
+        else:
+            self.misses += 1
+
+    def put(self, record: PlaceRecord) -> None:
+        key = normalize_name(record.name)
+        previous = self._places.pop(key, None)
+        if previous is not None:
+            self._names.pop(previous.rowid, None)
+
+        self._places[key] = record
+        self._names[record.rowid] = key
+
+        if self.max_size is not None and len(self._places) > self.max_size:
+            _, evicted = self._places.popitem(last=False)
+            self._names.pop(evicted.rowid, None)
+            self._complete = False
+
+    def discard(self, name: str) -> None:
+        record = self._places.pop(normalize_name(name), None)
+        if record is not None:
+            self._names.pop(record.rowid, None)
+
+    def set_rating(self, name: str, rating: float, score: float) -> None:
+        key = normalize_name(name)
+        record = self._places.get(key)
+        if record is not None:
+            self._places[key] = record._replace(rating=rating, score=score)
+
+    def set_score(self, name: str, score: float) -> None:
+        key = normalize_name(name)
+        record = self._places.get(key)
+        if record is not None:
+            self._places[key] = record._replace(score=score)
+
+    def stats(self) -> dict[str, int]:
+        return {'size': len(self._places), 'hits': self.hits, 'misses': self.misses}
@@ -1,34 +1,610 @@
-import aiosqlite
-
-
-async def create_db():
-    async with aiosqlite.connect('places.db') as db:
-        cursor = await db.cursor()
-
-        await cursor.executescript('''
-            CREATE TABLE IF NOT EXISTS poll_data (
-                poll_id TEXT PRIMARY KEY,
-                options TEXT
-            );
-
-            CREATE TABLE IF NOT EXISTS poll_results (
-                poll_id TEXT,
-                option_id INTEGER,
-                votes INTEGER,
-                PRIMARY KEY (poll_id, option_id)
-            );
-
-            CREATE TABLE IF NOT EXISTS places (
-                name TEXT,
-                address TEXT,
-                rating INTEGER DEFAULT 0
-            );
-
-            CREATE TABLE IF NOT EXISTS ratings (
-                name TEXT,
-                rating INTEGER
-            );
-        ''')
-
-        await db.commit()
-        
+import json
+import time
+from typing import AsyncIterator, Callable, Iterable, Optional
+
+from databases.catalog import PlaceCatalog, PlaceRecord, normalize_name
+from databases.decay import RatingDecay
+from databases.geo import PlaceGeoIndex
+from databases.migrations import migrate
+from databases.pool import ConnectionPool
+from databases.sampler import RandomPlacePicker
+from databases.search import PlaceSearchIndex, SearchHit
+
+
+# Путь к файлу базы данных и общий для всего бота пул соединений.
+# Пул открывается в on_startup и закрывается в on_shutdown (см. main.py)
+DB_PATH = 'places.db'
+db = ConnectionPool(DB_PATH)
+
+# Индекс rowid мест для выбора случайного места без чтения всей таблицы.
+# Заполняется в load_places при запуске и обновляется при изменении мест.
+# Места из последних POLL_EXCLUDE_LAST опросов чата не предлагаются в нем снова
+POLL_EXCLUDE_LAST = 1
+picker = RandomPlacePicker(poll_exclude=POLL_EXCLUDE_LAST)
+
+# Кэш каталога мест: проверки существования места и выбор случайных мест
+# обслуживаются из памяти. None - без ограничения размера
+PLACE_CATALOG_MAX_SIZE: Optional[int] = None
+catalog = PlaceCatalog(max_size=PLACE_CATALOG_MAX_SIZE)
+
+# Нечеткий поиск мест по названию и адресу: подсказки при опечатке и inline-режим
+search_index = PlaceSearchIndex()
+
+# Координаты мест для поиска ближайших к геопозиции пользователя
+geo_index = PlaceGeoIndex()
+
+# Рейтинг с затуханием: оценка теряет половину веса за RATING_HALF_LIFE_DAYS дней,
+# а место без свежих оценок постепенно возвращается к RATING_PRIOR.
+# По нему взвешивается выбор мест для /random и опросов и сортируется список /place
+RATING_HALF_LIFE_DAYS = 180
+RATING_PRIOR = 5.0
+RATING_PRIOR_WEIGHT = 1.0
+rating_decay = RatingDecay(RATING_HALF_LIFE_DAYS * 86400, RATING_PRIOR, RATING_PRIOR_WEIGHT)
+
+
+async def migrate_db(default_chat_id: Optional[int] = None) -> int:
+    # Приводит схему базы данных к последней версии (вызывается один раз при запуске бота).
+    # Опросы, сохраненные до миграции 7, отправлялись в единственный чат: они относятся
+    # к default_chat_id (первому чату из TARGET_CHAT_IDS)
+    async with db.acquire() as connection:
+        version = await migrate(connection)
+    if default_chat_id is not None:
+        await db.execute(ASSIGN_POLLS_CHAT, (default_chat_id,))
+    return version
+
+
+# Запросы вынесены в константы: текст запроса всегда один и тот же,
+# поэтому sqlite берет уже подготовленное выражение из кэша соединения
+SELECT_PLACE = 'SELECT name, address, rating, rowid, score FROM places WHERE name = ?'
+SELECT_PLACE_BY_ROWID = 'SELECT name, address, rating, rowid, score FROM places WHERE rowid = ?'
+SELECT_CATALOG = 'SELECT name, address, rating, rowid, score FROM places'
+
+# Постраничный вывод мест по ключу (keyset pagination): следующая страница начинается
+# сразу после последнего места предыдущей, поэтому sqlite читает по индексу только
+# строки одной страницы, а не пропускает все предыдущие, как при OFFSET.
+# Граничное место передается по rowid, чтобы ключ помещался в callback_data кнопки
+PLACES_PAGE_QUERIES = {
+    ('name', 'first'): 'SELECT rowid, name, address, rating, score FROM places ORDER BY name LIMIT ?',
+    ('name', 'next'): 'SELECT rowid, name, address, rating, score FROM places '
+                      'WHERE name > (SELECT name FROM places WHERE rowid = ?) ORDER BY name LIMIT ?',
+    ('name', 'prev'): 'SELECT rowid, name, address, rating, score FROM places '
+                      'WHERE name < (SELECT name FROM places WHERE rowid = ?) ORDER BY name DESC LIMIT ?',
+    ('rating', 'first'): 'SELECT rowid, name, address, rating, score FROM places '
+                         'ORDER BY rating DESC, name DESC LIMIT ?',
+    ('rating', 'next'): 'SELECT rowid, name, address, rating, score FROM places '
+                        'WHERE (rating, name) < (SELECT rating, name FROM places WHERE rowid = ?) '
+                        'ORDER BY rating DESC, name DESC LIMIT ?',
+    ('rating', 'prev'): 'SELECT rowid, name, address, rating, score FROM places '
+                        'WHERE (rating, name) > (SELECT rating, name FROM places WHERE rowid = ?) '
+                        'ORDER BY rating, name LIMIT ?',
+    ('score', 'first'): 'SELECT rowid, name, address, rating, score FROM places '
+                        'ORDER BY score DESC, name DESC LIMIT ?',
+    ('score', 'next'): 'SELECT rowid, name, address, rating, score FROM places '
+                       'WHERE (score, name) < (SELECT score, name FROM places WHERE rowid = ?) '
+                       'ORDER BY score DESC, name DESC LIMIT ?',
+    ('score', 'prev'): 'SELECT rowid, name, address, rating, score FROM places '
+                       'WHERE (score, name) > (SELECT score, name FROM places WHERE rowid = ?) '
+                       'ORDER BY score, name LIMIT ?',
+}
+PLACES_PAGE_SIZE = 10
+
+INSERT_PLACE = 'INSERT INTO places (name, address, latitude, longitude, score) VALUES (?, ?, ?, ?, ?) ' \
+               'ON CONFLICT(name) DO NOTHING'
+SELECT_PLACE_LOCATIONS = 'SELECT rowid, latitude, longitude FROM places WHERE latitude IS NOT NULL'
+UPSERT_PLACE = 'INSERT INTO places (name, address, score) VALUES (?, ?, ?) ' \
+               'ON CONFLICT(name) DO UPDATE SET address = excluded.address'
+# Места по списку названий, переданному одним параметром в виде json-массива
+SELECT_PLACES_BY_NAMES = 'SELECT name, address, rating, rowid, score FROM places ' \
+                         'WHERE name IN (SELECT value FROM json_each(?))'
+SELECT_EXPORT = 'SELECT name, address, rating FROM places ORDER BY name'
+DELETE_PLACE = 'DELETE FROM places WHERE name = ? RETURNING rowid'
+DELETE_PLACE_RATINGS = 'DELETE FROM ratings WHERE name = ?'
+DELETE_PLACE_RATING_EVENTS = 'DELETE FROM rating_events WHERE name = ?'
+SELECT_USER_RATING = 'SELECT rating, rated_at FROM ratings WHERE name = ? AND user_id = ?'
+UPSERT_RATING = 'INSERT INTO ratings (name, user_id, rating, rated_at) VALUES (?, ?, ?, ?) ' \
+                'ON CONFLICT(name, user_id) DO UPDATE SET rating = excluded.rating, rated_at = excluded.rated_at'
+INSERT_RATING_EVENT = 'INSERT INTO rating_events (name, user_id, rating, rated_at) VALUES (?, ?, ?, ?)'
+# В правой части SET используются старые значения столбцов,
+# поэтому средний рейтинг и рейтинг с затуханием считаются от уже скорректированных сумм
+UPDATE_PLACE_RATING = 'UPDATE places SET rating_sum = rating_sum + :delta, rating_count = rating_count + :added, ' \
+                      'rating = (rating_sum + :delta) * 1.0 / (rating_count + :added), ' \
+                      'decay_sum = decay_sum + :decay_delta, decay_weight = decay_weight + :weight_delta, ' \
+                      'score = ((decay_sum + :decay_delta) * :factor + :prior_sum) ' \
+                      '/ ((decay_weight + :weight_delta) * :factor + :prior_weight) ' \
+                      'WHERE name = :name RETURNING rowid, rating, score'
+SELECT_RATING_LANDMARK = 'SELECT landmark FROM rating_decay'
+UPDATE_RATING_LANDMARK = 'UPDATE rating_decay SET landmark = ?'
+# Периодический проход затухания: score пересчитывается из сумм места, а перезаписываются
+# только места, у которых он заметно изменился (места без оценок и давно не менявшиеся не трогаются)
+DECAY_PLACE_SCORES = 'UPDATE places SET score = (decay_sum * :factor + :prior_sum) / (decay_weight * :factor + :prior_weight) ' \
+                     'WHERE abs((decay_sum * :factor + :prior_sum) / (decay_weight * :factor + :prior_weight) - score) ' \
+                     '> :epsilon RETURNING name, rowid, score'
+# Перенос точки отсчета: суммы всех оцененных мест умножаются на один и тот же множитель
+REBASE_PLACE_SCORES = 'UPDATE places SET decay_sum = decay_sum * :factor, decay_weight = decay_weight * :factor ' \
+                      'WHERE decay_weight > 0'
+UPSERT_POLL_VOTES = 'INSERT INTO poll_results (poll_id, option_id, votes) VALUES (?, ?, ?) ' \
+                    'ON CONFLICT(poll_id, option_id) DO UPDATE SET votes = votes + excluded.votes'
+# Выбор пользователей по списку ключей, переданному одним параметром в виде json-массива пар [poll_id, user_id]
+SELECT_POLL_ANSWERS = 'SELECT a.poll_id, a.user_id, a.option_ids FROM json_each(?) AS k ' \
+                      "JOIN poll_answers AS a ON a.poll_id = json_extract(k.value, '$[0]') " \
+                      "AND a.user_id = json_extract(k.value, '$[1]')"
+UPSERT_POLL_ANSWER = 'INSERT INTO poll_answers (poll_id, user_id, option_ids) VALUES (?, ?, ?) ' \
+                     'ON CONFLICT(poll_id, user_id) DO UPDATE SET option_ids = excluded.option_ids'
+DELETE_POLL_ANSWER = 'DELETE FROM poll_answers WHERE poll_id = ? AND user_id = ?'
+ASSIGN_POLLS_CHAT = 'UPDATE poll_data SET chat_id = ? WHERE chat_id IS NULL'
+INSERT_POLL = 'INSERT INTO poll_data (poll_id, chat_id, kind, options, message_id) VALUES (?, ?, ?, ?, ?)'
+# Какие из опросов (json-массив poll_id) уже подведены и перенесены в архив: голоса за них не сохраняются
+SELECT_CLOSED_POLLS = 'SELECT poll_id FROM poll_archive WHERE poll_id IN (SELECT value FROM json_each(?))'
+# Итоги опросов чата одним запросом: для каждого опроса возвращаются только варианты
+# с наибольшим числом голосов (при ничьей - несколько строк) и общее число голосов.
+# Опрос без голосов дает одну строку с option_id = NULL
+SELECT_CHAT_POLL_TALLIES = '''
+    SELECT poll_id, chat_id, kind, options, option_id, votes, total
+    FROM (
+        SELECT d.poll_id, d.chat_id, d.kind, d.options, r.option_id, r.votes,
+               SUM(r.votes) OVER (PARTITION BY d.poll_id) AS total,
+               MAX(r.votes) OVER (PARTITION BY d.poll_id) AS top
+        FROM poll_data AS d
+        LEFT JOIN poll_results AS r ON r.poll_id = d.poll_id AND r.votes > 0
+        WHERE d.chat_id = ?
+    )
+    WHERE option_id IS NULL OR votes = top
+    ORDER BY poll_id, option_id
+'''
+DELETE_CHAT_POLL_RESULTS = 'DELETE FROM poll_results WHERE poll_id IN (SELECT poll_id FROM poll_data WHERE chat_id = ?)'
+DELETE_CHAT_POLL_ANSWERS = 'DELETE FROM poll_answers WHERE poll_id IN (SELECT poll_id FROM poll_data WHERE chat_id = ?)'
+DELETE_CHAT_POLLS = 'DELETE FROM poll_data WHERE chat_id = ? RETURNING poll_id, message_id'
+# Голоса за все варианты опросов чата и число проголосовавших в каждом опросе (для архива)
+SELECT_CHAT_POLL_VOTES = '''
+    SELECT d.poll_id, d.kind, d.options, r.option_id, r.votes,
+           (SELECT COUNT(*) FROM poll_answers AS a WHERE a.poll_id = d.poll_id) AS voters
+    FROM poll_data AS d
+    LEFT JOIN poll_results AS r ON r.poll_id = d.poll_id AND r.votes > 0
+    WHERE d.chat_id = ?
+    ORDER BY d.poll_id, r.option_id
+'''
+INSERT_POLL_ARCHIVE = 'INSERT INTO poll_archive (poll_id, chat_id, kind, closed_at, results, winners, total_votes, voters) ' \
+                      'VALUES (?, ?, ?, ?, ?, ?, ?, ?) ON CONFLICT(poll_id) DO NOTHING'
+UPSERT_PLACE_WINS = 'INSERT INTO place_wins (chat_id, place, offered, wins, votes) VALUES (?, ?, ?, ?, ?) ' \
+                    'ON CONFLICT(chat_id, place) DO UPDATE SET offered = offered + excluded.offered, ' \
+                    'wins = wins + excluded.wins, votes = votes + excluded.votes'
+UPSERT_TIME_SLOT_VOTES = 'INSERT INTO time_slot_votes (chat_id, slot, wins, votes) VALUES (?, ?, ?, ?) ' \
+                         'ON CONFLICT(chat_id, slot) DO UPDATE SET wins = wins + excluded.wins, votes = votes + excluded.votes'
+# Проголосовавшие в опросах чата добавляются к проголосовавшим за неделю, а явка недели
+# пересчитывается по ним: пользователь, голосовавший в нескольких подведенных за неделю опросах, считается один раз
+INSERT_WEEKLY_VOTERS = 'INSERT INTO weekly_voters (chat_id, week, user_id) ' \
+                       'SELECT DISTINCT d.chat_id, ?, a.user_id FROM poll_answers AS a ' \
+                       'JOIN poll_data AS d ON d.poll_id = a.poll_id WHERE d.chat_id = ? ON CONFLICT DO NOTHING'
+DELETE_OLD_WEEKLY_VOTERS = 'DELETE FROM weekly_voters WHERE chat_id = ? AND week < ?'
+UPSERT_WEEKLY_TURNOUT = 'INSERT INTO weekly_turnout (chat_id, week, polls, voters, votes) ' \
+                        'VALUES (:chat_id, :week, :polls, ' \
+                        '(SELECT COUNT(*) FROM weekly_voters WHERE chat_id = :chat_id AND week = :week), :votes) ' \
+                        'ON CONFLICT(chat_id, week) DO UPDATE SET polls = polls + excluded.polls, ' \
+                        'voters = excluded.voters, votes = votes + excluded.votes'
+DELETE_OLD_POLL_ARCHIVE = 'DELETE FROM poll_archive WHERE closed_at < ?'
+# Статистика для /stats читается по индексам: время не зависит от длины истории
+SELECT_TOP_PLACE_WINS = 'SELECT place, wins, offered, votes FROM place_wins WHERE chat_id = ? ' \
+                        'ORDER BY wins DESC, votes DESC LIMIT ?'
+SELECT_TOP_TIME_SLOTS = 'SELECT slot, votes, wins FROM time_slot_votes WHERE chat_id = ? ' \
+                        'ORDER BY votes DESC, wins DESC LIMIT ?'
+SELECT_RECENT_TURNOUT = 'SELECT week, polls, voters, votes FROM weekly_turnout WHERE chat_id = ? ' \
+                        'ORDER BY week DESC LIMIT ?'
+UPSERT_PENDING_DELETION = 'INSERT INTO pending_deletions (chat_id, message_id, due_at) VALUES (?, ?, ?) ' \
+                          'ON CONFLICT(chat_id, message_id) DO UPDATE SET due_at = excluded.due_at'
+SELECT_PENDING_DELETIONS = 'SELECT due_at, chat_id, message_id FROM pending_deletions'
+DELETE_PENDING_DELETION = 'DELETE FROM pending_deletions WHERE chat_id = ? AND message_id = ?'
+SELECT_POLL_OFFERS = 'SELECT chat_id, place_rowid, poll_number FROM poll_offers'
+UPSERT_POLL_OFFER = 'INSERT INTO poll_offers (chat_id, place_rowid, poll_number) VALUES (?, ?, ?) ' \
+                    'ON CONFLICT(chat_id, place_rowid) DO UPDATE SET poll_number = excluded.poll_number'
+DELETE_PLACE_OFFERS = 'DELETE FROM poll_offers WHERE place_rowid = ?'
+SELECT_POLL_STANDINGS = 'SELECT chat_id, message_id, poll_ids FROM poll_standings'
+# Варианты и голоса опросов, для которых есть сообщение с промежуточными итогами
+SELECT_STANDINGS_POLLS = 'SELECT d.poll_id, d.kind, d.options FROM poll_standings AS s, json_each(s.poll_ids) AS p ' \
+                         'JOIN poll_data AS d ON d.poll_id = p.value'
+SELECT_STANDINGS_VOTES = 'SELECT r.poll_id, r.option_id, r.votes FROM poll_standings AS s, json_each(s.poll_ids) AS p ' \
+                         'JOIN poll_results AS r ON r.poll_id = p.value WHERE r.votes > 0'
+UPSERT_POLL_STANDINGS = 'INSERT INTO poll_standings (chat_id, message_id, poll_ids) VALUES (?, ?, ?) ' \
+                        'ON CONFLICT(chat_id) DO UPDATE SET message_id = excluded.message_id, poll_ids = excluded.poll_ids'
+DELETE_POLL_STANDINGS = 'DELETE FROM poll_standings WHERE chat_id = ?'
+SELECT_SCHEDULED_JOBS = 'SELECT job, chat_id, cron, next_run_at FROM scheduled_jobs'
+UPSERT_SCHEDULED_JOB = 'INSERT INTO scheduled_jobs (job, chat_id, cron, next_run_at) VALUES (?, ?, ?, ?) ' \
+                       'ON CONFLICT(job, chat_id) DO UPDATE SET cron = excluded.cron, next_run_at = excluded.next_run_at'
+DELETE_SCHEDULED_JOB = 'DELETE FROM scheduled_jobs WHERE job = ? AND chat_id = ?'
+INSERT_JOB_RUN = 'INSERT INTO job_runs (run_key, started_at) VALUES (?, ?) ON CONFLICT(run_key) DO NOTHING'
+FINISH_JOB_RUN = 'UPDATE job_runs SET finished_at = ?, error = ? WHERE run_key = ?'
+SELECT_UNFINISHED_JOB_RUNS = 'SELECT run_key, started_at FROM job_runs WHERE finished_at IS NULL'
+DELETE_OLD_JOB_RUNS = 'DELETE FROM job_runs WHERE started_at < ?'
+
+
+async def get_place(name: str) -> Optional[PlaceRecord]:
+    # Место ищется в кэше, к базе обращаемся только если кэш неполный
+    record = catalog.get(name)
+    if record is not None or catalog.is_complete:
+        return record
+
+    row = await db.fetchone(SELECT_PLACE, (normalize_name(name),))
+    if row is None:
+        return None
+    record = PlaceRecord(*row)
+    catalog.put(record)
+    return record
+
+
+async def get_place_by_rowid(rowid: int) -> Optional[PlaceRecord]:
+    record = catalog.get_by_rowid(rowid)
+    if record is not None or catalog.is_complete:
+        return record
+
+    row = await db.fetchone(SELECT_PLACE_BY_ROWID, (rowid,))
+    if row is None:
+        return None
+    record = PlaceRecord(*row)
+    catalog.put(record)
+    return record
+
+
+async def get_places_page(sort: str = 'name', direction: str = 'first', rowid: Optional[int] = None,
+                          limit: int = PLACES_PAGE_SIZE) -> tuple[list[tuple], bool]:
+    # Возвращает одну страницу мест (rowid, name, address, rating) в порядке сортировки
+    # и признак того, что дальше в направлении direction есть еще места.
+    # direction: 'first' - первая страница, 'next'/'prev' - страница после/до места rowid
+    sql = PLACES_PAGE_QUERIES[sort, direction]
+    params = (limit + 1,) if direction == 'first' else (rowid, limit + 1)
+
+    rows = await db.fetchall(sql, params)
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if direction == 'prev':
+        rows.reverse()
+    return rows, has_more
+
+
+async def load_places() -> None:
+    # Загружает каталог мест в кэш, picker и поисковый индекс (вызывается один раз при запуске бота)
+    records = [PlaceRecord(*row) for row in await db.fetchall(SELECT_CATALOG)]
+    catalog.load(records)
+    picker.load((record.rowid, record.score) for record in records)
+    picker.load_offers(await db.fetchall(SELECT_POLL_OFFERS))
+    search_index.load((record.rowid, record.name, record.address) for record in records)
+    geo_index.load(await db.fetchall(SELECT_PLACE_LOCATIONS))
+
+
+async def get_nearest_places(latitude: float, longitude: float, limit: int,
+                             max_km: Optional[float] = None) -> list[tuple[PlaceRecord, float]]:
+    # Ближайшие к точке места с известными координатами и расстояние до них в км
+    places = []
+    for distance, rowid in geo_index.nearest(latitude, longitude, limit, max_km):
+        record = await get_place_by_rowid(rowid)
+        if record is not None:
+            places.append((record, distance))
+    return places
+
+
+def search_places(query: str, limit: int = 10) -> list[SearchHit]:
+    # Места, название которых начинается с query, а затем похожие на query (с опечатками)
+    return search_index.search(query, limit)
+
+
+async def get_random_place(chat_id: int, weighted: bool = False) -> Optional[tuple]:
+    # Случайное место, которое недавно не показывалось в этом чате.
+    # weighted=True - места с более высоким рейтингом с затуханием выпадают чаще
+    rowid = picker.pick_for_chat(chat_id, weighted=weighted)
+    if rowid is None:
+        return None
+    return await get_place_by_rowid(rowid)
+
+
+async def get_poll_places(chat_id: int, limit: int) -> list[PlaceRecord]:
+    # limit разных мест для опроса чата: места с высоким рейтингом с затуханием и давно не предлагавшиеся
+    # выпадают чаще, места из последних POLL_EXCLUDE_LAST опросов не выпадают
+    places = [await get_place_by_rowid(rowid) for rowid in picker.sample_for_poll(chat_id, limit)]
+    return [place for place in places if place is not None]
+
+
+async def record_poll_places(chat_id: int, rowids: list[int]) -> None:
+    # Запоминает места, предложенные в опросе чата (вызывается после отправки опроса)
+    poll_number = picker.record_poll(chat_id, rowids)
+    async with db.transaction() as connection:
+        await connection.executemany(UPSERT_POLL_OFFER, [(chat_id, rowid, poll_number) for rowid in rowids])
+
+
+async def add_place(name: str, address: str, location: Optional[tuple[float, float]] = None) -> None:
+    # location - координаты места (широта, долгота), если они известны
+    name = normalize_name(name)
+    latitude, longitude = location or (None, None)
+    async with db.transaction() as connection:
+        async with connection.execute(INSERT_PLACE, (name, address, latitude, longitude, RATING_PRIOR)) as cursor:
+            added, rowid = cursor.rowcount, cursor.lastrowid
+
+    if added:
+        catalog.put(PlaceRecord(name, address, 0, rowid, RATING_PRIOR))
+        picker.add(rowid, RATING_PRIOR)
+        search_index.add(rowid, name, address)
+        if location is not None:
+            geo_index.add(rowid, latitude, longitude)
+
+
+async def upsert_places(places: Iterable[tuple[str, str]]) -> int:
+    # Массовое добавление мест одной транзакцией (places - пары (name, address)).
+    # Место с уже существующим названием не дублируется: у него обновляется адрес,
+    # а если название повторяется в одной пачке, остается последний адрес.
+    # Возвращает число добавленных и обновленных мест
+    addresses = {}
+    for name, address in places:
+        addresses[normalize_name(name)] = address
+    addresses.pop('', None)
+    if not addresses:
+        return 0
+    async with db.transaction() as connection:
+        await connection.executemany(UPSERT_PLACE, [(name, address, RATING_PRIOR)
+                                                    for name, address in addresses.items()])
+        async with connection.execute(SELECT_PLACES_BY_NAMES, (json.dumps(list(addresses)),)) as cursor:
+            records = [PlaceRecord(*row) for row in await cursor.fetchall()]
+
+    for record in records:
+        catalog.put(record)
+        picker.add(record.rowid, record.score)
+    search_index.add_many((record.rowid, record.name, record.address) for record in records)
+    return len(records)
+
+
+async def iter_places(chunk_size: int = 1000) -> AsyncIterator[list[tuple]]:
+    # Все места (name, address, rating) по алфавиту, частями по chunk_size строк,
+    # чтобы не держать весь каталог в памяти
+    async with db.acquire() as connection:
+        async with connection.execute(SELECT_EXPORT) as cursor:
+            while rows := await cursor.fetchmany(chunk_size):
+                yield rows
+
+
+async def delete_place(name: str) -> None:
+    # Вместе с местом удаляем и его оценки, чтобы они не попали в агрегаты места с тем же названием
+    name = normalize_name(name)
+    async with db.transaction() as connection:
+        async with connection.execute(DELETE_PLACE, (name,)) as cursor:
+            deleted = await cursor.fetchall()
+        await connection.execute(DELETE_PLACE_RATINGS, (name,))
+        await connection.execute(DELETE_PLACE_RATING_EVENTS, (name,))
+        await connection.executemany(DELETE_PLACE_OFFERS, deleted)
+
+    catalog.discard(name)
+    for (rowid,) in deleted:
+        picker.remove(rowid)
+        search_index.remove(rowid)
+        geo_index.remove(rowid)
+
+
+async def add_rating(name: str, user_id: int, rating: int, rated_at: Optional[float] = None) -> bool:
+    # У каждого пользователя одна оценка места: повторная оценка заменяет предыдущую,
+    # а в журнал rating_events записывается каждая оценка.
+    # Сумма и количество оценок в places меняются на разницу между новой и старой оценкой,
+    # а суммы для рейтинга с затуханием - на вклад новой оценки минус вклад старой с ее весом,
+    # поэтому стоимость не зависит от количества оценок. Все выполняется в одной транзакции.
+    # Если места нет (например, его удалили, пока пользователь вводил оценку), ничего не записывается
+    # и возвращается False
+    name = normalize_name(name)
+    rated_at = time.time() if rated_at is None else rated_at
+    async with db.transaction() as connection:
+        # Точку отсчета читаем в той же транзакции, чтобы проход decay_ratings не сдвинул ее между делом
+        async with connection.execute(SELECT_RATING_LANDMARK) as cursor:
+            (landmark,) = await cursor.fetchone()
+        async with connection.execute(SELECT_USER_RATING, (name, user_id)) as cursor:
+            previous = await cursor.fetchone()
+
+        weight = rating_decay.weight(rated_at, landmark)
+        previous_rating, previous_weight = 0, 0.0
+        if previous is not None:
+            previous_rating = previous[0]
+            previous_weight = rating_decay.weight(previous[1] if previous[1] is not None else landmark, landmark)
+
+        # Сначала место: оценка без места осталась бы в ratings и снова учлась бы,
+        # если место с тем же названием добавят позже
+        async with connection.execute(UPDATE_PLACE_RATING, {
+            'name': name,
+            'delta': rating - previous_rating,
+            'added': 0 if previous is not None else 1,
+            'decay_delta': rating * weight - previous_rating * previous_weight,
+            'weight_delta': weight - previous_weight,
+            'factor': rating_decay.factor(rated_at, landmark),
+            'prior_sum': rating_decay.prior * rating_decay.prior_weight,
+            'prior_weight': rating_decay.prior_weight,
+        }) as cursor:
+            updated = await cursor.fetchall()
+        if not updated:
+            return False
+        await connection.execute(UPSERT_RATING, (name, user_id, rating, rated_at))
+        await connection.execute(INSERT_RATING_EVENT, (name, user_id, rating, rated_at))
+
+    for rowid, new_rating, score in updated:
+        catalog.set_rating(name, new_rating, score)
+        picker.set_rating(rowid, score)
+    return True
+
+
+async def decay_ratings(now: Optional[float] = None) -> int:
+    # Проход затухания (см. RatingDecay): пересчитывает сохраненный score мест одним UPDATE
+    # без чтения оценок и при необходимости переносит точку отсчета в now.
+    # Вызывается при запуске бота и периодически (см. services/ratings.py).
+    # Возвращает число мест, у которых изменился score
+    now = time.time() if now is None else now
+    async with db.transaction() as connection:
+        async with connection.execute(SELECT_RATING_LANDMARK) as cursor:
+            (landmark,) = await cursor.fetchone()
+        factor = rating_decay.factor(now, landmark)
+        async with connection.execute(DECAY_PLACE_SCORES, {
+            'factor': factor,
+            'epsilon': rating_decay.epsilon,
+            'prior_sum': rating_decay.prior * rating_decay.prior_weight,
+            'prior_weight': rating_decay.prior_weight,
+        }) as cursor:
+            updated = await cursor.fetchall()
+        if rating_decay.needs_rebase(now, landmark):
+            await connection.execute(REBASE_PLACE_SCORES, {'factor': factor})
+            await connection.execute(UPDATE_RATING_LANDMARK, (now,))
+
+    for name, rowid, score in updated:
+        catalog.set_score(name, score)
+        picker.set_rating(rowid, score)
+    return len(updated)
+
+
+async def get_poll_answers(keys: Iterable[tuple[str, int]]) -> dict[tuple[str, int], tuple[int, ...]]:
+    # Сохраненный выбор пользователей: ключ - (poll_id, user_id), значение - выбранные варианты
+    # (все ключи одним запросом; ключ без сохраненного выбора - пустой выбор)
+    answers = {(poll_id, user_id): () for poll_id, user_id in keys}
+    rows = await db.fetchall(SELECT_POLL_ANSWERS, (json.dumps(list(answers)),))
+    answers.update(((poll_id, user_id), tuple(json.loads(option_ids))) for poll_id, user_id, option_ids in rows)
+    return answers
+
+
+async def save_poll_answers(answers: dict[tuple[str, int], tuple[int, ...]],
+                            deltas: dict[tuple[str, int], int]) -> set[str]:
+    # Одной транзакцией сохраняет новый выбор пользователей (пустой выбор - голос отозван)
+    # и изменения количества голосов deltas: ключ - (poll_id, option_id), значение - на сколько изменить.
+    # Ответы на опросы, которые уже перенесены в poll_archive (итоги подведены), отбрасываются:
+    # проверка в той же транзакции, поэтому голос не запишется после archive_chat_polls.
+    # Опроса может еще не быть в poll_data (голос пришел, пока send_chat_poll его сохраняет) -
+    # такие голоса сохраняются и учитываются, как только опрос будет записан.
+    # Возвращает poll_id подведенных опросов, ответы на которые отброшены
+    async with db.transaction() as connection:
+        poll_ids = json.dumps(sorted({poll_id for poll_id, _ in answers}))
+        async with connection.execute(SELECT_CLOSED_POLLS, (poll_ids,)) as cursor:
+            closed_polls = {row[0] for row in await cursor.fetchall()}
+
+        await connection.executemany(UPSERT_POLL_ANSWER, [(poll_id, user_id, json.dumps(option_ids))
+                                                          for (poll_id, user_id), option_ids in answers.items()
+                                                          if option_ids and poll_id not in closed_polls])
+        await connection.executemany(DELETE_POLL_ANSWER, [(poll_id, user_id)
+                                                          for (poll_id, user_id), option_ids in answers.items()
+                                                          if not option_ids and poll_id not in closed_polls])
+        await connection.executemany(UPSERT_POLL_VOTES, [(poll_id, option_id, delta)
+                                                         for (poll_id, option_id), delta in deltas.items()
+                                                         if delta and poll_id not in closed_polls])
+    return closed_polls
+
+
+async def save_polls(polls: Iterable[tuple[str, int, str, str, Optional[int]]]) -> None:
+    # polls - пятерки (poll_id, chat_id, kind, options в формате json, message_id сообщения с опросом)
+    async with db.transaction() as connection:
+        await connection.executemany(INSERT_POLL, list(polls))
+
+
+async def archive_chat_polls(chat_id: int, week: str,
+                             summarize: Callable[[list[tuple]], tuple[list[tuple], list[tuple], list[tuple], int]],
+                             before: float) -> tuple[list[tuple], list[tuple[str, Optional[int]]]]:
+    # Одной транзакцией подводит итоги опросов чата, переносит опросы в архив, добавляет их итоги
+    # к статистике недели week и удаляет опросы вместе с голосами; записи архива старше before удаляются.
+    # summarize получает голоса за все варианты опросов (poll_id, kind, options, option_id, votes, voters)
+    # и возвращает строки для INSERT_POLL_ARCHIVE, UPSERT_PLACE_WINS, UPSERT_TIME_SLOT_VOTES и число голосов.
+    # Итоги и архив читаются в той же транзакции, что и удаление, поэтому голос, записанный во время
+    # подведения итогов, попадает либо и в итоги, и в архив, либо никуда (см. save_poll_answers).
+    # Возвращает строки итогов (как SELECT_CHAT_POLL_TALLIES) и пары (poll_id, message_id) удаленных опросов
+    async with db.transaction() as connection:
+        async with connection.execute(SELECT_CHAT_POLL_TALLIES, (chat_id,)) as cursor:
+            tallies = await cursor.fetchall()
+        async with connection.execute(SELECT_CHAT_POLL_VOTES, (chat_id,)) as cursor:
+            archive, place_wins, time_slots, votes = summarize(await cursor.fetchall())
+
+        await connection.executemany(INSERT_POLL_ARCHIVE, archive)
+        await connection.executemany(UPSERT_PLACE_WINS, place_wins)
+        await connection.executemany(UPSERT_TIME_SLOT_VOTES, time_slots)
+        if archive:
+            await connection.execute(INSERT_WEEKLY_VOTERS, (week, chat_id))
+            await connection.execute(UPSERT_WEEKLY_TURNOUT, {'chat_id': chat_id, 'week': week,
+                                                             'polls': len(archive), 'votes': votes})
+            await connection.execute(DELETE_OLD_WEEKLY_VOTERS, (chat_id, week))
+        await connection.execute(DELETE_OLD_POLL_ARCHIVE, (before,))
+
+        await connection.execute(DELETE_CHAT_POLL_RESULTS, (chat_id,))
+        await connection.execute(DELETE_CHAT_POLL_ANSWERS, (chat_id,))
+        async with connection.execute(DELETE_CHAT_POLLS, (chat_id,)) as cursor:
+            archived = [tuple(row) for row in await cursor.fetchall()]
+    return list(tallies), archived
+
+
+async def get_poll_stats(chat_id: int, limit: int) -> tuple[list[tuple], list[tuple], list[tuple]]:
+    # Статистика опросов чата: места с наибольшим числом побед (place, wins, offered, votes),
+    # самое популярное время (slot, votes, wins) и явка за последние недели (week, polls, voters, votes)
+    async with db.acquire() as connection:
+        async with connection.execute(SELECT_TOP_PLACE_WINS, (chat_id, limit)) as cursor:
+            places = await cursor.fetchall()
+        async with connection.execute(SELECT_TOP_TIME_SLOTS, (chat_id, limit)) as cursor:
+            time_slots = await cursor.fetchall()
+        async with connection.execute(SELECT_RECENT_TURNOUT, (chat_id, limit)) as cursor:
+            turnout = await cursor.fetchall()
+    return places, time_slots, turnout
+
+
+async def add_pending_deletions(deletions: Iterable[tuple[int, int, float]]) -> None:
+    # deletions - тройки (chat_id, message_id, due_at)
+    async with db.transaction() as connection:
+        await connection.executemany(UPSERT_PENDING_DELETION, list(deletions))
+
+
+async def get_pending_deletions() -> list[tuple]:
+    return await db.fetchall(SELECT_PENDING_DELETIONS)
+
+
+async def remove_pending_deletions(messages: Iterable[tuple[int, int]]) -> None:
+    # messages - пары (chat_id, message_id)
+    async with db.transaction() as connection:
+        await connection.executemany(DELETE_PENDING_DELETION, list(messages))
+
+
+async def get_poll_standings() -> tuple[list[tuple], list[tuple], list[tuple]]:
+    # Сообщения с промежуточными итогами (chat_id, message_id, poll_ids в json),
+    # их опросы (poll_id, kind, options) и голоса за варианты (poll_id, option_id, votes)
+    async with db.acquire() as connection:
+        async with connection.execute(SELECT_POLL_STANDINGS) as cursor:
+            standings = await cursor.fetchall()
+        async with connection.execute(SELECT_STANDINGS_POLLS) as cursor:
+            polls = await cursor.fetchall()
+        async with connection.execute(SELECT_STANDINGS_VOTES) as cursor:
+            votes = await cursor.fetchall()
+    return standings, polls, votes
+
+
+async def save_poll_standings(chat_id: int, message_id: int, poll_ids: list[str]) -> None:
+    await db.execute(UPSERT_POLL_STANDINGS, (chat_id, message_id, json.dumps(poll_ids)))
+
+
+async def remove_poll_standings(chat_id: int) -> None:
+    await db.execute(DELETE_POLL_STANDINGS, (chat_id,))
+
+
+async def get_scheduled_jobs() -> list[tuple]:
+    return await db.fetchall(SELECT_SCHEDULED_JOBS)
+
+
+async def save_scheduled_jobs(jobs: Iterable[tuple[str, int, str, float]],
+                              removed: Iterable[tuple[str, int]] = ()) -> None:
+    # jobs - четверки (job, chat_id, cron, next_run_at), removed - пары (job, chat_id)
+    async with db.transaction() as connection:
+        await connection.executemany(UPSERT_SCHEDULED_JOB, list(jobs))
+        await connection.executemany(DELETE_SCHEDULED_JOB, list(removed))
+
+
+async def claim_job_runs(run_keys: Iterable[str], jobs: Iterable[tuple[str, int, str, float]],
+                         started_at: float) -> list[str]:
+    # В одной транзакции записывает запуски заданий и переносит их следующий запуск (jobs - как в
+    # save_scheduled_jobs). Возвращает ключи запусков, которых еще не было в журнале
+    claimed = []
+    async with db.transaction() as connection:
+        for run_key in run_keys:
+            async with connection.execute(INSERT_JOB_RUN, (run_key, started_at)) as cursor:
+                if cursor.rowcount:
+                    claimed.append(run_key)
+        await connection.executemany(UPSERT_SCHEDULED_JOB, list(jobs))
+    return claimed
+
+
+async def finish_job_run(run_key: str, finished_at: float, error: Optional[str] = None) -> None:
+    await db.execute(FINISH_JOB_RUN, (finished_at, error, run_key))
+
+
+async def get_unfinished_job_runs() -> list[tuple]:
+    return await db.fetchall(SELECT_UNFINISHED_JOB_RUNS)
+
+
+async def remove_old_job_runs(before: float) -> int:
+    return await db.execute(DELETE_OLD_JOB_RUNS, (before,))
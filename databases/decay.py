@@ -0,0 +1,43 @@
+import math
+
+
+class RatingDecay:
+    # Рейтинг места с затуханием: вес оценки уменьшается вдвое каждые half_life секунд,
+    # а к оценкам добавляется prior_weight "нейтральных" оценок prior, которые не затухают.
+    # Поэтому свежие оценки важнее старых, а место, которое давно никто не оценивал,
+    # постепенно возвращается к нейтральному prior, а не остается наверху навсегда.
+    #
+    # Затухание прямое (forward decay): оценка r, поставленная в момент t, хранится как
+    # r * weight(t) и weight(t), где weight(t) = exp(rate * (t - landmark)) - вес относительно
+    # общей для всех мест точки отсчета landmark. В places лежат суммы decay_sum и decay_weight
+    # таких чисел, и новая оценка меняет их на одно слагаемое, без пересчета старых оценок.
+    # Актуальный рейтинг в момент now - score(decay_sum, decay_weight, now, landmark).
+    # Периодический проход сохраняет в places новый score только тех мест, у которых он
+    # изменился больше чем на epsilon. Веса новых оценок растут вдвое за half_life,
+    # поэтому раз в rebase_after половинных сроков суммы всех мест умножаются на
+    # factor(now, landmark), а landmark переносится в now (score при этом не меняется)
+
+    def __init__(self, half_life: float, prior: float = 5.0, prior_weight: float = 1.0,
+                 epsilon: float = 0.001, rebase_after: float = 8) -> None:
+        self.half_life = half_life
+        self.prior = prior
+        self.prior_weight = prior_weight
+        self.epsilon = epsilon
+        self.rebase_after = rebase_after
+        self.rate = math.log(2) / half_life
+
+    def needs_rebase(self, now: float, landmark: float) -> bool:
+        return now - landmark > self.rebase_after * self.half_life
+
+    def weight(self, at: float, landmark: float) -> float:
+        # Вес оценки, поставленной в момент at, относительно landmark
+        return math.exp(self.rate * (at - landmark))
+
+    def factor(self, now: float, landmark: float) -> float:
+        # Во сколько раз уменьшились веса всех оценок с момента landmark
+        return math.exp(-self.rate * (now - landmark))
+
+    def score(self, decay_sum: float, decay_weight: float, now: float, landmark: float) -> float:
+        factor = self.factor(now, landmark)
+        return ((decay_sum * factor + self.prior * self.prior_weight)
+                / (decay_weight * factor + self.prior_weight))
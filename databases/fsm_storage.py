@@ -0,0 +1,250 @@
+import asyncio
+import copy
+import json
+import logging
+import time
+import typing
+from collections import OrderedDict
+
+from aiogram.dispatcher.storage import BaseStorage
+
+from databases.pool import ConnectionPool
+
+
+logger = logging.getLogger(__name__)
+
+UPSERT_RECORD = 'INSERT INTO fsm_storage (chat, user, state, data, bucket, updated_at) VALUES (?, ?, ?, ?, ?, ?) ' \
+                'ON CONFLICT(chat, user) DO UPDATE SET state = excluded.state, data = excluded.data, ' \
+                'bucket = excluded.bucket, updated_at = excluded.updated_at'
+DELETE_RECORD = 'DELETE FROM fsm_storage WHERE chat = ? AND user = ?'
+SELECT_RECORD = 'SELECT state, data, bucket, updated_at FROM fsm_storage WHERE chat = ? AND user = ?'
+DELETE_EXPIRED = 'DELETE FROM fsm_storage WHERE updated_at < ? RETURNING chat, user, data'
+
+# Ключ записи в хранилище - пара (chat, user) в виде строк, как в MemoryStorage
+Address = tuple[str, str]
+ExpireCallback = typing.Callable[[str, str, dict], typing.Awaitable[None]]
+
+
+def empty_record() -> dict:
+    return {'state': None, 'data': {}, 'bucket': {}, 'updated_at': 0.0}
+
+
+class SQLiteStorage(BaseStorage):
+    # Хранилище состояний FSM в файле базы данных бота (таблица fsm_storage) вместо MemoryStorage.
+    # Недописанные диалоги /add, /del и /rating переживают перезапуск бота.
+    # Записи читаются в ограниченный LRU-кэш (cache_size), изменения копятся в памяти
+    # и записываются в базу одной транзакцией через flush_interval секунд, поэтому
+    # set_state и set_data из одного state.proxy() превращаются в одну запись.
+    # Раз в sweep_interval секунд диалоги, не менявшиеся дольше ttl секунд, удаляются,
+    # а для их данных вызывается on_expire (например, чтобы удалить сообщения диалога).
+
+    def __init__(self, pool: ConnectionPool, ttl: float = 3600, flush_interval: float = 0.05,
+                 sweep_interval: float = 60, cache_size: int = 10000,
+                 on_expire: typing.Optional[ExpireCallback] = None) -> None:
+        self.pool = pool
+        self.ttl = ttl
+        self.flush_interval = flush_interval
+        self.sweep_interval = sweep_interval
+        self.cache_size = cache_size
+        self.on_expire = on_expire
+        self._cache: OrderedDict[Address, dict] = OrderedDict()
+        self._dirty: set[Address] = set()
+        self._flushing: set[Address] = set()
+        self._lock = asyncio.Lock()
+        self._flush_needed = asyncio.Event()
+        self._tasks: list[asyncio.Task] = []
+
+    def start(self) -> None:
+        # Запускает фоновые задачи записи изменений и удаления просроченных диалогов
+        self._tasks = [asyncio.create_task(self._flush_loop()), asyncio.create_task(self._sweep_loop())]
+
+    async def close(self):
+        for task in self._tasks:
+            task.cancel()
+        for task in self._tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._tasks = []
+        await self.flush()
+        self._cache.clear()
+
+    async def wait_closed(self):
+        pass
+
+    async def _record(self, chat, user) -> tuple[Address, dict]:
+        chat, user = map(str, self.check_address(chat=chat, user=user))
+        address = (chat, user)
+
+        record = self._cache.get(address)
+        if record is not None:
+            self._cache.move_to_end(address)
+            return address, record
+
+        row = await self.pool.fetchone(SELECT_RECORD, address)
+        record = empty_record()
+        if row is not None:
+            record = {'state': row[0], 'data': json.loads(row[1]), 'bucket': json.loads(row[2]), 'updated_at': row[3]}
+
+        # Пока запрос выполнялся, запись могла появиться в кэше
+        if address in self._cache:
+            return address, self._cache[address]
+
+        self._evict(reserve=1)
+        self._cache[address] = record
+        return address, record
+
+    def _evict(self, reserve: int = 0) -> None:
+        # Вытесняем давно не использованные записи, чтобы осталось место еще для reserve записей.
+        # Измененные записи, которые еще не записаны в базу или записываются прямо сейчас, не трогаем
+        excess = len(self._cache) + reserve - self.cache_size
+        if excess <= 0:
+            return
+        for address in list(self._cache):
+            if excess <= 0:
+                break
+            if address not in self._dirty and address not in self._flushing:
+                del self._cache[address]
+                excess -= 1
+
+    def _touch(self, address: Address, record: dict) -> None:
+        record['updated_at'] = time.time()
+        self._dirty.add(address)
+        self._flush_needed.set()
+
+    async def flush(self) -> None:
+        # Записывает все накопленные изменения одной транзакцией
+        async with self._lock:
+            if not self._dirty:
+                return
+            dirty, self._dirty = self._dirty, set()
+            self._flushing = dirty
+
+            upserts, deletes = [], []
+            for address in dirty:
+                record = self._cache[address]
+                if record['state'] is None and not record['data'] and not record['bucket']:
+                    deletes.append(address)
+                else:
+                    upserts.append((*address, record['state'], json.dumps(record['data']),
+                                    json.dumps(record['bucket']), record['updated_at']))
+
+            try:
+                async with self.pool.transaction() as connection:
+                    await connection.executemany(UPSERT_RECORD, upserts)
+                    await connection.executemany(DELETE_RECORD, deletes)
+            except Exception:
+                self._dirty |= dirty
+                raise
+            finally:
+                self._flushing = set()
+            self._evict()
+
+    async def expire(self) -> int:
+        # Удаляет диалоги, не менявшиеся дольше ttl, и возвращает их количество
+        await self.flush()
+        cutoff = time.time() - self.ttl
+        async with self.pool.transaction() as connection:
+            async with connection.execute(DELETE_EXPIRED, (cutoff,)) as cursor:
+                expired = await cursor.fetchall()
+
+        count = 0
+        for chat, user, data in expired:
+            record = self._cache.get((chat, user))
+            if record is not None:
+                if record['updated_at'] >= cutoff:
+                    # Пользователь продолжил диалог после flush: запись изменена в кэше
+                    # и при следующей записи вернется в базу, диалог не завершаем
+                    continue
+                del self._cache[chat, user]
+            count += 1
+            if self.on_expire is not None:
+                try:
+                    await self.on_expire(chat, user, json.loads(data))
+                except Exception:
+                    logger.exception('Ошибка при завершении просроченного диалога %s/%s', chat, user)
+        return count
+
+    async def _flush_loop(self) -> None:
+        while True:
+            await self._flush_needed.wait()
+            await asyncio.sleep(self.flush_interval)
+            self._flush_needed.clear()
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception('Не удалось сохранить состояния FSM')
+
+    async def _sweep_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            try:
+                await self.expire()
+            except Exception:
+                logger.exception('Не удалось удалить просроченные состояния FSM')
+
+    async def get_state(self, *,
+                        chat: typing.Union[str, int, None] = None,
+                        user: typing.Union[str, int, None] = None,
+                        default: typing.Optional[str] = None) -> typing.Optional[str]:
+        _, record = await self._record(chat, user)
+        state = record['state']
+        return state if state is not None else self.resolve_state(default)
+
+    async def get_data(self, *,
+                       chat: typing.Union[str, int, None] = None,
+                       user: typing.Union[str, int, None] = None,
+                       default: typing.Optional[dict] = None) -> typing.Dict:
+        _, record = await self._record(chat, user)
+        return copy.deepcopy(record['data'])
+
+    async def set_state(self, *,
+                        chat: typing.Union[str, int, None] = None,
+                        user: typing.Union[str, int, None] = None,
+                        state: typing.AnyStr = None):
+        address, record = await self._record(chat, user)
+        record['state'] = self.resolve_state(state)
+        self._touch(address, record)
+
+    async def set_data(self, *,
+                       chat: typing.Union[str, int, None] = None,
+                       user: typing.Union[str, int, None] = None,
+                       data: typing.Dict = None):
+        address, record = await self._record(chat, user)
+        record['data'] = copy.deepcopy(data or {})
+        self._touch(address, record)
+
+    async def update_data(self, *,
+                          chat: typing.Union[str, int, None] = None,
+                          user: typing.Union[str, int, None] = None,
+                          data: typing.Dict = None, **kwargs):
+        address, record = await self._record(chat, user)
+        record['data'].update(copy.deepcopy(data or {}), **kwargs)
+        self._touch(address, record)
+
+    def has_bucket(self):
+        return True
+
+    async def get_bucket(self, *,
+                         chat: typing.Union[str, int, None] = None,
+                         user: typing.Union[str, int, None] = None,
+                         default: typing.Optional[dict] = None) -> typing.Dict:
+        _, record = await self._record(chat, user)
+        return copy.deepcopy(record['bucket'])
+
+    async def set_bucket(self, *,
+                         chat: typing.Union[str, int, None] = None,
+                         user: typing.Union[str, int, None] = None,
+                         bucket: typing.Dict = None):
+        address, record = await self._record(chat, user)
+        record['bucket'] = copy.deepcopy(bucket or {})
+        self._touch(address, record)
+
+    async def update_bucket(self, *,
+                            chat: typing.Union[str, int, None] = None,
+                            user: typing.Union[str, int, None] = None,
+                            bucket: typing.Dict = None, **kwargs):
+        address, record = await self._record(chat, user)
+        record['bucket'].update(copy.deepcopy(bucket or {}), **kwargs)
+        self._touch(address, record)
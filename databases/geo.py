@@ -0,0 +1,160 @@
+import heapq
+import math
+from itertools import count
+from typing import Iterable, Optional
+
+
+EARTH_RADIUS_KM = 6371.0
+
+# Сколько мест лежит в листе дерева, прежде чем он делится пополам
+LEAF_SIZE = 32
+
+
+def to_xyz(latitude: float, longitude: float) -> tuple[float, float, float]:
+    # Точка на единичной сфере: расстояние по хорде между такими точками растет вместе
+    # с расстоянием по поверхности Земли, поэтому ближайшие по хорде - ближайшие и на карте
+    lat, lon = math.radians(latitude), math.radians(longitude)
+    return math.cos(lat) * math.cos(lon), math.cos(lat) * math.sin(lon), math.sin(lat)
+
+
+def chord_to_km(chord_squared: float) -> float:
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(chord_squared) / 2))
+
+
+def km_to_chord(distance: float) -> float:
+    return 2 * math.sin(min(math.pi / 2, distance / (2 * EARTH_RADIUS_KM)))
+
+
+class _Node:
+    # Узел k-d дерева: лист хранит места (rowid -> координаты), внутренний узел делит пространство
+    # плоскостью axis = split. low/high - границы всех мест поддерева (только расширяются)
+    __slots__ = ('points', 'axis', 'split', 'left', 'right', 'low', 'high')
+
+    def __init__(self, points: dict[int, tuple[float, float, float]]) -> None:
+        self.points: Optional[dict[int, tuple[float, float, float]]] = points
+        self.axis = 0
+        self.split = 0.0
+        self.left: Optional['_Node'] = None
+        self.right: Optional['_Node'] = None
+        self.low = [min(point[axis] for point in points.values()) for axis in range(3)] if points else [0.0] * 3
+        self.high = [max(point[axis] for point in points.values()) for axis in range(3)] if points else [0.0] * 3
+
+    def extend(self, point: tuple[float, float, float]) -> None:
+        for axis in range(3):
+            if point[axis] < self.low[axis]:
+                self.low[axis] = point[axis]
+            if point[axis] > self.high[axis]:
+                self.high[axis] = point[axis]
+
+    def box_distance(self, point: tuple[float, float, float]) -> float:
+        # Квадрат расстояния от точки до границ поддерева (0, если точка внутри)
+        total = 0.0
+        for axis in range(3):
+            if point[axis] < self.low[axis]:
+                total += (self.low[axis] - point[axis]) ** 2
+            elif point[axis] > self.high[axis]:
+                total += (point[axis] - self.high[axis]) ** 2
+        return total
+
+    def divide(self) -> None:
+        # Делит лист пополам по медиане вдоль оси, на которой места разбросаны сильнее всего.
+        # Если все места совпадают, лист остается как есть
+        axis = max(range(3), key=lambda axis: self.high[axis] - self.low[axis])
+        if self.high[axis] == self.low[axis]:
+            return
+        values = sorted(point[axis] for point in self.points.values())
+        split = values[len(values) // 2]
+        if split == values[0]:
+            split = next(value for value in values if value > split)
+        left = {rowid: point for rowid, point in self.points.items() if point[axis] < split}
+        right = {rowid: point for rowid, point in self.points.items() if point[axis] >= split}
+        self.axis, self.split, self.points = axis, split, None
+        self.left, self.right = _Node(left), _Node(right)
+        for child in (self.left, self.right):
+            if len(child.points) > LEAF_SIZE:
+                child.divide()
+
+
+class PlaceGeoIndex:
+    # Индекс координат мест для поиска ближайших: k-d дерево по точкам на единичной сфере.
+    # Поиск обходит узлы в порядке расстояния до их границ и останавливается, когда ближайший
+    # необойденный узел дальше k-го найденного места, поэтому просматривается несколько листов
+    # рядом с точкой запроса - при любой плотности мест и в любой точке Земли.
+    # Индекс заполняется в load_places и обновляется при добавлении и удалении мест:
+    # переполненный лист делится пополам, удаленное место просто убирается из листа
+
+    def __init__(self) -> None:
+        self._points: dict[int, tuple[float, float, float]] = {}
+        self._root = _Node({})
+
+    def __len__(self) -> int:
+        return len(self._points)
+
+    def __contains__(self, rowid: int) -> bool:
+        return rowid in self._points
+
+    def load(self, rows: Iterable[tuple[int, float, float]]) -> None:
+        # rows - тройки (rowid, latitude, longitude)
+        self._points = {rowid: to_xyz(latitude, longitude) for rowid, latitude, longitude in rows}
+        self._root = _Node(dict(self._points))
+        if len(self._points) > LEAF_SIZE:
+            self._root.divide()
+
+    def add(self, rowid: int, latitude: float, longitude: float) -> None:
+        if rowid in self._points:
+            self.remove(rowid)
+        point = self._points[rowid] = to_xyz(latitude, longitude)
+        node = self._root
+        if not node.points and node.left is None:
+            node.low, node.high = list(point), list(point)
+        while True:
+            node.extend(point)
+            if node.points is not None:
+                break
+            node = node.left if point[node.axis] < node.split else node.right
+        node.points[rowid] = point
+        if len(node.points) > LEAF_SIZE:
+            node.divide()
+
+    def remove(self, rowid: int) -> None:
+        point = self._points.pop(rowid, None)
+        if point is None:
+            return
+        node = self._root
+        while node.points is None:
+            node = node.left if point[node.axis] < node.split else node.right
+        del node.points[rowid]
+
+    def nearest(self, latitude: float, longitude: float, k: int,
+                max_km: Optional[float] = None) -> list[tuple[float, int]]:
+        # До k ближайших мест (расстояние в км, rowid) по возрастанию расстояния, не дальше max_km
+        if not self._points or k <= 0:
+            return []
+        query = to_xyz(latitude, longitude)
+        limit = km_to_chord(max_km) ** 2 if max_km is not None else math.inf
+
+        # found - k лучших мест как куча с обратным знаком (на вершине самое дальнее из них)
+        found: list[tuple[float, int]] = []
+        order = count()
+        nodes = [(self._root.box_distance(query), next(order), self._root)]
+        while nodes:
+            distance, _, node = heapq.heappop(nodes)
+            worst = -found[0][0] if len(found) == k else limit
+            if distance > worst:
+                break
+            if node.points is None:
+                for child in (node.left, node.right):
+                    child_distance = child.box_distance(query)
+                    if child_distance <= worst:
+                        heapq.heappush(nodes, (child_distance, next(order), child))
+                continue
+            for rowid, point in node.points.items():
+                chord = ((point[0] - query[0]) ** 2 + (point[1] - query[1]) ** 2
+                         + (point[2] - query[2]) ** 2)
+                if chord > limit:
+                    continue
+                if len(found) < k:
+                    heapq.heappush(found, (-chord, rowid))
+                elif chord < -found[0][0]:
+                    heapq.heapreplace(found, (-chord, rowid))
+        return sorted((chord_to_km(-chord), rowid) for chord, rowid in found)
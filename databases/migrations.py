@@ -0,0 +1,297 @@
+import logging
+
+import aiosqlite
+
+
+logger = logging.getLogger(__name__)
+
+
+# Версионированные миграции схемы базы данных.
+# Номер последней примененной миграции хранится в PRAGMA user_version,
+# поэтому при запуске выполняются только новые миграции, а существующий
+# файл places.db обновляется на месте без потери данных.
+# Миграции только добавляются в конец списка, старые никогда не изменяются.
+MIGRATIONS: list[tuple[int, str]] = [
+    # Исходная схема бота (раньше создавалась командой /start)
+    (1, '''
+        CREATE TABLE IF NOT EXISTS poll_data (
+            poll_id TEXT PRIMARY KEY,
+            options TEXT
+        );
+
+        CREATE TABLE IF NOT EXISTS poll_results (
+            poll_id TEXT,
+            option_id INTEGER,
+            votes INTEGER,
+            PRIMARY KEY (poll_id, option_id)
+        );
+
+        CREATE TABLE IF NOT EXISTS places (
+            name TEXT,
+            address TEXT,
+            rating INTEGER DEFAULT 0
+        );
+
+        CREATE TABLE IF NOT EXISTS ratings (
+            name TEXT,
+            rating INTEGER
+        );
+    '''),
+
+    # Индексы для поиска по названию места и для подсчета итогов опросов.
+    # Перед созданием уникального индекса приводим названия к виду normalize_name и удаляем дубликаты мест,
+    # которые могли попасть в старую базу без ограничения уникальности. Старый бот уже переводил названия
+    # в нижний регистр в Python, поэтому lower() из SQLite (только латиница) здесь достаточно,
+    # а trim убирает те же пробельные символы по краям, что и str.strip
+    (2, '''
+        DELETE FROM places WHERE rowid NOT IN (
+            SELECT MIN(rowid) FROM places GROUP BY lower(trim(name, char(32, 9, 10, 13)))
+        );
+        UPDATE places SET name = lower(trim(name, char(32, 9, 10, 13)));
+        UPDATE ratings SET name = lower(trim(name, char(32, 9, 10, 13)));
+
+        CREATE UNIQUE INDEX IF NOT EXISTS places_name_uq ON places (name);
+        CREATE INDEX IF NOT EXISTS ratings_name_idx ON ratings (name);
+        CREATE INDEX IF NOT EXISTS poll_results_votes_idx ON poll_results (poll_id, votes DESC, option_id);
+    '''),
+
+    # Накопительные сумма и количество оценок в places и одна оценка на пользователя.
+    # Старые оценки без пользователя (user_id IS NULL) не конфликтуют с уникальным индексом
+    # и один раз учитываются в агрегатах при переносе
+    (3, '''
+        ALTER TABLE places ADD COLUMN rating_sum INTEGER NOT NULL DEFAULT 0;
+        ALTER TABLE places ADD COLUMN rating_count INTEGER NOT NULL DEFAULT 0;
+        ALTER TABLE ratings ADD COLUMN user_id INTEGER;
+
+        DROP INDEX IF EXISTS ratings_name_idx;
+        CREATE UNIQUE INDEX IF NOT EXISTS ratings_name_user_uq ON ratings (name, user_id);
+
+        UPDATE places SET
+            rating_sum = (SELECT COALESCE(SUM(rating), 0) FROM ratings WHERE ratings.name = places.name),
+            rating_count = (SELECT COUNT(*) FROM ratings WHERE ratings.name = places.name);
+        UPDATE places SET rating = CASE WHEN rating_count > 0 THEN rating_sum * 1.0 / rating_count ELSE 0 END;
+    '''),
+
+    # Индекс для постраничного вывода мест, отсортированных по рейтингу
+    # (сортировка по названию использует places_name_uq)
+    (4, '''
+        CREATE INDEX IF NOT EXISTS places_rating_name_idx ON places (rating, name);
+    '''),
+
+    # Отложенные удаления сообщений, которые должны пережить перезапуск бота
+    (5, '''
+        CREATE TABLE IF NOT EXISTS pending_deletions (
+            chat_id INTEGER NOT NULL,
+            message_id INTEGER NOT NULL,
+            due_at REAL NOT NULL,
+            PRIMARY KEY (chat_id, message_id)
+        );
+    '''),
+
+    # Текущий выбор каждого пользователя в опросе, чтобы правильно учитывать
+    # отозванные и измененные голоса (в том числе после перезапуска бота)
+    (6, '''
+        CREATE TABLE IF NOT EXISTS poll_answers (
+            poll_id TEXT NOT NULL,
+            user_id INTEGER NOT NULL,
+            option_ids TEXT NOT NULL,
+            PRIMARY KEY (poll_id, user_id)
+        );
+    '''),
+
+    # Явный тип опроса (время или место) и чат, в который он отправлен.
+    # Тип опросов, открытых во время обновления, определяется по вариантам: у опроса мест они начинаются
+    # с "Место:" (options хранятся через json.dumps с экранированием, поэтому текст читается json_extract)
+    (7, '''
+        ALTER TABLE poll_data ADD COLUMN kind TEXT;
+        ALTER TABLE poll_data ADD COLUMN chat_id INTEGER;
+
+        UPDATE poll_data SET kind = CASE WHEN json_extract(options, '$[0]') LIKE 'Место:%' THEN 'place' ELSE 'time' END;
+    '''),
+
+    # Хранилище состояний FSM (см. databases/fsm_storage.py)
+    (8, '''
+        CREATE TABLE IF NOT EXISTS fsm_storage (
+            chat TEXT NOT NULL,
+            user TEXT NOT NULL,
+            state TEXT,
+            data TEXT NOT NULL DEFAULT '{}',
+            bucket TEXT NOT NULL DEFAULT '{}',
+            updated_at REAL NOT NULL,
+            PRIMARY KEY (chat, user)
+        );
+
+        CREATE INDEX IF NOT EXISTS fsm_storage_updated_at_idx ON fsm_storage (updated_at);
+    '''),
+
+    # Опросы рассылаются во все чаты из TARGET_CHAT_IDS, итоги считаются и очищаются по чатам.
+    # Чат опросов, сохраненных до миграции 7, берется из конфига (см. migrate_db)
+    (9, '''
+        CREATE INDEX IF NOT EXISTS poll_data_chat_idx ON poll_data (chat_id);
+    '''),
+
+    # В каком по счету опросе чата место предлагалось последний раз (см. RandomPlacePicker.sample_for_poll)
+    (10, '''
+        CREATE TABLE IF NOT EXISTS poll_offers (
+            chat_id INTEGER NOT NULL,
+            place_rowid INTEGER NOT NULL,
+            poll_number INTEGER NOT NULL,
+            PRIMARY KEY (chat_id, place_rowid)
+        ) WITHOUT ROWID;
+    '''),
+
+    # Расписания заданий по чатам и журнал их запусков (см. services/scheduler.py).
+    # run_key - ключ идемпотентности запуска: задание, чат и плановое время
+    (11, '''
+        CREATE TABLE IF NOT EXISTS scheduled_jobs (
+            job TEXT NOT NULL,
+            chat_id INTEGER NOT NULL,
+            cron TEXT NOT NULL,
+            next_run_at REAL NOT NULL,
+            PRIMARY KEY (job, chat_id)
+        ) WITHOUT ROWID;
+
+        CREATE TABLE IF NOT EXISTS job_runs (
+            run_key TEXT PRIMARY KEY,
+            started_at REAL NOT NULL,
+            finished_at REAL,
+            error TEXT
+        ) WITHOUT ROWID;
+    '''),
+
+    # Координаты места (если при добавлении была отправлена геопозиция).
+    # Поиск ближайших мест идет по индексу в памяти (см. databases/geo.py)
+    (12, '''
+        ALTER TABLE places ADD COLUMN latitude REAL;
+        ALTER TABLE places ADD COLUMN longitude REAL;
+    '''),
+
+    # Время оценок, журнал всех оценок и рейтинг с затуханием (см. databases/decay.py).
+    # Время старых оценок неизвестно - считаем, что они поставлены в момент миграции,
+    # тогда их вес относительно точки отсчета landmark равен 1.
+    # score заполняется проходом decay_ratings при запуске бота
+    (13, '''
+        ALTER TABLE ratings ADD COLUMN rated_at REAL;
+        UPDATE ratings SET rated_at = CAST(strftime('%s', 'now') AS REAL);
+
+        CREATE TABLE IF NOT EXISTS rating_events (
+            name TEXT NOT NULL,
+            user_id INTEGER,
+            rating INTEGER NOT NULL,
+            rated_at REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS rating_events_name_idx ON rating_events (name, rated_at);
+        INSERT INTO rating_events (name, user_id, rating, rated_at)
+            SELECT name, user_id, rating, rated_at FROM ratings;
+
+        ALTER TABLE places ADD COLUMN decay_sum REAL NOT NULL DEFAULT 0;
+        ALTER TABLE places ADD COLUMN decay_weight REAL NOT NULL DEFAULT 0;
+        ALTER TABLE places ADD COLUMN score REAL NOT NULL DEFAULT 0;
+        UPDATE places SET decay_sum = rating_sum, decay_weight = rating_count;
+        CREATE INDEX IF NOT EXISTS places_score_name_idx ON places (score, name);
+
+        CREATE TABLE IF NOT EXISTS rating_decay (
+            landmark REAL NOT NULL
+        );
+        INSERT INTO rating_decay (landmark) VALUES (CAST(strftime('%s', 'now') AS REAL));
+    '''),
+
+    # Архив подведенных опросов (результаты одной строкой в json) и накопительная статистика
+    # по чатам для /stats: победы мест, голоса за время встречи и явка по неделям (см. services/polls.py).
+    # Архив хранится ограниченное время, статистика - всегда
+    (14, '''
+        CREATE TABLE IF NOT EXISTS poll_archive (
+            poll_id TEXT PRIMARY KEY,
+            chat_id INTEGER NOT NULL,
+            kind TEXT,
+            closed_at REAL NOT NULL,
+            results TEXT NOT NULL,
+            winners TEXT NOT NULL,
+            total_votes INTEGER NOT NULL,
+            voters INTEGER NOT NULL
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS poll_archive_closed_at_idx ON poll_archive (closed_at);
+
+        CREATE TABLE IF NOT EXISTS place_wins (
+            chat_id INTEGER NOT NULL,
+            place TEXT NOT NULL,
+            offered INTEGER NOT NULL,
+            wins INTEGER NOT NULL,
+            votes INTEGER NOT NULL,
+            PRIMARY KEY (chat_id, place)
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS place_wins_top_idx ON place_wins (chat_id, wins DESC, votes DESC);
+
+        CREATE TABLE IF NOT EXISTS time_slot_votes (
+            chat_id INTEGER NOT NULL,
+            slot TEXT NOT NULL,
+            wins INTEGER NOT NULL,
+            votes INTEGER NOT NULL,
+            PRIMARY KEY (chat_id, slot)
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS time_slot_votes_top_idx ON time_slot_votes (chat_id, votes DESC, wins DESC);
+
+        CREATE TABLE IF NOT EXISTS weekly_turnout (
+            chat_id INTEGER NOT NULL,
+            week TEXT NOT NULL,
+            polls INTEGER NOT NULL,
+            voters INTEGER NOT NULL,
+            votes INTEGER NOT NULL,
+            PRIMARY KEY (chat_id, week)
+        ) WITHOUT ROWID;
+    '''),
+
+    # Закрепленное сообщение с промежуточными итогами текущих опросов чата (см. services/standings.py)
+    (15, '''
+        CREATE TABLE IF NOT EXISTS poll_standings (
+            chat_id INTEGER PRIMARY KEY,
+            message_id INTEGER NOT NULL,
+            poll_ids TEXT NOT NULL
+        );
+    '''),
+
+    # Сообщение с опросом, чтобы остановить опрос при подведении итогов (stopPoll).
+    # У опросов, отправленных до миграции, его нет - их голоса после подведения итогов отбрасываются
+    (16, '''
+        ALTER TABLE poll_data ADD COLUMN message_id INTEGER;
+    '''),
+
+    # Кто голосовал в опросах чата за неделю: явка в weekly_turnout считается по разным пользователям,
+    # даже если за неделю в чате подводились итоги нескольких опросов. Хранится только последняя неделя чата
+    (17, '''
+        CREATE TABLE IF NOT EXISTS weekly_voters (
+            chat_id INTEGER NOT NULL,
+            week TEXT NOT NULL,
+            user_id INTEGER NOT NULL,
+            PRIMARY KEY (chat_id, week, user_id)
+        ) WITHOUT ROWID;
+    '''),
+]
+
+
+def migration_script(version: int, sql: str) -> str:
+    # Оборачивает миграцию в транзакцию вместе с обновлением user_version,
+    # чтобы миграция применялась целиком или не применялась совсем
+    return f'BEGIN IMMEDIATE;\n{sql}\nPRAGMA user_version = {version};\nCOMMIT;'
+
+
+async def migrate(connection: aiosqlite.Connection) -> int:
+    # Применяет все еще не примененные миграции и возвращает текущую версию схемы
+
+    async with connection.execute('PRAGMA user_version') as cursor:
+        (current_version,) = await cursor.fetchone()
+
+    for version, sql in MIGRATIONS:
+        if version <= current_version:
+            continue
+
+        logger.info('Применяем миграцию базы данных №%s', version)
+        try:
+            await connection.executescript(migration_script(version, sql))
+        except Exception:
+            if connection.in_transaction:
+                await connection.rollback()
+            raise
+        current_version = version
+
+    return current_version
@@ -0,0 +1,175 @@
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Callable, Iterable, Optional
+
+import aiosqlite
+
+
+# Настройки SQLite, которые применяются к каждому соединению пула:
+# WAL позволяет читателям не блокировать писателя, NORMAL в режиме WAL
+# безопасен и заметно быстрее FULL, busy_timeout заставляет соединения
+# ждать освобождения блокировки вместо немедленной ошибки "database is locked"
+PRAGMAS = (
+    'PRAGMA journal_mode = WAL',
+    'PRAGMA synchronous = NORMAL',
+    'PRAGMA busy_timeout = 5000',
+    'PRAGMA temp_store = MEMORY',
+    'PRAGMA cache_size = -8000',
+    'PRAGMA mmap_size = 67108864',
+)
+
+# Наблюдатель за запросами: observer(sql, seconds)
+QueryObserver = Callable[[str, float], None]
+
+
+class TimedResult:
+    # Обертка над результатом connection.execute (aiosqlite.context.Result), которая сообщает
+    # наблюдателю, сколько выполнялся запрос. Как и Result, ее можно и дождаться через await,
+    # и использовать в async with - тогда время считается до закрытия курсора, то есть
+    # вместе с чтением строк результата
+    __slots__ = ('_result', '_sql', '_observer', '_started')
+
+    def __init__(self, result, sql: str, observer: QueryObserver) -> None:
+        self._result = result
+        self._sql = sql
+        self._observer = observer
+        self._started = time.perf_counter()
+
+    def __await__(self):
+        return self._timed().__await__()
+
+    async def _timed(self) -> Any:
+        try:
+            return await self._result
+        finally:
+            self._observe()
+
+    async def __aenter__(self) -> Any:
+        try:
+            return await self._result.__aenter__()
+        except BaseException:
+            self._observe()
+            raise
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        try:
+            await self._result.__aexit__(exc_type, exc, tb)
+        finally:
+            self._observe()
+
+    def _observe(self) -> None:
+        self._observer(self._sql, time.perf_counter() - self._started)
+
+
+class TimedConnection:
+    # Соединение, у которого замеряется время execute, executemany и executescript.
+    # Остальные атрибуты берутся у настоящего соединения aiosqlite
+    __slots__ = ('_connection', '_observer')
+
+    def __init__(self, connection: aiosqlite.Connection, observer: QueryObserver) -> None:
+        self._connection = connection
+        self._observer = observer
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._connection, name)
+
+    def execute(self, sql: str, parameters: Iterable = None) -> TimedResult:
+        return TimedResult(self._connection.execute(sql, parameters), sql, self._observer)
+
+    def executemany(self, sql: str, parameters: Iterable) -> TimedResult:
+        return TimedResult(self._connection.executemany(sql, parameters), sql, self._observer)
+
+    def executescript(self, sql_script: str) -> TimedResult:
+        return TimedResult(self._connection.executescript(sql_script), sql_script, self._observer)
+
+
+class ConnectionPool:
+    # Пул долгоживущих соединений aiosqlite.
+    # Соединения открываются один раз при запуске бота и переиспользуются всеми обработчиками,
+    # поэтому на каждый запрос не создается новый поток и файл базы не открывается заново.
+    # Каждое соединение держит кэш подготовленных выражений (cached_statements),
+    # так что одинаковые SQL-запросы компилируются только один раз.
+    # Если задан observer, ему сообщается время выполнения каждого запроса (для метрик)
+
+    def __init__(self, path: str, size: int = 4, cached_statements: int = 256) -> None:
+        self.path = path
+        self.size = size
+        self.cached_statements = cached_statements
+        self._connections: list[aiosqlite.Connection] = []
+        self._idle: Optional[asyncio.Queue] = None
+        self.observer: Optional[QueryObserver] = None
+
+    @property
+    def is_open(self) -> bool:
+        return self._idle is not None
+
+    async def open(self) -> None:
+        # Открываем все соединения пула и применяем к ним настройки
+        if self.is_open:
+            return
+
+        self._idle = asyncio.Queue()
+        for _ in range(self.size):
+            # isolation_level=None - транзакциями управляем сами (см. transaction)
+            connection = await aiosqlite.connect(self.path, isolation_level=None,
+                                                 cached_statements=self.cached_statements)
+            # executescript сразу закрывает курсоры прагм, иначе незавершенный запрос
+            # удерживал бы открытую читающую транзакцию со старым снимком схемы
+            await connection.executescript(';\n'.join(PRAGMAS))
+            self._connections.append(connection)
+            self._idle.put_nowait(connection)
+
+    async def close(self) -> None:
+        # Закрываем все соединения (вызывается при остановке бота)
+        if not self.is_open:
+            return
+
+        for connection in self._connections:
+            await connection.close()
+        self._connections.clear()
+        self._idle = None
+
+    @asynccontextmanager
+    async def acquire(self) -> AsyncIterator[aiosqlite.Connection]:
+        # Берем свободное соединение из пула и возвращаем его обратно после использования
+        if not self.is_open:
+            raise RuntimeError('Пул соединений не открыт, вызовите open() при запуске бота')
+
+        idle = self._idle
+        connection = await idle.get()
+        try:
+            yield connection if self.observer is None else TimedConnection(connection, self.observer)
+        finally:
+            idle.put_nowait(connection)
+
+    @asynccontextmanager
+    async def transaction(self) -> AsyncIterator[aiosqlite.Connection]:
+        # Выполняет несколько запросов в одной транзакции.
+        # BEGIN IMMEDIATE сразу берет блокировку на запись, чтобы два писателя
+        # не получили ошибку при попытке повысить блокировку посреди транзакции
+        async with self.acquire() as connection:
+            await connection.execute('BEGIN IMMEDIATE')
+            try:
+                yield connection
+            except BaseException:
+                await connection.rollback()
+                raise
+            else:
+                await connection.commit()
+
+    async def fetchone(self, sql: str, params: Iterable = ()) -> Optional[tuple]:
+        async with self.acquire() as connection:
+            async with connection.execute(sql, params) as cursor:
+                return await cursor.fetchone()
+
+    async def fetchall(self, sql: str, params: Iterable = ()) -> list[tuple]:
+        async with self.acquire() as connection:
+            async with connection.execute(sql, params) as cursor:
+                return list(await cursor.fetchall())
+
+    async def execute(self, sql: str, params: Iterable = ()) -> int:
+        # Выполняет один запрос на запись в отдельной транзакции и возвращает число измененных строк
+        async with self.transaction() as connection:
+            async with connection.execute(sql, params) as cursor:
+                return cursor.rowcount
@@ -0,0 +1,167 @@
+import heapq
+import random
+from collections import deque
+from typing import Container, Iterable, Optional
+
+
+# Рейтинг места лежит в диапазоне от 0 до 10, вес места - рейтинг + 1,
+# чтобы места без оценок тоже могли выпасть
+MAX_WEIGHT = 11.0
+
+# Сколько раз пытаемся вытянуть подходящее место, прежде чем отказаться от исключений
+MAX_ATTEMPTS = 64
+
+# Место, предложенное в опросе чата, не предлагается в следующих poll_exclude опросах,
+# а потом его вес восстанавливается: за каждый следующий опрос недостающая часть веса
+# уменьшается в RECENCY_RECOVERY раз (1/2, 3/4, 7/8, ... от полного веса)
+RECENCY_RECOVERY = 2.0
+
+
+class RandomPlacePicker:
+    # Выбор случайного места без чтения всей таблицы places.
+    # В памяти хранится плотный массив rowid всех мест (и их рейтингов с затуханием),
+    # который загружается один раз при запуске и обновляется при добавлении,
+    # удалении и оценке места. Выбор - один случайный индекс в массиве, то есть O(1).
+    # Выбор с учетом рейтинга делается методом отбора (rejection sampling):
+    # место принимается с вероятностью вес / MAX_WEIGHT, что в среднем занимает O(1) попыток.
+    # Для опросов хранится, в каком по счету опросе чата место предлагалось в последний раз
+    # (см. sample_for_poll). rng можно передать с seed, чтобы выбор был воспроизводимым.
+
+    def __init__(self, recent_size: int = 5, poll_exclude: int = 1, rng: Optional[random.Random] = None) -> None:
+        self.recent_size = recent_size
+        self.poll_exclude = poll_exclude
+        self._rng = rng or random.Random()
+        self._ids: list[int] = []
+        self._ratings: list[float] = []
+        self._positions: dict[int, int] = {}
+        self._recent: dict[int, deque] = {}
+        self._offers: dict[int, dict[int, int]] = {}
+        self._polls: dict[int, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def load(self, rows: Iterable[tuple[int, float]]) -> None:
+        # rows - пары (rowid, rating)
+        self._ids.clear()
+        self._ratings.clear()
+        self._positions.clear()
+        for rowid, rating in rows:
+            self.add(rowid, rating)
+
+    def add(self, rowid: int, rating: float = 0) -> None:
+        if rowid in self._positions:
+            self.set_rating(rowid, rating)
+            return
+        self._positions[rowid] = len(self._ids)
+        self._ids.append(rowid)
+        self._ratings.append(rating or 0)
+
+    def remove(self, rowid: int) -> None:
+        # Удаление за O(1): на место удаляемого элемента переносим последний
+        position = self._positions.pop(rowid, None)
+        if position is None:
+            return
+        last_id, last_rating = self._ids.pop(), self._ratings.pop()
+        if position < len(self._ids):
+            self._ids[position], self._ratings[position] = last_id, last_rating
+            self._positions[last_id] = position
+        # rowid удаленного места может достаться новому месту
+        for offers in self._offers.values():
+            offers.pop(rowid, None)
+
+    def set_rating(self, rowid: int, rating: float) -> None:
+        position = self._positions.get(rowid)
+        if position is not None:
+            self._ratings[position] = rating or 0
+
+    def pick(self, weighted: bool = False, exclude: Container[int] = ()) -> Optional[int]:
+        # Возвращает rowid случайного места или None, если мест нет.
+        # exclude - места, которые не нужно предлагать (например, недавно показанные);
+        # если подходящее место не нашлось за MAX_ATTEMPTS попыток, исключения игнорируются
+        if not self._ids:
+            return None
+
+        for _ in range(MAX_ATTEMPTS):
+            position = self._rng.randrange(len(self._ids))
+            if self._ids[position] in exclude:
+                continue
+            if weighted and self._rng.random() * MAX_WEIGHT >= self._ratings[position] + 1:
+                continue
+            return self._ids[position]
+
+        return self._ids[self._rng.randrange(len(self._ids))]
+
+    def pick_for_chat(self, chat_id: int, weighted: bool = False) -> Optional[int]:
+        # Выбор места, которое не показывалось в этом чате последние recent_size раз
+        recent = self._recent.setdefault(chat_id, deque(maxlen=self.recent_size))
+        rowid = self.pick(weighted=weighted, exclude=recent)
+        if rowid is not None:
+            recent.append(rowid)
+        return rowid
+
+    def load_offers(self, rows: Iterable[tuple[int, int, int]]) -> None:
+        # rows - тройки (chat_id, rowid, номер опроса чата, в котором место предлагалось последний раз)
+        self._offers.clear()
+        self._polls.clear()
+        for chat_id, rowid, poll_number in rows:
+            self._offers.setdefault(chat_id, {})[rowid] = poll_number
+            self._polls[chat_id] = max(self._polls.get(chat_id, 0), poll_number)
+
+    def record_poll(self, chat_id: int, rowids: Iterable[int]) -> int:
+        # Запоминает места, предложенные в новом опросе чата, и возвращает номер этого опроса
+        poll_number = self._polls[chat_id] = self._polls.get(chat_id, 0) + 1
+        offers = self._offers.setdefault(chat_id, {})
+        for rowid in rowids:
+            offers[rowid] = poll_number
+        return poll_number
+
+    def poll_weight(self, chat_id: int, position: int) -> float:
+        # Вес места в опросе чата: рейтинг + 1 с поправкой на то, как давно место предлагалось
+        weight = self._ratings[position] + 1
+        last = self._offers.get(chat_id, {}).get(self._ids[position])
+        if last is None:
+            return weight
+        age = self._polls.get(chat_id, 0) - last + 1
+        if age <= self.poll_exclude:
+            return 0.0
+        return weight * (1 - RECENCY_RECOVERY ** (self.poll_exclude - age))
+
+    def sample_for_poll(self, chat_id: int, k: int) -> list[int]:
+        # k разных мест для опроса чата: вероятность выпасть пропорциональна poll_weight,
+        # места из последних poll_exclude опросов не предлагаются.
+        # Места тянутся по одному методом отбора, как в pick, - это та же взвешенная выборка
+        # без возвращения, что и у взвешенного резервуара, но за O(k) в среднем, а не O(n).
+        # Если отбор не справился (почти все места недавно предлагались или без рейтинга),
+        # выборка делается резервуаром за один проход по всем местам
+        if k >= len(self._ids):
+            return self.reservoir_for_poll(chat_id, k)
+
+        chosen: list[int] = []
+        positions: set[int] = set()
+        for _ in range(MAX_ATTEMPTS * k):
+            position = self._rng.randrange(len(self._ids))
+            if position in positions or self._rng.random() * MAX_WEIGHT >= self.poll_weight(chat_id, position):
+                continue
+            positions.add(position)
+            chosen.append(self._ids[position])
+            if len(chosen) == k:
+                return chosen
+        return self.reservoir_for_poll(chat_id, k)
+
+    def reservoir_for_poll(self, chat_id: int, k: int) -> list[int]:
+        # Взвешенная выборка без возвращения за один проход (Efraimidis-Spirakis):
+        # каждому месту достается ключ random() ** (1 / вес), берутся k мест с наибольшими ключами.
+        # Если подходящих мест меньше k, опрос дополняется местами, которые предлагались раньше всех
+        keys, excluded = [], []
+        offers = self._offers.get(chat_id, {})
+        for position, rowid in enumerate(self._ids):
+            weight = self.poll_weight(chat_id, position)
+            if weight > 0:
+                keys.append((self._rng.random() ** (1 / weight), rowid))
+            else:
+                excluded.append((offers.get(rowid, 0), self._rng.random(), rowid))
+        chosen = [rowid for _, rowid in heapq.nlargest(k, keys)]
+        if len(chosen) < k:
+            chosen += [rowid for _, _, rowid in heapq.nsmallest(k - len(chosen), excluded)]
+        return chosen
@@ -0,0 +1,185 @@
+import bisect
+import heapq
+from collections import Counter
+from itertools import combinations
+from typing import Iterable, NamedTuple
+
+from databases.catalog import normalize_name
+
+
+# Кандидаты отбираются по CANDIDATE_GRAMS самым редким триграммам запроса.
+# Одна опечатка (замена, вставка или удаление буквы) добавляет в запрос не больше
+# TYPO_GRAMS чужих триграмм, поэтому нужное место содержит хотя бы CANDIDATE_GRAMS - TYPO_GRAMS из них
+CANDIDATE_GRAMS = 6
+TYPO_GRAMS = 3
+
+# Адрес учитывается в ранжировании с меньшим весом, чем название
+ADDRESS_WEIGHT = 0.5
+
+
+def trigrams(text: str) -> set[str]:
+    # Триграммы строки, дополненной пробелами по краям, как в pg_trgm:
+    # начало строки дает отдельные триграммы, поэтому совпадение начала весит больше
+    padded = f'  {text} '
+    return {padded[index:index + 3] for index in range(len(padded) - 2)}
+
+
+class SearchHit(NamedTuple):
+    rowid: int
+    name: str
+    address: str
+    score: float
+
+
+class TrigramPostings:
+    # Для каждой триграммы - множество rowid строк, в которых она встречается,
+    # и число разных триграмм каждой строки (для коэффициента Жаккара)
+
+    def __init__(self) -> None:
+        self._postings: dict[str, set[int]] = {}
+        self._sizes: dict[int, int] = {}
+
+    def clear(self) -> None:
+        self._postings.clear()
+        self._sizes.clear()
+
+    def add(self, rowid: int, text: str) -> None:
+        grams = trigrams(text)
+        self._sizes[rowid] = len(grams)
+        for gram in grams:
+            self._postings.setdefault(gram, set()).add(rowid)
+
+    def remove(self, rowid: int, text: str) -> None:
+        self._sizes.pop(rowid, None)
+        for gram in trigrams(text):
+            postings = self._postings.get(gram)
+            if postings is not None:
+                postings.discard(rowid)
+                if not postings:
+                    del self._postings[gram]
+
+    def candidates(self, grams: set[str]) -> set[int]:
+        # Строки, в которых есть достаточно самых редких триграмм запроса, чтобы оказаться
+        # нужной строкой с одной опечаткой (см. CANDIDATE_GRAMS)
+        rare = sorted((postings for postings in map(self._postings.get, grams) if postings), key=len)
+        rare = rare[:CANDIDATE_GRAMS]
+        # В коротком запросе опечатка может испортить почти все триграммы,
+        # поэтому для него нужны все редкие триграммы без исключения
+        needed = len(rare) - TYPO_GRAMS if len(rare) > TYPO_GRAMS + 1 else len(rare)
+        if not rare:
+            return set()
+        return set().union(*(set.intersection(*group) for group in combinations(rare, needed)))
+
+    def scores(self, grams: set[str], candidates: set[int]) -> dict[int, float]:
+        # Коэффициент Жаккара по триграммам между запросом и каждым кандидатом
+        shared = Counter()
+        for postings in map(self._postings.get, grams):
+            if postings:
+                shared.update(candidates & postings)
+        return {rowid: count / (len(grams) + self._sizes[rowid] - count) for rowid, count in shared.items()}
+
+
+class PlaceSearchIndex:
+    # Нечеткий поиск мест по названию и адресу в памяти процесса.
+    # Названия лежат в отсортированном списке для поиска по началу названия (bisect),
+    # а для нечеткого поиска по названиям и адресам строятся триграммные индексы.
+    # Кандидаты отбираются по нескольким самым редким триграммам запроса, и ранжируются только они,
+    # поэтому время поиска зависит от числа похожих мест, а не от размера каталога.
+    # Индекс заполняется в load_places и обновляется при добавлении и удалении мест.
+
+    def __init__(self) -> None:
+        self._places: dict[int, tuple[str, str]] = {}
+        self._sorted_names: list[tuple[str, int]] = []
+        self._names = TrigramPostings()
+        self._addresses = TrigramPostings()
+
+    def __len__(self) -> int:
+        return len(self._places)
+
+    def load(self, rows: Iterable[tuple[int, str, str]]) -> None:
+        # rows - тройки (rowid, name, address)
+        self._places.clear()
+        self._sorted_names.clear()
+        self._names.clear()
+        self._addresses.clear()
+        for rowid, name, address in rows:
+            self._index(rowid, name, address or '')
+            self._sorted_names.append((normalize_name(name), rowid))
+        self._sorted_names.sort()
+
+    def add(self, rowid: int, name: str, address: str) -> None:
+        if rowid in self._places:
+            self.remove(rowid)
+        self._index(rowid, name, address or '')
+        bisect.insort(self._sorted_names, (normalize_name(name), rowid))
+
+    def add_many(self, rows: Iterable[tuple[int, str, str]]) -> None:
+        # Пачка добавленных и обновленных мест (импорт каталога): список названий сортируется
+        # один раз на пачку, а у места с тем же названием переиндексируется только адрес
+        added = False
+        for rowid, name, address in rows:
+            address = address or ''
+            place = self._places.get(rowid)
+            if place is not None and place[0] == name:
+                if place[1] != address:
+                    self._addresses.remove(rowid, normalize_name(place[1]))
+                    self._addresses.add(rowid, normalize_name(address))
+                    self._places[rowid] = (name, address)
+                continue
+            if place is not None:
+                self.remove(rowid)
+            self._index(rowid, name, address)
+            self._sorted_names.append((normalize_name(name), rowid))
+            added = True
+        if added:
+            self._sorted_names.sort()
+
+    def remove(self, rowid: int) -> None:
+        place = self._places.pop(rowid, None)
+        if place is None:
+            return
+        name, address = place
+        self._names.remove(rowid, normalize_name(name))
+        self._addresses.remove(rowid, normalize_name(address))
+        key = (normalize_name(name), rowid)
+        position = bisect.bisect_left(self._sorted_names, key)
+        if position < len(self._sorted_names) and self._sorted_names[position] == key:
+            del self._sorted_names[position]
+
+    def _index(self, rowid: int, name: str, address: str) -> None:
+        self._places[rowid] = (name, address)
+        self._names.add(rowid, normalize_name(name))
+        self._addresses.add(rowid, normalize_name(address))
+
+    def complete(self, prefix: str, limit: int = 10) -> list[SearchHit]:
+        # Места, название которых начинается с prefix, по алфавиту
+        prefix = normalize_name(prefix)
+        hits = []
+        position = bisect.bisect_left(self._sorted_names, (prefix,))
+        while len(hits) < limit and position < len(self._sorted_names):
+            name, rowid = self._sorted_names[position]
+            if not name.startswith(prefix):
+                break
+            hits.append(SearchHit(rowid, *self._places[rowid], 1.0))
+            position += 1
+        return hits
+
+    def search(self, query: str, limit: int = 10, min_score: float = 0.2) -> list[SearchHit]:
+        # Места для запроса query: сначала те, чье название начинается с query,
+        # затем похожие по триграммам названия или адреса - по убыванию похожести
+        query = normalize_name(query)
+        if not query:
+            return []
+        hits = self.complete(query, limit)
+        if len(hits) >= limit or len(query) < 3:
+            return hits
+
+        grams = trigrams(query)
+        scores = self._names.scores(grams, self._names.candidates(grams))
+        for rowid, score in self._addresses.scores(grams, self._addresses.candidates(grams)).items():
+            scores[rowid] = max(scores.get(rowid, 0.0), ADDRESS_WEIGHT * score)
+
+        seen = {hit.rowid for hit in hits}
+        ranked = heapq.nlargest(limit, ((score, rowid) for rowid, score in scores.items()
+                                        if score >= min_score and rowid not in seen))
+        return hits + [SearchHit(rowid, *self._places[rowid], score) for score, rowid in ranked]
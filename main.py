@@ -1,24 +1,37 @@
-import asyncio
 import json
 import logging
-import random
+import tempfile
+from pathlib import Path
 
 from aiogram import Bot, types, exceptions
-from aiogram.contrib.fsm_storage.memory import MemoryStorage
 from aiogram.dispatcher import Dispatcher, FSMContext
 from aiogram.dispatcher.filters import Command
 from aiogram.utils import executor
-
-import aiosqlite
-
-from apscheduler.schedulers.asyncio import AsyncIOScheduler
-from apscheduler.triggers.cron import CronTrigger
+from aiogram.utils.callback_data import CallbackData
 
 from config_data.config import Config, load_config
 
-from databases.database import create_db
-
-from states.states import Del, Place, Rating
+from databases.database import (add_place, add_rating, catalog, db, decay_ratings, delete_place,
+                                get_nearest_places, get_place, get_places_page, get_poll_places, get_poll_stats,
+                                get_random_place, search_places, load_places, migrate_db, record_poll_places, save_polls)
+from databases import database, fsm_storage
+from databases.fsm_storage import SQLiteStorage
+
+from services.admins import AdminCache
+from services.cleanup import MessageCleaner
+from services.metrics import (MetricsMiddleware, MetricsServer, QueryNames, SlowUpdateProfiler, observe_queued_update,
+                              observe_telegram_call)
+from services.outbound import PRIORITY_SCHEDULED, OutboundDispatcher
+from services.pipeline import SingleFlight, UpdatePipeline
+from services.polls import POLL_PLACE, POLL_TIME, archive_polls, place_option, render_announcement, render_stats
+from services.ratings import RatingDecayTask
+from services.scheduler import JobScheduler
+from services.standings import StandingsBoard
+from services.transfer import TransferError, export_places, import_places
+from services.votes import VoteAggregator
+from services.webhook import start_webhook
+
+from states.states import Del, Near, Place, Rating
 
 
 # Устанавливаем настройки логирования для отладки бота
@@ -30,13 +43,92 @@ config: Config = load_config()
 # Создаем экземпляры бота, хранилища и диспетчера
 # передавая в качестве аргументов токен бота и хранилище состояний
 bot = Bot(token=config.tg_bot.token)
-storage = MemoryStorage()
+
+# Все запросы к Telegram идут через общую очередь с ограничением частоты
+outbound = OutboundDispatcher(bot)
+
+# Отложенное удаление сообщений (во избежание захламления чата)
+cleaner = MessageCleaner(outbound)
+
+# Списки администраторов чатов кэшируются на 5 минут, ADMIN_IDS из конфига - администраторы везде
+admins = AdminCache(outbound, config.tg_bot.admin_ids, ttl=300)
+
+
+async def expire_dialogue(chat: str, user: str, data: dict) -> None:
+    # Брошенный диалог /add, /del или /rating удаляется из хранилища по истечении ttl,
+    # а его сообщения удаляются из чата
+    await cleaner.schedule(int(chat), data.get('messages_to_delete', []) + data.get('message_id', []))
+
+
+# Состояния хранятся в той же базе SQLite, брошенные диалоги удаляются через час
+storage = SQLiteStorage(db, ttl=3600, on_expire=expire_dialogue)
 dp = Dispatcher(bot, storage=storage)
 
+# Входящие обновления обрабатываются через очередь: по порядку для каждой пары (чат, пользователь),
+# одновременно не больше UPDATE_WORKERS обновлений, при переполнении новые обновления не принимаются
+pipeline = UpdatePipeline(dp, workers=config.pipeline.workers, chat_concurrency=config.pipeline.chat_concurrency,
+                          queue_size=config.pipeline.queue_size, max_pending=config.pipeline.max_pending)
+pipeline.install()
+
+# Одинаковые команды чтения (/place, /random, /stats, /help) в одном чате в течение секунды дают один ответ
+read_commands = SingleFlight(window=1.0)
+
+# Буферизованная запись ответов на опросы
+votes = VoteAggregator()
+
+# Закрепленные промежуточные итоги опросов: голоса из VoteAggregator,
+# правка сообщения не чаще раза в STANDINGS_INTERVAL секунд на чат
+STANDINGS_INTERVAL = 10
+standings = StandingsBoard(outbound, interval=STANDINGS_INTERVAL)
+votes.observer = standings.apply
+
+# Рейтинг с затуханием всех мест пересчитывается раз в час (и при запуске)
+rating_decayer = RatingDecayTask(interval=3600)
+
 # Список разрешенных чатов для добавления места
 allowed_chat = config.tg_bot.allowed_chat_ids
 target_chat = config.tg_bot.target_chat_ids
 
+# Сколько чатов одновременно обрабатывают задания по расписанию (опросы и их итоги)
+POLL_FANOUT_CONCURRENCY = 20
+
+# Сколько мест предлагается в опросе
+POLL_PLACE_OPTIONS = 7
+
+# Сколько строк в каждом разделе /stats
+STATS_LIMIT = 5
+
+# Сколько ближайших мест показывает /near и в каком радиусе (км) их искать
+NEAR_PLACES_LIMIT = 5
+NEAR_MAX_KM = 50
+
+# Метрики: время обработки обновлений по обработчикам, время SQL-запросов по именам констант
+# и запросы к Telegram с ошибками. Отдаются в формате Prometheus на http://METRICS_HOST:METRICS_PORT/metrics
+metrics_server = MetricsServer(config.metrics.host, config.metrics.port)
+if config.metrics.enabled:
+    profiler = SlowUpdateProfiler(config.metrics.slow_update_ms / 1000) if config.metrics.slow_update_ms else None
+    metrics_middleware = MetricsMiddleware(profiler)
+    dp.middleware.setup(metrics_middleware)
+    dp.errors_handler()(metrics_middleware.on_error)
+    db.observer = QueryNames(database, fsm_storage)
+    outbound.observer = observe_telegram_call
+    pipeline.observer = observe_queued_update
+
+# Типы обновлений, которые бот получает от Telegram (inline_query - подсказки мест,
+# chat_member и my_chat_member - для кэша администраторов)
+ALLOWED_UPDATES = ['message', 'callback_query', 'inline_query', 'poll_answer', 'chat_member', 'my_chat_member']
+
+# Данные кнопок навигации по списку мест: сортировка, направление и rowid граничного места
+places_cb = CallbackData('places', 'sort', 'direction', 'rowid')
+
+# Сортировки списка мест и подписи кнопок для переключения на них.
+# score - рейтинг с затуханием: свежие оценки важнее старых
+PLACES_SORTS = {
+    'name': 'Сортировать по названию 🔤',
+    'rating': 'Сортировать по рейтингу ⭐️',
+    'score': 'Сортировать по свежим оценкам 🔥',
+}
+
 
 @dp.message_handler(Command(commands=['start', 'help']))
 async def help_command(message: types.Message) -> None:
@@ -44,21 +136,30 @@ async def help_command(message: types.Message) -> None:
     # Если пользователь отправляет одну из этих команд
     # бот отвечает соответствующим сообщением
 
-    if 'start' in message.text:
-        await bot.send_message(message.chat.id, "Привет, я бот органайзер!\nДоступные команды - /help")
-        await create_db()  # создается база данных при запуске бота
+    command = 'start' if 'start' in message.text else 'help'
+    await read_commands.run((command, message.chat.id), send_help, message.chat.id, command)
+
+    # Удаляем сообщение с командой от пользователя
+    await cleaner.schedule(message.chat.id, [message.message_id])
+
+
+async def send_help(chat_id: int, command: str) -> None:
+    if command == 'start':
+        await outbound.send_message(chat_id, "Привет, я бот органайзер!\nДоступные команды - /help")
     else:
         help_text = "✋ДОСТУПНЫЕ КОМАНДЫ!🤚\n\n" \
             "/add - Добавить новое место\n" \
             "/del - Удалить место (только для администраторов)\n" \
             "/place - Вывести список всех мест\n" \
             "/random - Выбрать случайное место\n" \
-            "/rating - Поставить оценку выбранному месту\n"
+            "/rating - Поставить оценку выбранному месту\n" \
+            "/near - Найти места рядом с геопозицией\n" \
+            "/stats - Статистика опросов чата: какие места и какое время выбирают чаще\n" \
+            "/import - Загрузить места из файла CSV или JSON (только для администраторов)\n" \
+            "/export - Выгрузить все места в CSV (только для администраторов)\n\n" \
+            "Чтобы найти место по части названия, наберите @имя_бота и начало названия\n"
 
-        await message.answer(help_text)
-
-    # Удаляем сообщение с командой от пользователя
-    await bot.delete_message(chat_id=message.chat.id, message_id=message.message_id)
+        await outbound.send_message(chat_id, help_text)
 
 
 @dp.message_handler(Command('add'))
@@ -69,15 +170,13 @@ async def start_cmd_handler(message: types.Message) -> None:
 
     # Проверка на принадлежность к определенному чату
     if message.chat.id not in allowed_chat:
-        bot_message = await message.answer('🚫 Эта команда доступна только для чата: "IT Завтраки, Тбилиси" 🚫')
-        await asyncio.sleep(5)
-        await bot.delete_message(chat_id=message.chat.id, message_id=message.message_id)
-        await bot.delete_message(chat_id=message.chat.id, message_id=bot_message.message_id)
+        bot_message = await outbound.send_message(message.chat.id, '🚫 Эта команда доступна только для чата: "IT Завтраки, Тбилиси" 🚫')
+        await cleaner.schedule(message.chat.id, [message.message_id, bot_message.message_id], delay=5)
 
         return
 
     state = dp.current_state(chat=message.chat.id, user=message.from_user.id)
-    bot_message = await message.answer("Введите название места:👾")
+    bot_message = await outbound.send_message(message.chat.id, "Введите название места:👾")
     await state.update_data(message_id=[message.message_id, bot_message.message_id])  # сохраняем идентификаторы сообщений
     await Place.name.set()
 
@@ -93,73 +192,132 @@ async def process_name(message: types.Message, state: FSMContext):
         data['message_id'].extend([message.message_id])  # сохраняем идентификатор сообщения
 
         # Проверяем наличие места в базе данных
-        async with aiosqlite.connect('places.db') as db:
-            cursor = await db.cursor()
-            await cursor.execute('SELECT name FROM places WHERE name = ?', (data['name'],))
-            result = await cursor.fetchone()
-
-            if result is not None:
-                bot_message = await message.answer("❌ Это место уже есть в базе! ❌")
-                data['message_id'].extend([bot_message.message_id])
-                await state.finish()
-                await asyncio.sleep(1)
-                for msg_id in data['message_id']:
-                    await bot.delete_message(chat_id=message.chat.id, message_id=msg_id)
-            else:
-                bot_message = await message.answer("Введите адрес места:📍")
-                data['message_id'].extend([bot_message.message_id])
-                await Place.next()
+        result = await get_place(data['name'])
+
+        if result is not None:
+            bot_message = await outbound.send_message(message.chat.id, "❌ Это место уже есть в базе! ❌")
+            data['message_id'].extend([bot_message.message_id])
+            await state.finish()
+            await cleaner.schedule(message.chat.id, data['message_id'], delay=1)
+        else:
+            # Предупреждаем о похожих местах, чтобы одно место не добавили дважды с опечаткой
+            bot_message = await outbound.send_message(message.chat.id, "Введите адрес места или отправьте его геопозицию:📍" + suggestions(
+                data['name'], "\n\nПохожие места уже есть в базе: "))
+            data['message_id'].extend([bot_message.message_id])
+            await Place.next()
 
 
-@dp.message_handler(state=Place.address)
+@dp.message_handler(state=Place.address, content_types=[types.ContentType.TEXT, types.ContentType.VENUE,
+                                                        types.ContentType.LOCATION])
 async def process_address(message: types.Message, state: FSMContext):
     # Этот обработчик активируется после ввода имени места и запрашивает адрес места
     # Он также проверяет, существует ли уже это место в базе данных и, если нет, добавляет его
+    # Вместо адреса можно отправить геопозицию или выбрать место на карте:
+    # тогда у места сохраняются координаты для поиска ближайших мест (/near)
+
+    location = (message.location.latitude, message.location.longitude) if message.location else None
+    if message.venue:
+        address = message.venue.address
+    elif location is not None:
+        address = f"{location[0]:.5f}, {location[1]:.5f}"
+    else:
+        address = message.text
 
     async with state.proxy() as data:
-        data['address'] = message.text
+        data['address'] = address
         data['message_id'].extend([message.message_id])  # сохраняем идентификатор сообщения
 
         # Добавляем место в базу данных
-        async with aiosqlite.connect('places.db') as db:
-            cursor = await db.cursor()
-            await cursor.execute('INSERT INTO places (name, address) VALUES (?, ?)', (data['name'], data['address']))
-            await db.commit()
-            bot_message = await message.answer("✅ Место успешно добавлено! ✅")
-            data['message_id'].extend([bot_message.message_id])
+        await add_place(data['name'], data['address'], location)
+        bot_message = await outbound.send_message(message.chat.id, "✅ Место успешно добавлено! ✅")
+        data['message_id'].extend([bot_message.message_id])
 
     await state.finish()
 
     # удаление всех сообщений через 1 сек после добавления места (во избежание захламления)
-    await asyncio.sleep(1)
-    for msg_id in data['message_id']:
-        await bot.delete_message(chat_id=message.chat.id, message_id=msg_id)
+    await cleaner.schedule(message.chat.id, data['message_id'], delay=1)
 
 
 @dp.message_handler(Command('place'))
 async def show_places(message: types.Message):
-    # Обработчик команды '/place', выводит список всех мест из базы данных.
+    # Обработчик команды '/place', выводит первую страницу списка мест из базы данных
+    # с кнопками для перехода между страницами и смены сортировки.
     # Если база данных пуста, то будет отправлено соответствующее сообщение.
 
     # Удаляем сообщение с командой от пользователя (во избежание захламления)
-    await bot.delete_message(chat_id=message.chat.id, message_id=message.message_id)
-
-    # Gодключаемся к бд и выводим список мест через цикл for
-    async with aiosqlite.connect('places.db') as db:
-        cursor = await db.cursor()
-        await cursor.execute('SELECT * FROM places')
-        rows = await cursor.fetchall()
-        if not rows:
-            await message.answer("База данных пуста! 🤷🏽‍♂️")
-        else:
-            places_list = '👉СПИСОК ВСЕХ МЕСТ В БАЗЕ👈\n\n'  # Cтрока для хранения всех мест (для дальнейшего удаления)
-            for row in rows:
-                places_list += f"Место: {row[0]}\n"\
-                               f"Адрес: {row[1]}\n"\
-                               f"Рейтинг: {row[2]:.1f}\n\n"
-            sent_message = await message.answer(places_list)
-            await asyncio.sleep(60)  # список мест будет удален через 60 сек (во избежание захламления)
-            await bot.delete_message(chat_id=message.chat.id, message_id=sent_message.message_id)
+    await cleaner.schedule(message.chat.id, [message.message_id])
+
+    # Если список только что отправлен в чат по другой такой же команде, второй не отправляем
+    await read_commands.run(('place', message.chat.id), send_places_list, message.chat.id)
+
+
+async def send_places_list(chat_id: int) -> None:
+    rows, has_next = await get_places_page()
+    if not rows:
+        await outbound.send_message(chat_id, "База данных пуста! 🤷🏽‍♂️")
+    else:
+        sent_message = await outbound.send_message(chat_id, render_places_page(rows),
+                                                   reply_markup=places_keyboard(rows, 'name', False, has_next))
+        # список мест будет удален через 60 сек (во избежание захламления)
+        await cleaner.schedule(chat_id, [sent_message.message_id], delay=60)
+
+
+@dp.callback_query_handler(places_cb.filter())
+async def show_places_page(callback: types.CallbackQuery, callback_data: dict):
+    # Обработчик кнопок под списком мест: загружает нужную страницу
+    # и редактирует то же сообщение вместо отправки нового
+
+    sort, direction = callback_data['sort'], callback_data['direction']
+    rows, has_more = await get_places_page(sort, direction, int(callback_data['rowid']))
+
+    # Граничное место могли удалить - тогда показываем первую страницу
+    if not rows and direction != 'first':
+        direction = 'first'
+        rows, has_more = await get_places_page(sort)
+
+    if direction == 'first':
+        has_prev, has_next = False, has_more
+    elif direction == 'next':
+        has_prev, has_next = True, has_more
+    else:
+        has_prev, has_next = has_more, True
+
+    text = render_places_page(rows) if rows else "База данных пуста! 🤷🏽‍♂️"
+    try:
+        await outbound.edit_message_text(callback.message.chat.id, callback.message.message_id, text,
+                                         reply_markup=places_keyboard(rows, sort, has_prev, has_next))
+    except exceptions.MessageNotModified:
+        pass
+    await outbound.answer_callback_query(callback.id)
+
+
+def render_places_page(rows: list[tuple]) -> str:
+    # Текст одной страницы списка мест (строки собираются через join, а не +=)
+    return '👉СПИСОК ВСЕХ МЕСТ В БАЗЕ👈\n\n' + ''.join(f"Место: {row[1]}\n"
+                                                      f"Адрес: {row[2]}\n"
+                                                      f"Рейтинг: {row[3]:.1f} (с учетом давности: {row[4]:.1f})\n\n"
+                                                      for row in rows)
+
+
+def places_keyboard(rows: list[tuple], sort: str, has_prev: bool, has_next: bool) -> types.InlineKeyboardMarkup:
+    # Кнопки навигации: назад/вперед относительно первого/последнего места страницы и смена сортировки
+    keyboard = types.InlineKeyboardMarkup()
+
+    navigation = []
+    if has_prev:
+        navigation.append(types.InlineKeyboardButton(
+            '⬅️', callback_data=places_cb.new(sort=sort, direction='prev', rowid=rows[0][0])))
+    if has_next:
+        navigation.append(types.InlineKeyboardButton(
+            '➡️', callback_data=places_cb.new(sort=sort, direction='next', rowid=rows[-1][0])))
+    if navigation:
+        keyboard.row(*navigation)
+
+    for other_sort, label in PLACES_SORTS.items():
+        if other_sort != sort:
+            keyboard.add(types.InlineKeyboardButton(
+                label, callback_data=places_cb.new(sort=other_sort, direction='first', rowid=0)))
+    return keyboard
 
 
 @dp.message_handler(Command('del'), state="*")
@@ -177,20 +335,14 @@ async def start_del_cmd_handler(message: types.Message) -> None:
 
         # Проверяем, является ли пользователь администратором или находится ли его идентификатор в списке разрешенных
         if not await admin_check(message):
-            sent_message = await message.answer("Вы не являетесь администратором или не имеете разрешения! 🤬")
+            sent_message = await outbound.send_message(message.chat.id, "Вы не являетесь администратором или не имеете разрешения! 🤬")
             data['messages_to_delete'].append(sent_message.message_id)
 
-            # Добавляем задержку
-            await asyncio.sleep(10)
-
-            for msg_id in data['messages_to_delete']:
-                try:
-                    await bot.delete_message(chat_id=message.chat.id, message_id=msg_id)
-                except exceptions.MessageCantBeDeleted:
-                    continue
+            # Удаляем сообщения с задержкой
+            await cleaner.schedule(message.chat.id, data['messages_to_delete'], delay=10)
             return
 
-        sent_message = await message.answer("Введите название места, которое нужно удалить:🥸")
+        sent_message = await outbound.send_message(message.chat.id, "Введите название места, которое нужно удалить:🥸")
         data['messages_to_delete'].append(sent_message.message_id)
 
     await Del.name.set()
@@ -207,61 +359,42 @@ async def process_del_name(message: types.Message, state: FSMContext):
         data['messages_to_delete'].append(message.message_id)
 
         if not await admin_check(message):
-            sent_message = await message.answer("Вы не являетесь администратором! 🤬")
+            sent_message = await outbound.send_message(message.chat.id, "Вы не являетесь администратором! 🤬")
             data['messages_to_delete'].append(sent_message.message_id)
 
-            await asyncio.sleep(1)
             # Удаляем сообщения
-            for msg_id in data['messages_to_delete']:
-                try:
-                    await bot.delete_message(chat_id=message.chat.id, message_id=msg_id)
-                except exceptions.MessageCantBeDeleted:
-                    continue
+            await cleaner.schedule(message.chat.id, data['messages_to_delete'], delay=1)
             return
 
         data['name'] = message.text
 
-        async with aiosqlite.connect('places.db') as db:
-            cursor = await db.cursor()
-            await cursor.execute('SELECT * FROM places WHERE name = ?', (data['name'],))
-            result = await cursor.fetchone()
-
-            if result is None:
-                data['attempts'] -= 1
-                if data['attempts'] > 0:
-                    sent_message = await message.answer(f"❌ Место '{data['name']}' не найдено. Попробуйте снова: \
-                                                        попыток осталось {data['attempts']} ❌")
-                    data['messages_to_delete'].append(sent_message.message_id)
-                else:
-                    sent_message = await message.answer("Превышено количество попыток. Операция отменена. 💥")
-                    data['messages_to_delete'].append(sent_message.message_id)
-
-                    # Удаляем сообщения
-                    for msg_id in data['messages_to_delete']:
-                        try:
-                            await bot.delete_message(chat_id=message.chat.id, message_id=msg_id)
-                        except exceptions.MessageCantBeDeleted:
-                            continue
-                    data['attempt_counter'] = 3  # Сбрасываем счетчик попыток
-                    await state.reset_state()  # Сбрасываем состояние
-                return
-
-            await cursor.execute('DELETE FROM places WHERE name = ?', (data['name'],))
-            await db.commit()
-
-            sent_message = await message.answer("✅ Место успешно удалено! ✅")
-            data['messages_to_delete'].append(sent_message.message_id)
+        result = await get_place(data['name'])
+
+        if result is None:
+            data['attempts'] -= 1
+            if data['attempts'] > 0:
+                sent_message = await outbound.send_message(message.chat.id, f"❌ Место '{data['name']}' не найдено. Попробуйте снова: \
+                                                    попыток осталось {data['attempts']} ❌" + suggestions(data['name']))
+                data['messages_to_delete'].append(sent_message.message_id)
+            else:
+                sent_message = await outbound.send_message(message.chat.id, "Превышено количество попыток. Операция отменена. 💥")
+                data['messages_to_delete'].append(sent_message.message_id)
 
-            await asyncio.sleep(1)
+                # Удаляем сообщения
+                await cleaner.schedule(message.chat.id, data['messages_to_delete'])
+                data['attempt_counter'] = 3  # Сбрасываем счетчик попыток
+                await state.reset_state()  # Сбрасываем состояние
+            return
 
-            # Удаляем сообщения после удаления места
-            for msg_id in data['messages_to_delete']:
-                try:
-                    await bot.delete_message(chat_id=message.chat.id, message_id=msg_id)
-                except exceptions.MessageCantBeDeleted:
-                    continue
+        await delete_place(data['name'])
 
-            await state.finish()
+        sent_message = await outbound.send_message(message.chat.id, "✅ Место успешно удалено! ✅")
+        data['messages_to_delete'].append(sent_message.message_id)
+
+        # Удаляем сообщения после удаления места
+        await cleaner.schedule(message.chat.id, data['messages_to_delete'], delay=1)
+
+        await state.finish()
 
 
 @dp.message_handler(Command('rating'))
@@ -272,17 +405,15 @@ async def start_rating_cmd_handler(message: types.Message):
 
     # Проверка на принадлежность к определенному чату
     if message.chat.id not in allowed_chat:
-        bot_message = await message.answer('🚫 Эта команда доступна только для чата: "IT Завтраки, Тбилиси" 🚫')
-        await asyncio.sleep(5)
-        await bot.delete_message(chat_id=message.chat.id, message_id=message.message_id)
-        await bot.delete_message(chat_id=message.chat.id, message_id=bot_message.message_id)
+        bot_message = await outbound.send_message(message.chat.id, '🚫 Эта команда доступна только для чата: "IT Завтраки, Тбилиси" 🚫')
+        await cleaner.schedule(message.chat.id, [message.message_id, bot_message.message_id], delay=5)
 
         return
 
     state = dp.current_state(user=message.from_user.id)
     async with state.proxy() as data:
         data['messages_to_delete'] = [message.message_id]
-        sent_message = await message.answer("Введите название места, которому хотите поставить оценку:🫶🏻")
+        sent_message = await outbound.send_message(message.chat.id, "Введите название места, которому хотите поставить оценку:🫶🏻")
         data['messages_to_delete'].append(sent_message.message_id)
     await Rating.name.set()
 
@@ -304,31 +435,23 @@ async def process_rating_name(message: types.Message, state: FSMContext):
         else:
             data['attempt_counter'] -= 1
 
-        async with aiosqlite.connect('places.db') as db:
-            cursor = await db.cursor()
-            await cursor.execute('SELECT * FROM places WHERE name = ?', (data['name'],))
-            place = await cursor.fetchone()
-            if place is None:
-                if data['attempt_counter'] > 0:
-                    sent_message = await message.answer(f"❌ Такого места не существует в базе данных. \
-                                                        Попробуйте ещё раз. Попыток осталось {data['attempt_counter']} ❌")
-                    data['messages_to_delete'].append(sent_message.message_id)
-                else:
-                    sent_message = await message.answer("Вы исчерпали все попытки...🤦🏼‍♂️")
-                    data['messages_to_delete'].append(sent_message.message_id)
-                    await asyncio.sleep(1)
-                    for msg_id in data['messages_to_delete']:
-                        try:
-                            await bot.delete_message(chat_id=message.chat.id, message_id=msg_id)
-                        except exceptions.MessageCantBeDeleted:
-                            continue
-                    data['attempt_counter'] = 3
-                    await state.reset_state()
-                return
+        place = await get_place(data['name'])
+        if place is None:
+            if data['attempt_counter'] > 0:
+                sent_message = await outbound.send_message(message.chat.id, f"❌ Такого места не существует в базе данных. \
+                                                    Попробуйте ещё раз. Попыток осталось {data['attempt_counter']} ❌" + suggestions(data['name']))
+                data['messages_to_delete'].append(sent_message.message_id)
             else:
-                data['attempt_counter'] = 3
-                sent_message = await message.answer("Введите оценку от 1 до 10: ✨")
+                sent_message = await outbound.send_message(message.chat.id, "Вы исчерпали все попытки...🤦🏼‍♂️")
                 data['messages_to_delete'].append(sent_message.message_id)
+                await cleaner.schedule(message.chat.id, data['messages_to_delete'], delay=1)
+                data['attempt_counter'] = 3
+                await state.reset_state()
+            return
+        else:
+            data['attempt_counter'] = 3
+            sent_message = await outbound.send_message(message.chat.id, "Введите оценку от 1 до 10: ✨")
+            data['messages_to_delete'].append(sent_message.message_id)
         await Rating.next()
 
 
@@ -352,52 +475,28 @@ async def process_rating(message: types.Message, state: FSMContext):
                 raise ValueError()
         except ValueError:
             if data['attempt_counter'] > 0:
-                sent_message = await message.answer(f"❌ Оценка должна быть целым числом от 1 до 10.\
+                sent_message = await outbound.send_message(message.chat.id, f"❌ Оценка должна быть целым числом от 1 до 10.\
                                                     Попробуйте ещё раз. Попыток осталось: {data['attempt_counter']}❌")
                 data['messages_to_delete'].append(sent_message.message_id)
             else:
-                sent_message = await message.answer("Вы исчерпали все попытки...🤦🏼‍♂️")
+                sent_message = await outbound.send_message(message.chat.id, "Вы исчерпали все попытки...🤦🏼‍♂️")
                 data['messages_to_delete'].append(sent_message.message_id)
-                await asyncio.sleep(1)
-                for msg_id in data['messages_to_delete']:
-                    try:
-                        await bot.delete_message(chat_id=message.chat.id, message_id=msg_id)
-                    except exceptions.MessageCantBeDeleted:
-                        continue
+                await cleaner.schedule(message.chat.id, data['messages_to_delete'], delay=1)
                 data['attempt_counter'] = 3
                 await state.reset_state()
             return
 
-        async with aiosqlite.connect('places.db') as db:
-            cursor = await db.cursor()
-            await cursor.execute('SELECT * FROM places WHERE name = ?', (data['name'],))
-            place = await cursor.fetchone()
-            if place is None:
-                sent_message = await message.answer("Такого места не существует в базе данных. Попробуйте ещё раз. 🤷🏽‍♂️")
-                data['messages_to_delete'].append(sent_message.message_id)
-                await asyncio.sleep(1)
-                for msg_id in data['messages_to_delete']:
-                    try:
-                        await bot.delete_message(chat_id=message.chat.id, message_id=msg_id)
-                    except exceptions.MessageCantBeDeleted:
-                        continue
-                await state.reset_state()
-                return
-
-            await cursor.execute('INSERT INTO ratings (name, rating) VALUES (?, ?)', (data['name'], data['rating']))
-            await cursor.execute('SELECT AVG(rating) FROM ratings WHERE name = ?', (data['name'],))
-            avg_rating = await cursor.fetchone()
-            await cursor.execute('UPDATE places SET rating = ? WHERE name = ?', (avg_rating[0], data['name']))
-            await db.commit()
+        # Место могли удалить, пока пользователь вводил оценку - тогда оценка не сохраняется
+        if not await add_rating(data['name'], message.from_user.id, data['rating']):
+            sent_message = await outbound.send_message(message.chat.id, "Такого места не существует в базе данных. Попробуйте ещё раз. 🤷🏽‍♂️")
+            data['messages_to_delete'].append(sent_message.message_id)
+            await cleaner.schedule(message.chat.id, data['messages_to_delete'], delay=1)
+            await state.reset_state()
+            return
 
-        sent_message = await message.answer("✅ Рейтинг успешно обновлен! ✅")
+        sent_message = await outbound.send_message(message.chat.id, "✅ Рейтинг успешно обновлен! ✅")
         data['messages_to_delete'].append(sent_message.message_id)
-        await asyncio.sleep(1)
-        for msg_id in data['messages_to_delete']:
-            try:
-                await bot.delete_message(chat_id=message.chat.id, message_id=msg_id)
-            except exceptions.MessageCantBeDeleted:
-                continue
+        await cleaner.schedule(message.chat.id, data['messages_to_delete'], delay=1)
 
         await state.finish()
 
@@ -409,63 +508,254 @@ async def random_place(message: types.Message):
     # из базы данных
 
     # Удаляем сообщение с командой от пользователя
-    await bot.delete_message(chat_id=message.chat.id, message_id=message.message_id)
-
-    async with aiosqlite.connect('places.db') as db:
-        cursor = await db.cursor()
-        await cursor.execute('SELECT * FROM places')
-        rows = await cursor.fetchall()
-        if rows:
-            random_row = random.choice(rows)
-            answer = await message.answer("👉СЛУЧАЙНОЕ МЕСТО!👈\n\n"
-                                          f"Название: {random_row[0]}\n"
-                                          f"Адрес: {random_row[1]}\n"
-                                          f"Рейтинг: {random_row[2]}\n")
-            await asyncio.sleep(20)
-            await bot.delete_message(chat_id=message.chat.id, message_id=answer.message_id)
-        else:
-            await message.answer("В базе данных пока нет интересных мест. 🤷🏽‍♂️")
+    await cleaner.schedule(message.chat.id, [message.message_id])
 
+    # Несколько /random подряд в одном чате получают одно и то же место
+    await read_commands.run(('random', message.chat.id), send_random_place, message.chat.id)
 
-@dp.poll_answer_handler()
-async def handle_poll_answer(poll_answer: types.PollAnswer):
-    # Ловит ответ на опрос и затем записывает его в базу данных SQLite.
-    # Если такой ответ уже существует, то он просто увеличивает количество голосов.
 
-    async with aiosqlite.connect('places.db') as db:
-        cursor = await db.cursor()
+async def send_random_place(chat_id: int) -> None:
+    # Места с высоким рейтингом с учетом давности оценок выпадают чаще
+    random_row = await get_random_place(chat_id, weighted=True)
+    if random_row is not None:
+        answer = await outbound.send_message(chat_id, "👉СЛУЧАЙНОЕ МЕСТО!👈\n\n"
+                                                      f"Название: {random_row[0]}\n"
+                                                      f"Адрес: {random_row[1]}\n"
+                                                      f"Рейтинг: {random_row[2]}\n")
+        await cleaner.schedule(chat_id, [answer.message_id], delay=20)
+    else:
+        await outbound.send_message(chat_id, "В базе данных пока нет интересных мест. 🤷🏽‍♂️")
+
+
+@dp.message_handler(Command('stats'))
+async def stats_command(message: types.Message):
+    # Обработчик команды /stats: статистика подведенных опросов чата.
+    # Читается из заранее посчитанных таблиц, а не из голосов, поэтому не зависит от длины истории
+
+    # Проверка на принадлежность к определенному чату
+    if message.chat.id not in allowed_chat:
+        bot_message = await outbound.send_message(message.chat.id, '🚫 Эта команда доступна только для чата: "IT Завтраки, Тбилиси" 🚫')
+        await cleaner.schedule(message.chat.id, [message.message_id, bot_message.message_id], delay=5)
+
+        return
+
+    await cleaner.schedule(message.chat.id, [message.message_id])
+    await read_commands.run(('stats', message.chat.id), send_stats, message.chat.id)
+
+
+async def send_stats(chat_id: int) -> None:
+    sent_message = await outbound.send_message(chat_id, render_stats(*await get_poll_stats(chat_id, STATS_LIMIT)))
+    # статистика будет удалена через 60 сек (во избежание захламления)
+    await cleaner.schedule(chat_id, [sent_message.message_id], delay=60)
+
+
+@dp.message_handler(Command('near'))
+async def start_near_cmd_handler(message: types.Message):
+    # Обработчик команды /near: просит отправить геопозицию, рядом с которой искать места
+
+    # Проверка на принадлежность к определенному чату
+    if message.chat.id not in allowed_chat:
+        bot_message = await outbound.send_message(message.chat.id, '🚫 Эта команда доступна только для чата: "IT Завтраки, Тбилиси" 🚫')
+        await cleaner.schedule(message.chat.id, [message.message_id, bot_message.message_id], delay=5)
+
+        return
+
+    state = dp.current_state(chat=message.chat.id, user=message.from_user.id)
+    sent_message = await outbound.send_message(message.chat.id, "Отправьте геопозицию (📎 → Геопозиция), "
+                                                                "и я покажу ближайшие места 🧭")
+    await state.update_data(messages_to_delete=[message.message_id, sent_message.message_id])
+    await Near.location.set()
+
+
+@dp.message_handler(state=Near.location, content_types=[types.ContentType.LOCATION, types.ContentType.VENUE])
+async def process_near_location(message: types.Message, state: FSMContext):
+    # Показывает места с известными координатами, ближайшие к отправленной геопозиции
+
+    data = await state.get_data()
+    await state.finish()
+
+    places = await get_nearest_places(message.location.latitude, message.location.longitude,
+                                      NEAR_PLACES_LIMIT, NEAR_MAX_KM)
+    if places:
+        text = '🧭БЛИЖАЙШИЕ МЕСТА🧭\n\n' + ''.join(f"Место: {place.name} ({format_distance(distance)})\n"
+                                                   f"Адрес: {place.address}\n"
+                                                   f"Рейтинг: {place.rating:.1f}\n\n" for place, distance in places)
+    else:
+        text = f"В радиусе {NEAR_MAX_KM} км нет мест с геопозицией. 🤷🏽‍♂️"
+    sent_message = await outbound.send_message(message.chat.id, text)
+
+    # Команда и геопозиция пользователя удаляются сразу, ответ - через 60 сек (во избежание захламления)
+    await cleaner.schedule(message.chat.id, data.get('messages_to_delete', []) + [message.message_id], delay=1)
+    await cleaner.schedule(message.chat.id, [sent_message.message_id], delay=60)
+
+
+@dp.message_handler(state=Near.location, content_types=types.ContentType.ANY)
+async def cancel_near(message: types.Message, state: FSMContext):
+    # Вместо геопозиции пришло что-то другое - поиск отменяется
+
+    data = await state.get_data()
+    await state.finish()
+    sent_message = await outbound.send_message(message.chat.id, "Нужна геопозиция, поиск отменен. "
+                                                                "Чтобы попробовать снова, отправьте /near")
+    await cleaner.schedule(message.chat.id, data.get('messages_to_delete', []) + [message.message_id,
+                                                                                   sent_message.message_id], delay=5)
+
+
+def format_distance(distance: float) -> str:
+    return f"{distance * 1000:.0f} м" if distance < 1 else f"{distance:.1f} км"
+
+
+@dp.message_handler(Command('import', ignore_caption=False), content_types=types.ContentType.DOCUMENT)
+async def import_places_file(message: types.Message):
+    # Массовый импорт мест из файла CSV (колонки name и address) или JSON (объекты с полями name и address),
+    # отправленного с подписью /import. Доступен только администраторам.
+    # Файл скачивается во временный каталог и читается потоком, места записываются пачками;
+    # место с уже существующим названием не дублируется, у него обновляется адрес
+
+    # Проверка на принадлежность к определенному чату
+    if message.chat.id not in allowed_chat:
+        bot_message = await outbound.send_message(message.chat.id, '🚫 Эта команда доступна только для чата: "IT Завтраки, Тбилиси" 🚫')
+        await cleaner.schedule(message.chat.id, [message.message_id, bot_message.message_id], delay=5)
+
+        return
+
+    if not await admin_check(message):
+        sent_message = await outbound.send_message(message.chat.id, "Вы не являетесь администратором! 🤬")
+        await cleaner.schedule(message.chat.id, [message.message_id, sent_message.message_id], delay=10)
+        return
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = Path(directory) / 'places'
+        file = await outbound.get_file(message.document.file_id)
+        await bot.download_file(file.file_path, destination=path)
+        try:
+            result = await import_places(path, message.document.file_name or '')
+        except TransferError as error:
+            await outbound.send_message(message.chat.id, f"❌ Импорт остановлен: {error}")
+            return
+
+    text = f"✅ Импортировано мест: {result.imported}"
+    if result.skipped:
+        text += f", пропущено записей без названия: {result.skipped}"
+    await outbound.send_message(message.chat.id, text)
+
+
+@dp.message_handler(Command('import'))
+async def import_help(message: types.Message):
+    # /import без файла - подсказка, как импортировать места
+
+    # Проверка на принадлежность к определенному чату
+    if message.chat.id not in allowed_chat:
+        bot_message = await outbound.send_message(message.chat.id, '🚫 Эта команда доступна только для чата: "IT Завтраки, Тбилиси" 🚫')
+        await cleaner.schedule(message.chat.id, [message.message_id, bot_message.message_id], delay=5)
+
+        return
+
+    sent_message = await outbound.send_message(message.chat.id, "Отправьте файл .csv (колонки name, address) "
+                                                                "или .json с подписью /import 📎")
+    await cleaner.schedule(message.chat.id, [message.message_id, sent_message.message_id], delay=20)
+
+
+@dp.message_handler(Command('export'))
+async def export_places_file(message: types.Message):
+    # Выгрузка всех мест в CSV-файл (только для администраторов).
+    # Файл формируется построчно во временном каталоге и отправляется документом
+
+    # Проверка на принадлежность к определенному чату
+    if message.chat.id not in allowed_chat:
+        bot_message = await outbound.send_message(message.chat.id, '🚫 Эта команда доступна только для чата: "IT Завтраки, Тбилиси" 🚫')
+        await cleaner.schedule(message.chat.id, [message.message_id, bot_message.message_id], delay=5)
+
+        return
+
+    if not await admin_check(message):
+        sent_message = await outbound.send_message(message.chat.id, "Вы не являетесь администратором! 🤬")
+        await cleaner.schedule(message.chat.id, [message.message_id, sent_message.message_id], delay=10)
+        return
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = Path(directory) / 'places.csv'
+        exported = await export_places(path)
+        await outbound.send_document(message.chat.id, types.InputFile(path),
+                                     caption=f"📦 Мест в каталоге: {exported}")
+
 
-        for option_id in poll_answer.option_ids:
-            await cursor.execute('INSERT INTO poll_results (poll_id, option_id, votes) VALUES (?, ?, 1) '
-                                 'ON CONFLICT(poll_id, option_id) DO UPDATE SET votes = votes + 1',
-                                 (poll_answer.poll_id, option_id))
+def suggestions(query: str, title: str = "\n\nВозможно, вы имели в виду: ") -> str:
+    # Подсказка с похожими названиями мест, если пользователь ошибся в названии
+    hits = search_places(query, limit=3)
+    if not hits:
+        return ""
+    return title + ", ".join(f"«{hit.name}»" for hit in hits)
 
-        await db.commit()
+
+@dp.inline_handler()
+async def inline_places(inline_query: types.InlineQuery):
+    # Inline-режим (@бот название): подсказывает названия мест по мере ввода.
+    # Выбранная подсказка отправляется в чат названием места, поэтому ей можно
+    # отвечать на вопросы бота в /del и /rating
+
+    hits = search_places(inline_query.query, limit=20) if inline_query.query.strip() else []
+    results = [
+        types.InlineQueryResultArticle(
+            id=str(hit.rowid),
+            title=hit.name,
+            description=hit.address,
+            input_message_content=types.InputTextMessageContent(hit.name),
+        )
+        for hit in hits
+    ]
+    await outbound.answer_inline_query(inline_query.id, results, cache_time=30)
+
+
+@dp.poll_answer_handler()
+async def handle_poll_answer(poll_answer: types.PollAnswer):
+    # Ловит ответ на опрос и передает его в буфер голосов, который периодически
+    # записывает изменения в базу данных SQLite одной транзакцией.
+    # Повторный ответ пользователя заменяет предыдущий, пустой ответ отзывает голос.
+
+    votes.add(poll_answer.poll_id, poll_answer.user.id, poll_answer.option_ids)
 
 
 async def admin_check(message: types.Message):
     # Функция для проверки, является ли пользователь администратором
     # или его ID включен в список разрешенных ID из конфигурационного файла.
 
-    chat_member = await bot.get_chat_member(chat_id=message.chat.id, user_id=message.from_user.id)
-    return chat_member.status in ["creator", "administrator"] or message.from_user.id in config.tg_bot.admin_ids
+    return await admins.is_admin(message.chat.id, message.from_user.id)
+
 
+@dp.chat_member_handler()
+async def handle_chat_member(update: types.ChatMemberUpdated):
+    # Назначение или снятие администратора сразу отражается в кэше администраторов чата
 
-async def send_poll():
+    admins.update_member(update.chat.id, update.new_chat_member.user.id, update.new_chat_member.status)
+
+
+@dp.my_chat_member_handler()
+async def handle_my_chat_member(update: types.ChatMemberUpdated):
+    # Бота удалили из чата или он вышел сам: список администраторов этого чата больше не нужен
+
+    if update.new_chat_member.status in (types.ChatMemberStatus.LEFT, types.ChatMemberStatus.KICKED):
+        admins.invalidate(update.chat.id)
+
+
+async def send_chat_poll(chat_id: int):
     # Функция отвечает за отправку двух опросов в чат Telegram.
     # Один опрос связан с выбором времени и дня недели,
     # а другой опрос связан с выбором места из списка,
-    # который изначально был получен из базы данных.
-    # Результаты опросов сохраняются в базе данных.
-
-    async with aiosqlite.connect('places.db') as db:
-        cursor = await db.cursor()
-        await cursor.execute('SELECT * FROM places ORDER BY RANDOM() LIMIT 7')
-        places = await cursor.fetchall()
-        place_options = [f"Место: {place[0]} | Рейтинг: {place[2]}" for place in places]
-
-    poll_message1 = await bot.send_poll(
-        chat_id=-1001646936147,
+    # который изначально был получен из базы данных (с учетом рейтинга и того,
+    # что предлагалось в прошлых опросах чата, см. get_poll_places).
+    # Опросы сохраняются в базе данных вместе с чатом и типом опроса,
+    # а в чате закрепляется сообщение с их промежуточными итогами.
+    # Запуск по расписанию выполняется не больше одного раза (см. JobScheduler): если бот
+    # остановился посреди рассылки, в чате останется только часть сообщений, и до следующего
+    # запуска по расписанию опросы в этот чат не отправляются.
+
+    places = await get_poll_places(chat_id, POLL_PLACE_OPTIONS)
+    place_options = [place_option(place.name, place.rating) for place in places]
+
+    time_poll = await send_saved_poll(
+        chat_id,
+        POLL_TIME,
         question="Выберите время и день недели:⏰",
         options=["Суббота | 11:00", "Суббота | 12:00", "Суббота | 15:00", "Суббота | 16:00", "Суббота | 17:00",
                  "Воскресенье | 11:00", "Воскресенье | 12:00", "Воскресенье | 15:00", "Воскресенье | 16:00", "Воскресенье | 17:00"],
@@ -473,65 +763,119 @@ async def send_poll():
         allows_multiple_answers=True,
     )
 
-    poll_message2 = await bot.send_poll(
-        chat_id=-1001646936147,
+    place_poll = await send_saved_poll(
+        chat_id,
+        POLL_PLACE,
         question="Выберите место:🍔",
         options=[*place_options],
         is_anonymous=False,
         allows_multiple_answers=True,
     )
 
-    async with aiosqlite.connect('places.db') as db:
-        cursor = await db.cursor()
-
-        await cursor.execute('INSERT INTO poll_data (poll_id, options) VALUES (?, ?)',
-                             (poll_message1.poll.id, json.dumps([option.text for option in poll_message1.poll.options])))
-
-        await cursor.execute('INSERT INTO poll_data (poll_id, options) VALUES (?, ?)',
-                             (poll_message2.poll.id, json.dumps([option.text for option in poll_message2.poll.options])))
-
-        await db.commit()
-
+    await record_poll_places(chat_id, [place.rowid for place in places])
+    await standings.open(chat_id, [time_poll, place_poll])
 
-async def check_poll_results():
-    # Функция просматривает все опросы в базе данных,
-    # выбирает победителя каждого опроса (то есть вариант с наибольшим числом голосов),
-    # формирует текстовое сообщение с результатами и отправляет это сообщение в чат.
-    # Затем все данные об опросах удаляются из базы данных.
 
-    async with aiosqlite.connect('places.db') as db:
-        cursor = await db.cursor()
+async def send_saved_poll(chat_id: int, kind: str, **kwargs) -> tuple[str, str, list[str]]:
+    # Отправляет опрос и сразу сохраняет его в базе, не дожидаясь следующего опроса чата:
+    # за опрос голосуют, как только он появился в чате, и эти голоса сразу идут в промежуточные итоги.
+    # Возвращает (poll_id, kind, options)
+    message = await outbound.send_poll(chat_id, **kwargs)
+    options = [option.text for option in message.poll.options]
+    standings.watch(chat_id, [(message.poll.id, kind, options)])
+    await save_polls([(message.poll.id, chat_id, kind, json.dumps(options), message.message_id)])
+    return message.poll.id, kind, options
 
-        await cursor.execute('SELECT * FROM poll_data')
-        all_polls = await cursor.fetchall()
 
-        results_text = list()
+async def announce_results(chat_id: int):
+    # Функция подсчитывает итоги опросов чата одним запросом
+    # (победитель каждого опроса - вариант с наибольшим числом голосов, при ничьей - несколько)
+    # и в той же транзакции переносит опросы чата в архив и учитывает их в статистике /stats
+    # (голоса, пришедшие после этого, отбрасываются, см. VoteAggregator).
+    # Затем отправляет в чат сообщение с результатами, останавливает опросы в Telegram,
+    # а сообщение с промежуточными итогами в последний раз обновляется и открепляется.
 
-        for poll in all_polls:
-            poll_id, options = poll[0], json.loads(poll[1])
+    # Записываем в базу еще не сохраненные голоса
+    await votes.flush()
 
-            await cursor.execute('SELECT option_id, MAX(votes) FROM poll_results WHERE poll_id = ?', (poll_id,))
-            winner = await cursor.fetchone()
-
-            if winner is not None:
-                winners_text = options[winner[0]]
-                results_text.append(winners_text)
-
-        if len(results_text) >= 2:
-            await bot.send_message(-1001646936147, f'♨️Уважемые причастные! Данные вашей встречи!♨️\n\n'
-                                   f'Когда: {results_text[0]}\n{results_text[1]}')
-        else:
-            await bot.send_message(-1001646936147, 'Нет достаточного количества данных для вывода результатов.')
-
-        # Очищаем данные опроса
-        await cursor.execute('DELETE FROM poll_data')
-        await cursor.execute('DELETE FROM poll_results')
+    # Опросы переносятся в архив до объявления, даже если его не удастся отправить,
+    # чтобы они не смешались с опросами следующей недели
+    results, archived = await archive_polls(chat_id)
+    if not archived:
+        return
+    votes.forget(poll_id for poll_id, _ in archived)
+    try:
+        await outbound.send_message(chat_id, render_announcement(results), priority=PRIORITY_SCHEDULED)
+    finally:
+        await standings.close(chat_id)
+        for poll_id, message_id in archived:
+            if message_id is None:
+                continue
+            try:
+                await outbound.stop_poll(chat_id, message_id)
+            except exceptions.TelegramAPIError as error:
+                # Например, опрос удалили из чата - его голоса все равно больше не учитываются
+                logging.warning('Не удалось остановить опрос %s в чате %s: %s', poll_id, chat_id, error)
+
+
+# Опросы и итоги по расписанию: по умолчанию POLL_CRON и RESULTS_CRON, для отдельных чатов - CHAT_SCHEDULES.
+# Расписания хранятся в базе, пропущенные во время остановки бота запуски выполняются после старта
+scheduler = JobScheduler({'send_poll': send_chat_poll, 'check_poll_results': announce_results},
+                         misfire_grace=config.schedule.misfire_grace, timezone=config.schedule.timezone,
+                         concurrency=POLL_FANOUT_CONCURRENCY)
+for chat_id in target_chat:
+    chat_schedule = config.schedule.chat_schedules.get(chat_id, {})
+    scheduler.add_schedule('send_poll', chat_id, chat_schedule.get('send_poll', config.schedule.poll_cron))
+    scheduler.add_schedule('check_poll_results', chat_id,
+                           chat_schedule.get('check_poll_results', config.schedule.results_cron))
+
+
+async def on_startup(dispatcher: Dispatcher) -> None:
+    # Открываем пул соединений с базой один раз при запуске бота
+    # и применяем миграции схемы до начала обработки обновлений
+    await db.open()
+    await migrate_db(target_chat[0] if target_chat else None)
+    await decay_ratings()
+    await load_places()
+    outbound.start()
+    await cleaner.start()
+    votes.start()
+    await standings.start()
+    storage.start()
+    scheduler.start()
+    rating_decayer.start()
+    pipeline.start()
+    if config.metrics.enabled:
+        await metrics_server.start()
+
+
+async def on_shutdown(dispatcher: Dispatcher) -> None:
+    # Закрываем соединения с базой и хранилище состояний при остановке бота
+    # Сначала дообрабатываем уже принятые обновления
+    await pipeline.stop()
+    logging.info('Статистика очереди обновлений: %s', pipeline.stats())
+    logging.info('Объединено одинаковых команд: %s', read_commands.coalesced)
+    await scheduler.stop()
+    await rating_decayer.stop()
+    logging.info('Статистика кэша мест: %s', catalog.stats())
+    logging.info('Статистика кэша администраторов: %s', admins.stats())
+    await cleaner.stop()
+    await votes.stop()
+    await standings.stop()
+    logging.info('Статистика промежуточных итогов опросов: %s', standings.stats())
+    await dispatcher.storage.close()
+    await dispatcher.storage.wait_closed()
+    logging.info('Статистика очереди запросов к Telegram: %s', outbound.stats())
+    await outbound.stop()
+    await db.close()
+    await metrics_server.stop()
 
-        await db.commit()
 
 if __name__ == '__main__':
-    scheduler = AsyncIOScheduler()
-    scheduler.add_job(send_poll, CronTrigger(day_of_week='mon', hour=12, minute=00))
-    scheduler.add_job(check_poll_results, CronTrigger(day_of_week='fri', hour=12, minute=00))
-    scheduler.start()
-    executor.start_polling(dp, skip_updates=True)
+    if config.webhook.enabled:
+        # Telegram сам присылает обновления на aiohttp-сервер бота
+        start_webhook(dp, config.webhook, pipeline, on_startup=on_startup, on_shutdown=on_shutdown,
+                      allowed_updates=ALLOWED_UPDATES)
+    else:
+        executor.start_polling(dp, skip_updates=True, on_startup=on_startup, on_shutdown=on_shutdown,
+                               allowed_updates=ALLOWED_UPDATES)
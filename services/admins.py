@@ -0,0 +1,76 @@
+import asyncio
+import logging
+import time
+from typing import Iterable
+
+from aiogram import types
+
+from services.outbound import OutboundDispatcher
+
+
+logger = logging.getLogger(__name__)
+
+ADMIN_STATUSES = frozenset({types.ChatMemberStatus.CREATOR, types.ChatMemberStatus.ADMINISTRATOR})
+
+
+class AdminCache:
+    # Кэш списков администраторов чатов для admin_check.
+    # Список чата загружается одним запросом getChatAdministrators и хранится ttl секунд,
+    # а обновления chat_member (назначение и снятие администраторов) меняют его сразу.
+    # Одновременные проверки в чате, которого нет в кэше, ждут один и тот же запрос.
+    # Пользователи из overrides (ADMIN_IDS в конфиге) считаются администраторами в любом чате.
+    # Когда бота удаляют из чата (обновление my_chat_member), список чата забывается.
+
+    def __init__(self, outbound: OutboundDispatcher, overrides: Iterable[int] = (), ttl: float = 300) -> None:
+        self.outbound = outbound
+        self.overrides = frozenset(overrides)
+        self.ttl = ttl
+        self._rosters: dict[int, tuple[set[int], float]] = {}
+        self._loading: dict[int, asyncio.Task] = {}
+        self.hits = 0
+        self.misses = 0
+
+    async def is_admin(self, chat_id: int, user_id: int) -> bool:
+        if user_id in self.overrides:
+            return True
+        if chat_id > 0:
+            # В личном чате администраторов нет: getChatMember вернул бы обычного участника,
+            # поэтому там администраторы только из overrides, без запроса в Telegram
+            return False
+        return user_id in await self.roster(chat_id)
+
+    async def roster(self, chat_id: int) -> set[int]:
+        # ID администраторов чата из кэша или, если срок хранения истек, из Telegram
+        cached = self._rosters.get(chat_id)
+        if cached is not None and cached[1] > time.monotonic():
+            self.hits += 1
+            return cached[0]
+
+        self.misses += 1
+        task = self._loading.get(chat_id)
+        if task is None:
+            task = self._loading[chat_id] = asyncio.create_task(self._load(chat_id))
+            task.add_done_callback(lambda _: self._loading.pop(chat_id, None))
+        return await asyncio.shield(task)
+
+    async def _load(self, chat_id: int) -> set[int]:
+        members = await self.outbound.get_chat_administrators(chat_id)
+        admins = {member.user.id for member in members if member.status in ADMIN_STATUSES}
+        self._rosters[chat_id] = (admins, time.monotonic() + self.ttl)
+        return admins
+
+    def update_member(self, chat_id: int, user_id: int, status: str) -> None:
+        # Изменение прав участника из обновления chat_member
+        cached = self._rosters.get(chat_id)
+        if cached is None:
+            return
+        if status in ADMIN_STATUSES:
+            cached[0].add(user_id)
+        else:
+            cached[0].discard(user_id)
+
+    def invalidate(self, chat_id: int) -> None:
+        self._rosters.pop(chat_id, None)
+
+    def stats(self) -> dict[str, int]:
+        return {'chats': len(self._rosters), 'hits': self.hits, 'misses': self.misses}
@@ -0,0 +1,124 @@
+import asyncio
+import heapq
+import json
+import logging
+import time
+from collections import defaultdict
+from typing import Iterable, Optional
+
+from aiogram import exceptions
+
+from databases.database import add_pending_deletions, get_pending_deletions, remove_pending_deletions
+from services.outbound import OutboundDispatcher
+
+
+logger = logging.getLogger(__name__)
+
+# deleteMessages удаляет до 100 сообщений одного чата за один запрос
+BULK_DELETE_LIMIT = 100
+
+
+class MessageCleaner:
+    # Отложенное удаление сообщений бота и пользователей (во избежание захламления чата).
+    # Обработчики только ставят сообщения в очередь и сразу завершаются, вместо того
+    # чтобы ждать в asyncio.sleep. Очередь - куча (due_at, chat_id, message_id), которая
+    # дублируется в таблицу pending_deletions, поэтому удаления переживают перезапуск бота.
+    # Одна фоновая задача забирает все наступившие удаления и группирует их по чатам, а каждый
+    # чат удаляется пачками через deleteMessages в своей задаче: чат, который ждет RetryAfter,
+    # не задерживает удаления в остальных. Запросы идут через общую очередь OutboundDispatcher
+    # с фоновым приоритетом, поэтому не мешают ответам пользователям и соблюдают лимиты Telegram.
+
+    def __init__(self, outbound: OutboundDispatcher) -> None:
+        self.outbound = outbound
+        self._heap: list[tuple[float, int, int]] = []
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._deleting: set[asyncio.Task] = set()
+        self._bulk_supported = True
+
+    async def start(self) -> None:
+        # Загружаем удаления, не выполненные до перезапуска, и запускаем фоновую задачу
+        for due_at, chat_id, message_id in await get_pending_deletions():
+            heapq.heappush(self._heap, (due_at, chat_id, message_id))
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        # Незавершенные удаления остаются в базе и будут выполнены после запуска
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        for task in self._deleting:
+            task.cancel()
+        if self._deleting:
+            await asyncio.gather(*self._deleting, return_exceptions=True)
+
+    async def schedule(self, chat_id: int, message_ids: Iterable[int], delay: float = 0) -> None:
+        # Ставит сообщения чата в очередь на удаление через delay секунд
+        due_at = time.time() + delay
+        deletions = [(chat_id, message_id, due_at) for message_id in message_ids]
+        if not deletions:
+            return
+
+        await add_pending_deletions(deletions)
+        for chat_id, message_id, due_at in deletions:
+            heapq.heappush(self._heap, (due_at, chat_id, message_id))
+        self._wakeup.set()
+
+    async def _run(self) -> None:
+        while True:
+            self._wakeup.clear()
+            timeout = self._heap[0][0] - time.time() if self._heap else None
+            if timeout is None or timeout > 0:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            # Забираем все удаления, время которых уже наступило, и группируем их по чатам
+            now = time.time()
+            due = defaultdict(list)
+            while self._heap and self._heap[0][0] <= now:
+                _, chat_id, message_id = heapq.heappop(self._heap)
+                due[chat_id].append(message_id)
+
+            for chat_id, message_ids in due.items():
+                task = asyncio.create_task(self._delete_chat(chat_id, message_ids))
+                self._deleting.add(task)
+                task.add_done_callback(self._deleting.discard)
+
+    async def _delete_chat(self, chat_id: int, message_ids: list[int]) -> None:
+        # Удаления чата убираются из базы, как только чат обработан (даже если удалить не удалось)
+        try:
+            await self._delete(chat_id, message_ids)
+        except Exception:
+            logger.exception('Не удалось удалить сообщения в чате %s', chat_id)
+        try:
+            await remove_pending_deletions((chat_id, message_id) for message_id in message_ids)
+        except Exception:
+            logger.exception('Не удалось убрать выполненные удаления чата %s из базы', chat_id)
+
+    async def _delete(self, chat_id: int, message_ids: list[int]) -> None:
+        for start in range(0, len(message_ids), BULK_DELETE_LIMIT):
+            chunk = message_ids[start:start + BULK_DELETE_LIMIT]
+            if self._bulk_supported and len(chunk) > 1:
+                try:
+                    await self.outbound.request(chat_id, 'deleteMessages',
+                                                {'chat_id': chat_id, 'message_ids': json.dumps(chunk)})
+                    continue
+                except exceptions.NotFound:
+                    # Сервер Bot API не знает deleteMessages - дальше удаляем по одному
+                    self._bulk_supported = False
+                except exceptions.BadRequest:
+                    pass
+
+            for message_id in chunk:
+                try:
+                    await self.outbound.request(chat_id, 'deleteMessage', {'chat_id': chat_id, 'message_id': message_id},
+                                                key=('deleteMessage', chat_id, message_id))
+                except (exceptions.MessageCantBeDeleted, exceptions.MessageToDeleteNotFound):
+                    continue
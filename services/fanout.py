@@ -0,0 +1,30 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable, Iterable, Optional
+
+
+logger = logging.getLogger(__name__)
+
+
+async def fan_out(chat_ids: Iterable[int], job: Callable[[int], Awaitable[None]],
+                  concurrency: int = 20, name: str = 'job') -> dict[int, Optional[BaseException]]:
+    # Выполняет job для каждого чата, одновременно не больше concurrency чатов.
+    # Ошибка в одном чате (бот удален из чата, чат не найден и т.п.) записывается в лог
+    # и не мешает остальным. Возвращает для каждого чата исключение или None, если все прошло успешно.
+    # Частоту запросов к Telegram ограничивает OutboundDispatcher, здесь ограничивается
+    # только количество одновременно выполняемых заданий.
+    semaphore = asyncio.Semaphore(concurrency)
+    errors: dict[int, Optional[BaseException]] = {}
+
+    async def run(chat_id: int) -> None:
+        async with semaphore:
+            try:
+                await job(chat_id)
+            except Exception as error:
+                logger.exception('Задание %s не выполнено для чата %s', name, chat_id)
+                errors[chat_id] = error
+            else:
+                errors[chat_id] = None
+
+    await asyncio.gather(*(run(chat_id) for chat_id in dict.fromkeys(chat_ids)))
+    return errors
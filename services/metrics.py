@@ -0,0 +1,290 @@
+import asyncio
+import bisect
+import logging
+import time
+from collections import Counter as StackCounter
+from contextvars import ContextVar
+from typing import Optional
+
+from aiogram.dispatcher.handler import current_handler
+from aiogram.dispatcher.middlewares import BaseMiddleware
+from aiohttp import web
+
+
+logger = logging.getLogger(__name__)
+
+# Границы корзин гистограмм задержек в секундах
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def format_labels(names: tuple[str, ...], values: tuple[str, ...], extra: str = '') -> str:
+    pairs = [f'{name}="{escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labels: tuple[str, ...] = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self._values: dict[tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def get(self, *labels: str) -> float:
+        return self._values.get(labels, 0)
+
+    def render(self) -> list[str]:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} counter']
+        for labels, value in sorted(self._values.items()):
+            lines.append(f'{self.name}{format_labels(self.labels, labels)} {value}')
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, labels: tuple[str, ...] = (),
+                 buckets: tuple[float, ...] = LATENCY_BUCKETS) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self.buckets = buckets
+        # Для каждого набора меток: количество наблюдений в каждой корзине, сумма и общее количество
+        self._values: dict[tuple[str, ...], list] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        state = self._values.get(labels)
+        if state is None:
+            state = self._values[labels] = [[0] * len(self.buckets), 0.0, 0]
+        index = bisect.bisect_left(self.buckets, value)
+        if index < len(self.buckets):
+            state[0][index] += 1
+        state[1] += value
+        state[2] += 1
+
+    def render(self) -> list[str]:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        for labels, (counts, total, count) in sorted(self._values.items()):
+            cumulative = 0
+            for bound, bucket in zip(self.buckets, counts):
+                cumulative += bucket
+                bucket_labels = format_labels(self.labels, labels, f'le="{bound}"')
+                lines.append(f'{self.name}_bucket{bucket_labels} {cumulative}')
+            bucket_labels = format_labels(self.labels, labels, 'le="+Inf"')
+            lines.append(f'{self.name}_bucket{bucket_labels} {count}')
+            lines.append(f'{self.name}_sum{format_labels(self.labels, labels)} {total}')
+            lines.append(f'{self.name}_count{format_labels(self.labels, labels)} {count}')
+        return lines
+
+
+class Registry:
+    def __init__(self) -> None:
+        self._metrics: list = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        return '\n'.join(line for metric in self._metrics for line in metric.render()) + '\n'
+
+
+registry = Registry()
+
+UPDATE_SECONDS = registry.register(Histogram(
+    'bot_update_duration_seconds', 'Время обработки обновления', ('handler',)))
+UPDATE_ERRORS = registry.register(Counter(
+    'bot_update_errors_total', 'Обновления, обработка которых завершилась исключением', ('handler', 'error')))
+UPDATE_QUEUE_SECONDS = registry.register(Histogram(
+    'bot_update_queue_seconds', 'Сколько обновление ждало в очереди обработки (UpdatePipeline)'))
+SLOW_UPDATES = registry.register(Counter(
+    'bot_slow_updates_total', 'Обновления, обрабатывавшиеся дольше порога профилировщика', ('handler',)))
+QUERY_SECONDS = registry.register(Histogram(
+    'bot_db_query_duration_seconds', 'Время выполнения SQL-запроса', ('statement',)))
+TELEGRAM_CALLS = registry.register(Histogram(
+    'bot_telegram_call_duration_seconds', 'Время запроса к Telegram Bot API', ('method',)))
+TELEGRAM_ERRORS = registry.register(Counter(
+    'bot_telegram_errors_total', 'Ошибки запросов к Telegram Bot API', ('method', 'error')))
+
+
+class QueryNames:
+    # Наблюдатель для ConnectionPool.observer: запросы подписываются именами констант,
+    # в которых они объявлены (SELECT_PLACE, UPSERT_RATING, ...), а не текстом SQL.
+    # Запросы без константы подписываются началом текста, чтобы число меток оставалось небольшим
+
+    def __init__(self, *modules) -> None:
+        self._names: dict[str, str] = {}
+        for module in modules:
+            self.register(module)
+
+    def register(self, module) -> None:
+        for name, value in vars(module).items():
+            if not name.isupper():
+                continue
+            if isinstance(value, str):
+                self._names.setdefault(value, name)
+            elif isinstance(value, dict):
+                for key, sql in value.items():
+                    if isinstance(sql, str):
+                        label = ','.join(key) if isinstance(key, tuple) else key
+                        self._names.setdefault(sql, f'{name}[{label}]')
+
+    def name(self, sql: str) -> str:
+        name = self._names.get(sql)
+        if name is None:
+            name = ' '.join(sql.split())[:40]
+        return name
+
+    def __call__(self, sql: str, seconds: float) -> None:
+        QUERY_SECONDS.observe(seconds, self.name(sql))
+
+
+def observe_queued_update(update, waited: float, seconds: float) -> None:
+    # Наблюдатель для UpdatePipeline.observer (время обработки учитывает MetricsMiddleware)
+    UPDATE_QUEUE_SECONDS.observe(waited)
+
+
+def observe_telegram_call(method: str, seconds: float, error: Optional[BaseException]) -> None:
+    TELEGRAM_CALLS.observe(seconds, method)
+    if error is not None:
+        TELEGRAM_ERRORS.inc(method, type(error).__name__)
+
+
+# Сведения об обновлении, которое обрабатывается в текущей задаче
+_update_started: ContextVar[float] = ContextVar('update_started')
+_update_handler: ContextVar[str] = ContextVar('update_handler')
+_update_error: ContextVar[Optional[str]] = ContextVar('update_error', default=None)
+_update_watch: ContextVar[Optional['SlowUpdateWatch']] = ContextVar('update_watch', default=None)
+
+
+def await_stack(coro) -> list:
+    # Кадры цепочки await приостановленной корутины, от внешней к самой вложенной.
+    # Task.get_stack для корутины возвращает только ее собственный кадр
+    frames = []
+    while coro is not None:
+        frame = getattr(coro, 'cr_frame', None) or getattr(coro, 'gi_frame', None)
+        if frame is None:
+            break
+        frames.append(frame)
+        coro = getattr(coro, 'cr_await', None) or getattr(coro, 'gi_yieldfrom', None)
+    return frames
+
+
+class SlowUpdateWatch:
+    # Если обновление обрабатывается дольше порога, раз в interval секунд записывает,
+    # где сейчас находится задача обработчика (цепочку await), а по завершении пишет в лог
+    # самые частые стеки. Выборки делаются в самом цикле событий, поэтому их задержка
+    # относительно interval тоже показывает, что цикл был занят чем-то другим
+
+    def __init__(self, profiler: 'SlowUpdateProfiler', task: asyncio.Task) -> None:
+        self.profiler = profiler
+        self.task = task
+        self.samples: StackCounter = StackCounter()
+        self._timer = asyncio.get_running_loop().call_later(profiler.threshold, self._sample)
+
+    def _sample(self) -> None:
+        if self.task.done():
+            return
+        frames = await_stack(self.task.get_coro())[-self.profiler.depth:]
+        stack = ' -> '.join(f'{frame.f_code.co_name} ({frame.f_code.co_filename.rsplit("/", 1)[-1]}:{frame.f_lineno})'
+                            for frame in frames)
+        self.samples[stack] += 1
+        self._timer = asyncio.get_running_loop().call_later(self.profiler.interval, self._sample)
+
+    def finish(self, handler: str, seconds: float) -> None:
+        self._timer.cancel()
+        if not self.samples:
+            return
+        SLOW_UPDATES.inc(handler)
+        top = '\n'.join(f'  {count:4} x {stack}' for stack, count in self.samples.most_common(self.profiler.top))
+        logger.warning('Медленное обновление: %s обрабатывалось %.0f мс, выборки стека:\n%s',
+                       handler, seconds * 1000, top)
+
+
+class SlowUpdateProfiler:
+    # Выборочный профилировщик медленных обновлений (включается в конфиге, см. MetricsConfig)
+
+    def __init__(self, threshold: float = 1.0, interval: float = 0.05, depth: int = 20, top: int = 5) -> None:
+        self.threshold = threshold
+        self.interval = interval
+        self.depth = depth
+        self.top = top
+
+    def watch(self) -> SlowUpdateWatch:
+        return SlowUpdateWatch(self, asyncio.current_task())
+
+
+class MetricsMiddleware(BaseMiddleware):
+    # Время обработки каждого обновления с разбивкой по обработчикам (show_places, process_rating, ...).
+    # Обновления, для которых не нашлось обработчика, учитываются как "unhandled"
+
+    def __init__(self, profiler: Optional[SlowUpdateProfiler] = None) -> None:
+        super().__init__()
+        self.profiler = profiler
+
+    async def trigger(self, action, args):
+        if action == 'pre_process_update':
+            _update_started.set(time.perf_counter())
+            _update_handler.set('unhandled')
+            _update_error.set(None)
+            if self.profiler is not None:
+                _update_watch.set(self.profiler.watch())
+        elif action.startswith('process_') and action not in ('process_update', 'process_error'):
+            # Обработчик уже выбран (фильтры пройдены) и сейчас будет вызван
+            _update_handler.set(current_handler.get().__name__)
+        elif action == 'post_process_update':
+            self.finish()
+
+    def finish(self) -> None:
+        started = _update_started.get(None)
+        if started is None:
+            return
+        seconds = time.perf_counter() - started
+        handler = _update_handler.get()
+        UPDATE_SECONDS.observe(seconds, handler)
+        error = _update_error.get()
+        if error is not None:
+            UPDATE_ERRORS.inc(handler, error)
+        watch = _update_watch.get()
+        if watch is not None:
+            watch.finish(handler, seconds)
+            _update_watch.set(None)
+
+    async def on_error(self, update, error: BaseException) -> bool:
+        # Обработчик ошибок диспетчера (dp.errors_handler): запоминает ошибку для finish
+        # и возвращает False, чтобы исключение обработалось дальше как обычно
+        _update_error.set(type(error).__name__)
+        return False
+
+
+async def metrics_handler(_: web.Request) -> web.Response:
+    return web.Response(text=registry.render(), content_type='text/plain', charset='utf-8',
+                        headers={'X-Content-Type-Options': 'nosniff'})
+
+
+class MetricsServer:
+    # Небольшой HTTP-сервер с метриками в текстовом формате Prometheus (GET /metrics)
+
+    def __init__(self, host: str, port: int) -> None:
+        self.host = host
+        self.port = port
+        self._runner: Optional[web.AppRunner] = None
+
+    async def start(self) -> None:
+        app = web.Application()
+        app.router.add_get('/metrics', metrics_handler)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        logger.info('Метрики доступны на http://%s:%s/metrics', self.host, self.port)
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
@@ -0,0 +1,377 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from typing import Any, Awaitable, Callable, Hashable, Optional
+
+from aiogram import Bot, exceptions, types
+
+
+logger = logging.getLogger(__name__)
+
+# Приоритеты запросов: чем меньше число, тем раньше запрос уйдет в Telegram
+PRIORITY_USER = 0          # ответы пользователям
+PRIORITY_SCHEDULED = 5     # опросы и объявления по расписанию
+PRIORITY_BACKGROUND = 10   # удаление сообщений и прочая фоновая работа
+
+# Методы, которые отправляют в чат новые сообщения: только их Telegram ограничивает по чатам
+# (около 1 в секунду в личный чат и 20 в минуту в группу). Правки, удаление, закрепление и чтение
+# ограничены только общим лимитом бота и паузами после RetryAfter
+MESSAGE_METHODS = frozenset({
+    'sendMessage', 'sendPoll', 'sendDocument', 'sendPhoto', 'sendVideo', 'sendAudio', 'sendVoice',
+    'sendAnimation', 'sendSticker', 'sendLocation', 'sendVenue', 'sendContact', 'sendDice',
+    'sendMediaGroup', 'forwardMessage', 'forwardMessages', 'copyMessage', 'copyMessages',
+})
+
+
+class TokenBucket:
+    # Ограничитель частоты запросов: rate запросов в секунду, не больше burst подряд
+    __slots__ = ('rate', 'burst', 'tokens', 'updated', 'blocked_until')
+
+    def __init__(self, rate: float, burst: float) -> None:
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    def delay(self, now: float) -> float:
+        # Через сколько секунд можно будет выполнить запрос (0 - прямо сейчас)
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        wait = 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+        return max(wait, self.blocked_until - now)
+
+    def take(self) -> None:
+        self.tokens -= 1
+
+    def block(self, now: float, seconds: float) -> None:
+        # Telegram попросил подождать (RetryAfter)
+        self.blocked_until = max(self.blocked_until, now + seconds)
+
+
+class OutboundCall:
+    __slots__ = ('chat_id', 'factory', 'priority', 'order', 'key', 'method', 'future', 'enqueued_at')
+
+    def __init__(self, chat_id: Optional[int], factory: Callable[[], Awaitable[Any]], priority: int, order: int,
+                 key: Optional[Hashable], method: str) -> None:
+        self.chat_id = chat_id
+        self.factory = factory
+        self.priority = priority
+        # Порядковый номер запроса: при равном приоритете раньше уходит тот, что поставлен раньше
+        self.order = order
+        self.key = key
+        self.method = method
+        self.future: asyncio.Future = asyncio.get_running_loop().create_future()
+        self.enqueued_at = time.monotonic()
+
+    def entry(self) -> tuple[int, int, 'OutboundCall']:
+        return self.priority, self.order, self
+
+
+class OutboundDispatcher:
+    # Единая очередь исходящих запросов к Telegram Bot API.
+    # Запросы выполняются в порядке приоритета (ответы пользователям раньше фонового удаления
+    # сообщений), с общим ограничением частоты и отдельным ограничением для каждого чата.
+    # В одном чате одновременно выполняется не больше одного запроса, поэтому сообщения
+    # приходят в том порядке, в котором были отправлены. После RetryAfter чат (или весь бот)
+    # ставится на паузу, а запрос возвращается в очередь. Одинаковые запросы (с одним key),
+    # еще не отправленные в Telegram, объединяются в один.
+    # Лимит на чат: в личных чатах chat_rate сообщений в секунду, в группах (отрицательный chat_id)
+    # group_rate - Telegram разрешает боту около 20 сообщений в минуту в одну группу.
+    # Лимит чата расходуют только методы из MESSAGE_METHODS, а пауза после RetryAfter - для всех запросов чата.
+    # Запросы каждого чата ждут в своей очереди, а в общей куче лежит только первый запрос
+    # каждого чата, который можно выполнить (чат не занят и не ждет своего лимита), и запросы
+    # без чата. Поэтому выбор следующего запроса стоит O(log n), сколько бы запросов ни ждало
+    # в занятых и притормозивших чатах.
+
+    def __init__(self, bot: Bot, global_rate: float = 30, chat_rate: float = 1, chat_burst: float = 5,
+                 group_rate: float = 20 / 60, group_burst: float = 3) -> None:
+        self.bot = bot
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.group_rate = group_rate
+        self.group_burst = group_burst
+        # Общий лимит без запаса: при запасе в global_rate запросов за первую секунду
+        # после простоя ушло бы вдвое больше запросов, чем разрешает Telegram
+        self._global = TokenBucket(global_rate, 1)
+        self._chats: dict[int, TokenBucket] = {}
+        self._busy: set[int] = set()
+        # Общая куча (priority, order, call) и очереди-кучи запросов каждого чата
+        self._heap: list[tuple[int, int, OutboundCall]] = []
+        self._chat_calls: dict[int, list[tuple[int, int, OutboundCall]]] = {}
+        # Чаты, ожидающие своего лимита, и куча (когда чат освободится, chat_id)
+        self._throttled: set[int] = set()
+        self._timers: list[tuple[float, int]] = []
+        self._depth = 0
+        self._queued: dict[Hashable, OutboundCall] = {}
+        self._counter = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._in_flight: set[asyncio.Task] = set()
+        self.sent = 0
+        self.retries = 0
+        self.coalesced = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        # Необязательный наблюдатель observer(method, seconds, error) за каждым запросом к Telegram
+        # (error - исключение или None), через него main.py собирает метрики
+        self.observer: Optional[Callable[[str, float, Optional[BaseException]], None]] = None
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._in_flight:
+            await asyncio.gather(*self._in_flight, return_exceptions=True)
+        for _, _, call in self._heap:
+            call.future.cancel()
+        for calls in self._chat_calls.values():
+            for _, _, call in calls:
+                call.future.cancel()
+        self._heap.clear()
+        self._chat_calls.clear()
+        self._throttled.clear()
+        self._timers.clear()
+        self._depth = 0
+        self._queued.clear()
+
+    def stats(self) -> dict[str, float]:
+        return {
+            'queue_depth': self._depth,
+            'in_flight': len(self._in_flight),
+            'sent': self.sent,
+            'retries': self.retries,
+            'coalesced': self.coalesced,
+            'wait_avg_ms': self.wait_total / self.sent * 1000 if self.sent else 0.0,
+            'wait_max_ms': self.wait_max * 1000,
+        }
+
+    def submit(self, chat_id: Optional[int], factory: Callable[[], Awaitable[Any]],
+               priority: int = PRIORITY_USER, key: Optional[Hashable] = None, replace: bool = False,
+               method: str = 'unknown') -> asyncio.Future:
+        # Ставит запрос в очередь и возвращает future с его результатом.
+        # factory - функция без аргументов, создающая корутину запроса (например, partial(bot.send_message, ...)).
+        # Если запрос с таким же key еще ждет в очереди, новый не добавляется: возвращается future
+        # уже поставленного запроса, а при replace=True он будет выполнен с новым factory.
+        # method - название метода Bot API для метрик
+        if key is not None and key in self._queued:
+            queued = self._queued[key]
+            if replace:
+                queued.factory = factory
+            self.coalesced += 1
+            return queued.future
+
+        call = OutboundCall(chat_id, factory, priority, next(self._counter), key, method)
+        if key is not None:
+            self._queued[key] = call
+        self._push(call)
+        return call.future
+
+    def _push(self, call: OutboundCall) -> None:
+        self._depth += 1
+        if call.chat_id is None:
+            heapq.heappush(self._heap, call.entry())
+        else:
+            calls = self._chat_calls.setdefault(call.chat_id, [])
+            heapq.heappush(calls, call.entry())
+            if calls[0][2] is call:
+                self._activate(call.chat_id)
+        self._wakeup.set()
+
+    def _activate(self, chat_id: int) -> None:
+        # Первый запрос чата попадает в общую кучу, если чат свободен и не ждет лимита.
+        # Устаревшие записи (запрос уже не первый или чат занят) отбрасываются при выборе
+        calls = self._chat_calls.get(chat_id)
+        if calls and chat_id not in self._busy and chat_id not in self._throttled:
+            heapq.heappush(self._heap, calls[0])
+
+    def _bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if chat_id < 0:
+                bucket = TokenBucket(self.group_rate, self.group_burst)
+            else:
+                bucket = TokenBucket(self.chat_rate, self.chat_burst)
+            self._chats[chat_id] = bucket
+        return bucket
+
+    async def _run(self) -> None:
+        while True:
+            self._wakeup.clear()
+            timeout = self._dispatch_ready() if self._heap or self._timers else None
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    def _dispatch_ready(self) -> Optional[float]:
+        # Запускает все запросы, которые можно выполнить сейчас, и возвращает,
+        # через сколько секунд освободится следующий (None - ждать нового запроса)
+        now = time.monotonic()
+        while self._timers and self._timers[0][0] <= now:
+            _, chat_id = heapq.heappop(self._timers)
+            self._throttled.discard(chat_id)
+            self._activate(chat_id)
+
+        while self._heap:
+            call = self._heap[0][2]
+            chat_id = call.chat_id
+            if chat_id is not None:
+                calls = self._chat_calls.get(chat_id)
+                if chat_id in self._busy or chat_id in self._throttled or not calls or calls[0][2] is not call:
+                    # Устаревшая запись: чат освободится или дождется лимита и снова попадет в кучу
+                    heapq.heappop(self._heap)
+                    continue
+
+            global_delay = self._global.delay(now)
+            if global_delay > 0:
+                return global_delay if not self._timers else min(global_delay, self._timers[0][0] - now)
+            heapq.heappop(self._heap)
+
+            if chat_id is not None:
+                bucket = self._bucket(chat_id)
+                counted = call.method in MESSAGE_METHODS
+                chat_delay = bucket.delay(now) if counted else bucket.blocked_until - now
+                if chat_delay > 0:
+                    # Чат ждет своего лимита, его запросы остаются в очереди чата
+                    self._throttled.add(chat_id)
+                    heapq.heappush(self._timers, (now + chat_delay, chat_id))
+                    continue
+                if counted:
+                    bucket.take()
+                self._busy.add(chat_id)
+                heapq.heappop(calls)
+                if not calls:
+                    del self._chat_calls[chat_id]
+
+            self._depth -= 1
+            self._global.take()
+            if call.key is not None and self._queued.get(call.key) is call:
+                del self._queued[call.key]
+            task = asyncio.create_task(self._execute(call, now))
+            self._in_flight.add(task)
+            task.add_done_callback(self._in_flight.discard)
+
+        return self._timers[0][0] - now if self._timers else None
+
+    async def _execute(self, call: OutboundCall, started: float) -> None:
+        sent_at = time.monotonic()
+        try:
+            result = await call.factory()
+        except exceptions.RetryAfter as error:
+            self._observe(call.method, sent_at, error)
+            self.retries += 1
+            bucket = self._bucket(call.chat_id) if call.chat_id is not None else self._global
+            bucket.block(time.monotonic(), error.timeout)
+            logger.warning('Flood control для чата %s, ждем %s с', call.chat_id, error.timeout)
+            self._requeue(call)
+        except Exception as error:
+            self._observe(call.method, sent_at, error)
+            if not call.future.done():
+                call.future.set_exception(error)
+        else:
+            self._observe(call.method, sent_at, None)
+            wait = started - call.enqueued_at
+            self.sent += 1
+            self.wait_total += wait
+            self.wait_max = max(self.wait_max, wait)
+            if not call.future.done():
+                call.future.set_result(result)
+        finally:
+            if call.chat_id is not None:
+                self._busy.discard(call.chat_id)
+                self._activate(call.chat_id)
+            self._wakeup.set()
+
+    def _requeue(self, call: OutboundCall) -> None:
+        # Запрос возвращается в очередь на прежнее место и снова регистрируется под своим key.
+        # Если пока он выполнялся, в очередь встал такой же запрос (например, более новая правка
+        # того же сообщения), выполняется только новый, а результат получат оба
+        queued = self._queued.get(call.key) if call.key is not None else None
+        if queued is None:
+            if call.key is not None:
+                self._queued[call.key] = call
+            self._push(call)
+            return
+        self.coalesced += 1
+        queued.future.add_done_callback(lambda future: self._resolve(call.future, future))
+
+    @staticmethod
+    def _resolve(target: asyncio.Future, source: asyncio.Future) -> None:
+        if target.done():
+            return
+        if source.cancelled():
+            target.cancel()
+        elif source.exception() is not None:
+            target.set_exception(source.exception())
+        else:
+            target.set_result(source.result())
+
+    def _observe(self, method: str, sent_at: float, error: Optional[BaseException]) -> None:
+        if self.observer is not None:
+            self.observer(method, time.monotonic() - sent_at, error)
+
+    # Обертки над методами бота, которые использует main.py
+
+    async def send_message(self, chat_id: int, text: str, priority: int = PRIORITY_USER, **kwargs) -> types.Message:
+        return await self.submit(chat_id, lambda: self.bot.send_message(chat_id, text, **kwargs), priority,
+                                 method='sendMessage')
+
+    async def edit_message_text(self, chat_id: int, message_id: int, text: str,
+                                priority: int = PRIORITY_USER, **kwargs) -> types.Message:
+        # Несколько правок одного сообщения, ожидающих в очереди, объединяются в последнюю
+        return await self.submit(
+            chat_id, lambda: self.bot.edit_message_text(text, chat_id=chat_id, message_id=message_id, **kwargs),
+            priority, key=('editMessageText', chat_id, message_id), replace=True, method='editMessageText')
+
+    async def pin_chat_message(self, chat_id: int, message_id: int, priority: int = PRIORITY_SCHEDULED,
+                               **kwargs) -> bool:
+        return await self.submit(chat_id, lambda: self.bot.pin_chat_message(chat_id, message_id, **kwargs), priority,
+                                 method='pinChatMessage')
+
+    async def unpin_chat_message(self, chat_id: int, message_id: int, priority: int = PRIORITY_BACKGROUND) -> bool:
+        return await self.submit(chat_id, lambda: self.bot.unpin_chat_message(chat_id, message_id), priority,
+                                 method='unpinChatMessage')
+
+    async def send_poll(self, chat_id: int, priority: int = PRIORITY_SCHEDULED, **kwargs) -> types.Message:
+        return await self.submit(chat_id, lambda: self.bot.send_poll(chat_id=chat_id, **kwargs), priority,
+                                 method='sendPoll')
+
+    async def stop_poll(self, chat_id: int, message_id: int, priority: int = PRIORITY_SCHEDULED) -> types.Poll:
+        return await self.submit(chat_id, lambda: self.bot.stop_poll(chat_id, message_id), priority,
+                                 key=('stopPoll', chat_id, message_id), method='stopPoll')
+
+    async def get_chat_administrators(self, chat_id: int) -> list[types.ChatMember]:
+        return await self.submit(chat_id, lambda: self.bot.get_chat_administrators(chat_id),
+                                 key=('getChatAdministrators', chat_id), method='getChatAdministrators')
+
+    async def send_document(self, chat_id: int, document: types.InputFile, priority: int = PRIORITY_USER,
+                            **kwargs) -> types.Message:
+        return await self.submit(chat_id, lambda: self.bot.send_document(chat_id, document, **kwargs), priority,
+                                 method='sendDocument')
+
+    async def get_file(self, file_id: str) -> types.File:
+        return await self.submit(None, lambda: self.bot.get_file(file_id), method='getFile')
+
+    async def answer_callback_query(self, callback_query_id: str, **kwargs) -> bool:
+        return await self.submit(None, lambda: self.bot.answer_callback_query(callback_query_id, **kwargs),
+                                 method='answerCallbackQuery')
+
+    async def answer_inline_query(self, inline_query_id: str, results: list, **kwargs) -> bool:
+        return await self.submit(None, lambda: self.bot.answer_inline_query(inline_query_id, results, **kwargs),
+                                 method='answerInlineQuery')
+
+    async def request(self, chat_id: int, method: str, payload: dict,
+                      priority: int = PRIORITY_BACKGROUND, key: Optional[Hashable] = None) -> Any:
+        # Произвольный метод Bot API (например, deleteMessages, которого нет в aiogram 2)
+        return await self.submit(chat_id, lambda: self.bot.request(method, payload), priority, key,
+                                 method=method)
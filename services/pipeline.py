@@ -0,0 +1,242 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Hashable, Optional
+
+from aiogram import Dispatcher, types
+
+
+logger = logging.getLogger(__name__)
+
+# Ключ очереди обновлений: (чат, пользователь)
+UpdateKey = tuple[Optional[int], int]
+
+
+def update_key(update: types.Update) -> UpdateKey:
+    # Обновления одного пользователя в одном чате обрабатываются строго по очереди.
+    # Для inline-запросов и ответов на опросы чата нет - чатом считается сам пользователь
+    message = (update.message or update.edited_message or update.channel_post or update.edited_channel_post
+               or (update.callback_query and update.callback_query.message))
+    user = (update.message or update.edited_message or update.callback_query or update.inline_query
+            or update.chosen_inline_result or update.chat_member or update.my_chat_member)
+    user_id = user.from_user.id if user is not None and user.from_user is not None else None
+    if update.poll_answer is not None:
+        user_id = update.poll_answer.user.id
+    if message is not None:
+        return message.chat.id, user_id or 0
+    if update.chat_member or update.my_chat_member:
+        return (update.chat_member or update.my_chat_member).chat.id, user_id or 0
+    if user_id is not None:
+        return user_id, user_id
+    # Остальные обновления (например, poll) друг от друга не зависят
+    return None, update.update_id
+
+
+class UpdatePipeline:
+    # Очередь обработки входящих обновлений вместо неограниченного числа задач,
+    # которые aiogram создает при polling (и вебхук - на каждый запрос).
+    # - У каждой пары (чат, пользователь) своя очередь: ее обновления обрабатываются по одному и по порядку,
+    #   поэтому быстрые сообщения пользователя не гоняются друг с другом за состояние диалога /add, /del, /rating.
+    # - Обновления обрабатывают workers задач-обработчиков. Готовые очереди берутся по кругу, по одному
+    #   обновлению за раз, поэтому длинная очередь одного пользователя не задерживает остальных,
+    #   а одновременно обновления одного чата занимают не больше chat_concurrency обработчиков
+    #   (медленный из-за лимитов Telegram чат не забирает все обработчики себе).
+    # - Если в очереди пользователя уже queue_size обновлений, новые отбрасываются (с записью в лог).
+    #   Если всего ждет max_pending обновлений, submit ждет, пока место освободится: вебхук
+    #   не отвечает Telegram, а при polling новые обновления не запрашиваются и остаются в Telegram.
+
+    def __init__(self, dispatcher: Dispatcher, workers: int = 64, chat_concurrency: int = 8,
+                 queue_size: int = 100, max_pending: int = 10_000) -> None:
+        self.dispatcher = dispatcher
+        self.workers = workers
+        self.chat_concurrency = chat_concurrency
+        self.queue_size = queue_size
+        self.max_pending = max_pending
+        # Ожидающие обновления (с временем поступления) каждой очереди. Ключ есть в словаре,
+        # пока у очереди есть обновления или одно из них обрабатывается
+        self._queues: dict[UpdateKey, deque] = {}
+        # Очереди, готовые к обработке (каждая не больше одного раза)
+        self._ready: asyncio.Queue = asyncio.Queue()
+        # Сколько обновлений чата обрабатывается сейчас и какие его очереди ждут освобождения обработчика
+        self._active_chats: dict[int, int] = {}
+        self._parked: dict[int, deque] = {}
+        self._pending = 0
+        self._has_room = asyncio.Event()
+        self._has_room.set()
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._tasks: list[asyncio.Task] = []
+        # Необязательный наблюдатель observer(update, waited, seconds): сколько обновление ждало в очереди
+        # и сколько обрабатывалось
+        self.observer: Optional[Callable[[types.Update, float, float], None]] = None
+        self.processed = 0
+        self.dropped = 0
+        self.errors = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def install(self) -> None:
+        # Подключает очередь к диспетчеру: обновления из polling (process_updates) попадают в нее,
+        # а новые обновления запрашиваются у Telegram, только когда в очереди есть место
+        self.dispatcher.process_updates = self.process_updates
+        get_updates = self.dispatcher.bot.get_updates
+
+        async def get_updates_with_room(*args, **kwargs):
+            await self._has_room.wait()
+            return await get_updates(*args, **kwargs)
+
+        self.dispatcher.bot.get_updates = get_updates_with_room
+
+    def start(self) -> None:
+        self._tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+
+    async def stop(self, timeout: float = 30) -> None:
+        # Дожидается обработки уже принятых обновлений (не дольше timeout секунд) и останавливает обработчиков
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning('Не обработано обновлений при остановке: %s', self._pending)
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def stats(self) -> dict[str, float]:
+        return {
+            'pending': self._pending,
+            'queues': len(self._queues),
+            'processed': self.processed,
+            'dropped': self.dropped,
+            'errors': self.errors,
+            'wait_avg_ms': self.wait_total / self.processed * 1000 if self.processed else 0.0,
+            'wait_max_ms': self.wait_max * 1000,
+        }
+
+    async def process_updates(self, updates: list[types.Update], fast: bool = True) -> list:
+        # Замена Dispatcher.process_updates: обновления только ставятся в очередь.
+        # Ответы обработчиков через webhook-ответы (BaseResponse) бот не использует
+        for update in updates:
+            await self.submit(update)
+        return []
+
+    async def submit(self, update: types.Update) -> bool:
+        # Ставит обновление в очередь его пары (чат, пользователь).
+        # Возвращает False, если очередь пользователя переполнена и обновление отброшено
+        while self._pending >= self.max_pending:
+            await self._has_room.wait()
+
+        key = update_key(update)
+        queue = self._queues.get(key)
+        if queue is None:
+            queue = self._queues[key] = deque()
+            self._ready.put_nowait(key)
+        elif len(queue) >= self.queue_size:
+            self.dropped += 1
+            logger.warning('Очередь %s переполнена, обновление %s отброшено', key, update.update_id)
+            return False
+        queue.append((update, time.monotonic()))
+
+        self._pending += 1
+        self._idle.clear()
+        if self._pending >= self.max_pending:
+            self._has_room.clear()
+        return True
+
+    async def _work(self) -> None:
+        while True:
+            key = await self._ready.get()
+            chat_id = key[0]
+            if chat_id is not None:
+                if self._active_chats.get(chat_id, 0) >= self.chat_concurrency:
+                    # Очередь подождет, пока освободится один из обработчиков этого чата
+                    self._parked.setdefault(chat_id, deque()).append(key)
+                    continue
+                self._active_chats[chat_id] = self._active_chats.get(chat_id, 0) + 1
+
+            queue = self._queues[key]
+            update, received = queue.popleft()
+            started = time.monotonic()
+            waited = started - received
+            self.wait_total += waited
+            self.wait_max = max(self.wait_max, waited)
+            try:
+                # Каждое обновление - в своей задаче, как в aiogram: текущие чат, пользователь
+                # и данные middleware хранятся в контекстных переменных задачи
+                await asyncio.create_task(self._process(update))
+            finally:
+                self._done(key, queue)
+            if self.observer is not None:
+                self.observer(update, waited, time.monotonic() - started)
+
+    async def _process(self, update: types.Update) -> None:
+        try:
+            await self.dispatcher.updates_handler.notify(update)
+        except Exception:
+            self.errors += 1
+            logger.exception('Ошибка при обработке обновления %s', update.update_id)
+
+    def _done(self, key: UpdateKey, queue: deque) -> None:
+        self.processed += 1
+        self._pending -= 1
+        if self._pending < self.max_pending:
+            self._has_room.set()
+        if not self._pending:
+            self._idle.set()
+
+        chat_id = key[0]
+        if chat_id is not None:
+            active = self._active_chats[chat_id] - 1
+            if active:
+                self._active_chats[chat_id] = active
+            else:
+                del self._active_chats[chat_id]
+            parked = self._parked.get(chat_id)
+            if parked:
+                self._ready.put_nowait(parked.popleft())
+                if not parked:
+                    del self._parked[chat_id]
+
+        # Следующее обновление очереди - в конец круга, после остальных готовых очередей
+        if queue:
+            self._ready.put_nowait(key)
+        else:
+            del self._queues[key]
+
+
+class SingleFlight:
+    # Объединение одинаковых запросов на чтение: пока выполняется вызов с ключом key
+    # и еще window секунд после него, повторные вызовы с тем же ключом не выполняются,
+    # а получают его результат. Например, десять /place в чате за секунду - один список мест.
+    # Если вызов завершился ошибкой, результат не запоминается
+
+    def __init__(self, window: float = 1.0) -> None:
+        self.window = window
+        self._calls: dict[Hashable, asyncio.Future] = {}
+        self.coalesced = 0
+
+    async def run(self, key: Hashable, func: Callable[..., Awaitable[Any]], *args, **kwargs) -> Any:
+        future = self._calls.get(key)
+        if future is not None:
+            self.coalesced += 1
+            return await asyncio.shield(future)
+
+        future = self._calls[key] = asyncio.get_running_loop().create_future()
+        try:
+            result = await func(*args, **kwargs)
+        except BaseException as error:
+            del self._calls[key]
+            if isinstance(error, asyncio.CancelledError):
+                future.cancel()
+            else:
+                future.set_exception(error)
+                # Исключение уже передано ожидающим; без этого asyncio пишет в лог, что его никто не получил
+                future.exception()
+            raise
+        future.set_result(result)
+        asyncio.get_running_loop().call_later(self.window, self._forget, key, future)
+        return result
+
+    def _forget(self, key: Hashable, future: asyncio.Future) -> None:
+        if self._calls.get(key) is future:
+            del self._calls[key]
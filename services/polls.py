@@ -0,0 +1,129 @@
+import json
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Optional
+
+from databases.database import archive_chat_polls
+
+
+# Типы опросов, которые бот отправляет в send_poll
+POLL_TIME = 'time'
+POLL_PLACE = 'place'
+
+# Сколько хранятся подведенные опросы в архиве (накопленная статистика не удаляется)
+POLL_ARCHIVE_RETENTION_DAYS = 365
+
+
+@dataclass
+class PollResult:
+    poll_id: str
+    chat_id: Optional[int]
+    kind: Optional[str]             # POLL_TIME или POLL_PLACE
+    options: list[str]              # тексты вариантов ответа
+    winners: list[int] = field(default_factory=list)  # варианты с наибольшим числом голосов (несколько при ничьей)
+    top_votes: int = 0              # число голосов у победителя
+    total_votes: int = 0            # сумма голосов по всем вариантам
+    votes: dict[int, int] = field(default_factory=dict)  # голоса за каждый вариант (только при архивации)
+    voters: int = 0                 # сколько пользователей проголосовало (только при архивации)
+
+    @property
+    def winner_texts(self) -> list[str]:
+        return [self.options[option_id] for option_id in self.winners]
+
+
+def read_tallies(rows: list[tuple]) -> list[PollResult]:
+    # Итоги опросов из строк SELECT_CHAT_POLL_TALLIES (посчитаны одним запросом к базе)
+    results: dict[str, PollResult] = {}
+    for poll_id, poll_chat_id, kind, options, option_id, votes, total in rows:
+        result = results.get(poll_id)
+        if result is None:
+            result = results[poll_id] = PollResult(poll_id, poll_chat_id, kind, json.loads(options),
+                                                   top_votes=votes or 0, total_votes=total or 0)
+        if option_id is not None:
+            result.winners.append(option_id)
+    return list(results.values())
+
+
+def place_option(name: str, rating: float) -> str:
+    # Текст варианта в опросе мест
+    return f"Место: {name} | Рейтинг: {rating}"
+
+
+def option_place(text: str) -> str:
+    # Название места из текста варианта (обратное к place_option)
+    return text.removeprefix('Место: ').rsplit(' | Рейтинг: ', 1)[0]
+
+
+def iso_week(timestamp: float) -> str:
+    year, week, _ = datetime.fromtimestamp(timestamp).isocalendar()
+    return f'{year}-W{week:02d}'
+
+
+async def archive_polls(chat_id: int, closed_at: Optional[float] = None,
+                        retention_days: float = POLL_ARCHIVE_RETENTION_DAYS
+                        ) -> tuple[list[PollResult], list[tuple[str, Optional[int]]]]:
+    # Подводит итоги опросов чата и переносит их в архив вместо простого удаления: в poll_archive
+    # сохраняется одна компактная строка на опрос, а в статистику для /stats добавляются
+    # победы и голоса мест, голоса за время встречи и явка за неделю closed_at.
+    # Итоги и архив считаются в одной транзакции (см. archive_chat_polls), поэтому в объявление
+    # попадают ровно те голоса, что и в архив. Архив старше retention_days дней удаляется.
+    # Возвращает итоги опросов для объявления и пары (poll_id, message_id) перенесенных опросов
+    closed_at = time.time() if closed_at is None else closed_at
+
+    def summarize(rows: list[tuple]) -> tuple[list[tuple], list[tuple], list[tuple], int]:
+        polls: dict[str, PollResult] = {}
+        for poll_id, kind, options, option_id, votes, poll_voters in rows:
+            poll = polls.get(poll_id)
+            if poll is None:
+                poll = polls[poll_id] = PollResult(poll_id, chat_id, kind, json.loads(options), voters=poll_voters)
+            if option_id is not None:
+                poll.votes[option_id] = votes
+
+        archive, place_wins, time_slots = [], [], []
+        for poll in polls.values():
+            poll.top_votes = max(poll.votes.values(), default=0)
+            poll.total_votes = sum(poll.votes.values())
+            poll.winners = [option_id for option_id, votes in poll.votes.items() if votes == poll.top_votes]
+            archive.append((poll.poll_id, chat_id, poll.kind, closed_at,
+                            json.dumps([[text, poll.votes.get(option_id, 0)]
+                                        for option_id, text in enumerate(poll.options)], ensure_ascii=False),
+                            json.dumps(poll.winners), poll.total_votes, poll.voters))
+            for option_id, text in enumerate(poll.options):
+                won, votes = int(option_id in poll.winners), poll.votes.get(option_id, 0)
+                if poll.kind == POLL_PLACE:
+                    place_wins.append((chat_id, option_place(text), 1, won, votes))
+                elif poll.kind == POLL_TIME:
+                    time_slots.append((chat_id, text, won, votes))
+        return archive, place_wins, time_slots, sum(poll.total_votes for poll in polls.values())
+
+    tallies, archived = await archive_chat_polls(chat_id, iso_week(closed_at), summarize,
+                                                 closed_at - retention_days * 86400)
+    return read_tallies(tallies), archived
+
+
+def render_announcement(results: list[PollResult]) -> str:
+    # Текст объявления о встрече по итогам опросов одного чата.
+    # При ничьей перечисляются все варианты-победители
+    winners = {result.kind: ' или '.join(result.winner_texts) for result in results if result.winners}
+
+    if POLL_TIME not in winners or POLL_PLACE not in winners:
+        return 'Нет достаточного количества данных для вывода результатов.'
+
+    return '♨️Уважемые причастные! Данные вашей встречи!♨️\n\n' \
+           f'Когда: {winners[POLL_TIME]}\n{winners[POLL_PLACE]}'
+
+
+def render_stats(places: list[tuple], time_slots: list[tuple], turnout: list[tuple]) -> str:
+    # Текст /stats по строкам get_poll_stats
+    if not places and not time_slots:
+        return 'Статистики пока нет: в этом чате еще не подводились итоги опросов. 🤷🏽‍♂️'
+
+    lines = ['📊СТАТИСТИКА ОПРОСОВ📊', '', 'Чаще всего побеждали:']
+    lines += [f'{number}. {place} - побед: {wins} из {offered}, голосов: {votes}'
+              for number, (place, wins, offered, votes) in enumerate(places, 1)]
+    lines += ['', 'Самое популярное время:']
+    lines += [f'{slot} - голосов: {votes}, побед: {wins}' for slot, votes, wins in time_slots]
+    lines += ['', 'Явка по неделям:']
+    lines += [f'{week}: проголосовали {voters}, голосов: {votes}' for week, polls, voters, votes in turnout]
+    return '\n'.join(lines)
@@ -0,0 +1,43 @@
+import asyncio
+import logging
+from typing import Optional
+
+from databases.database import decay_ratings
+
+
+logger = logging.getLogger(__name__)
+
+
+class RatingDecayTask:
+    # Периодический проход затухания рейтингов (см. decay_ratings): раз в interval секунд
+    # рейтинг с затуханием всех мест пересчитывается одним UPDATE без чтения оценок.
+    # Между проходами рейтинг мест без новых оценок немного устаревает: при проходе раз в час
+    # и половинном сроке в полгода - меньше чем на 0.02%
+
+    def __init__(self, interval: float = 3600) -> None:
+        self.interval = interval
+        self.passes = 0
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                updated = await decay_ratings()
+            except Exception:
+                logger.exception('Не удалось пересчитать рейтинги с затуханием')
+                continue
+            self.passes += 1
+            logger.debug('Пересчитан рейтинг с затуханием у %s мест', updated)
@@ -0,0 +1,182 @@
+import asyncio
+import logging
+import time
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Optional
+
+from apscheduler.triggers.cron import CronTrigger
+
+from databases.database import (claim_job_runs, finish_job_run, get_scheduled_jobs, get_unfinished_job_runs,
+                                remove_old_job_runs, save_scheduled_jobs)
+from services.fanout import fan_out
+
+
+logger = logging.getLogger(__name__)
+
+# Сколько хранится журнал запусков заданий
+JOB_RUNS_RETENTION = 90 * 24 * 3600
+
+# Пауза после ошибки (например, database is locked): удваивается с каждой ошибкой подряд до RETRY_DELAY_MAX
+RETRY_DELAY = 5
+RETRY_DELAY_MAX = 300
+
+Job = Callable[[int], Awaitable[None]]
+
+
+class ScheduleEntry:
+    __slots__ = ('job', 'chat_id', 'cron', 'trigger', 'next_run_at')
+
+    def __init__(self, job: str, chat_id: int, cron: str, trigger: CronTrigger, next_run_at: float) -> None:
+        self.job = job
+        self.chat_id = chat_id
+        self.cron = cron
+        self.trigger = trigger
+        self.next_run_at = next_run_at
+
+    def fire_after(self, moment: float) -> float:
+        # Первое плановое время запуска строго после moment
+        after = datetime.fromtimestamp(moment, self.trigger.timezone) + timedelta(microseconds=1)
+        return self.trigger.get_next_fire_time(None, after).timestamp()
+
+    def row(self) -> tuple[str, int, str, float]:
+        return self.job, self.chat_id, self.cron, self.next_run_at
+
+
+class JobScheduler:
+    # Задания по расписанию (рассылка опросов, подведение итогов) для каждого чата отдельно.
+    # Расписание и время следующего запуска каждого задания хранятся в таблице scheduled_jobs,
+    # поэтому запуск, пропущенный из-за остановки бота, выполняется после старта, если опоздание
+    # не больше misfire_grace секунд. Несколько пропущенных запусков одного задания объединяются
+    # в один (по последнему плановому времени).
+    # Каждый запуск записывается в job_runs с ключом "задание:чат:плановое время" в той же транзакции,
+    # что и перенос следующего запуска, и выполняется, только если такого ключа еще не было.
+    # Поэтому после сбоя посреди рассылки опрос не будет отправлен в чат второй раз:
+    # задание выполняется не больше одного раза (at-most-once). Прогресс внутри задания не
+    # сохраняется: запуск, прерванный на середине (например, после первого из двух опросов),
+    # не повторяется и не доотправляется - при старте он пишется в лог и отмечается в job_runs
+    # как interrupted, а чат получит опросы при следующем запуске по расписанию.
+
+    def __init__(self, jobs: dict[str, Job], misfire_grace: float = 6 * 3600, timezone: Optional[str] = None,
+                 concurrency: int = 20, retry_delay: float = RETRY_DELAY) -> None:
+        self.jobs = jobs
+        self.misfire_grace = misfire_grace
+        self.timezone = timezone or None
+        self.concurrency = concurrency
+        self.retry_delay = retry_delay
+        self._schedules: dict[tuple[str, int], str] = {}
+        self._entries: dict[tuple[str, int], ScheduleEntry] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._running: set[asyncio.Task] = set()
+
+    def add_schedule(self, job: str, chat_id: int, cron: str) -> None:
+        # cron - строка в формате crontab, например '0 12 * * mon'. Вызывается до start()
+        if job not in self.jobs:
+            raise ValueError(f'Неизвестное задание {job}')
+        CronTrigger.from_crontab(cron, timezone=self.timezone)
+        self._schedules[job, chat_id] = cron
+
+    def start(self) -> None:
+        # Расписания загружаются и пропущенные запуски выполняются в фоновой задаче,
+        # чтобы не задерживать запуск бота
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        # Уже начатые задания доводятся до конца, следующие запуски остаются в базе
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._running:
+            await asyncio.gather(*self._running, return_exceptions=True)
+
+    async def _load(self) -> None:
+        # Сверяет расписания из конфига с сохраненными: если расписание задания не менялось,
+        # сохраненное время следующего запуска остается (даже если оно уже прошло),
+        # иначе следующий запуск считается от текущего момента
+        now = time.time()
+        stored = {(job, chat_id): (cron, next_run_at) for job, chat_id, cron, next_run_at in await get_scheduled_jobs()}
+        entries = {}
+        for key, cron in self._schedules.items():
+            trigger = CronTrigger.from_crontab(cron, timezone=self.timezone)
+            entry = ScheduleEntry(*key, cron, trigger, 0.0)
+            stored_cron, next_run_at = stored.get(key, (None, None))
+            entry.next_run_at = next_run_at if stored_cron == cron else entry.fire_after(now)
+            entries[key] = entry
+        await save_scheduled_jobs((entry.row() for entry in entries.values()),
+                                  [key for key in stored if key not in self._schedules])
+        self._entries = entries
+
+    async def _recover(self) -> None:
+        # Запуски, начатые до остановки бота и не завершенные, не повторяются (см. описание класса)
+        now = time.time()
+        for run_key, started_at in await get_unfinished_job_runs():
+            logger.warning('Запуск %s (начат %s) был прерван и не будет повторен: '
+                           'часть сообщений могла не дойти до чата',
+                           run_key, datetime.fromtimestamp(started_at))
+            await finish_job_run(run_key, now, 'interrupted')
+        await remove_old_job_runs(now - JOB_RUNS_RETENTION)
+
+    async def _run(self) -> None:
+        recovered = False
+        failures = 0
+        while True:
+            try:
+                if not recovered:
+                    await self._recover()
+                    recovered = True
+                if not self._entries:
+                    await self._load()
+                delay = await self._run_due()
+                failures = 0
+            except Exception:
+                # Время следующего запуска в памяти могло уже сдвинуться, а в базе - нет (claim_job_runs
+                # не выполнился): расписания перечитываются из базы, и несостоявшийся запуск повторится
+                delay = min(self.retry_delay * 2 ** failures, RETRY_DELAY_MAX)
+                failures += 1
+                logger.exception('Ошибка планировщика заданий, повтор через %.0f с', delay)
+                self._entries = {}
+            await asyncio.sleep(delay)
+
+    async def _run_due(self) -> float:
+        # Запускает задания, время которых наступило, и возвращает, сколько спать до следующей проверки
+        now = time.time()
+        due = [entry for entry in self._entries.values() if entry.next_run_at <= now]
+        if not due:
+            # Спим не дольше часа, чтобы перевод системных часов не сдвигал запуски надолго
+            timeout = min((entry.next_run_at for entry in self._entries.values()), default=now + 3600) - now
+            return min(timeout, 3600)
+
+        runs: dict[str, dict[int, str]] = {}
+        for entry in due:
+            # Все пропущенные плановые запуски объединяются в последний из них
+            fire_at = entry.next_run_at
+            while (following := entry.fire_after(fire_at)) <= now:
+                fire_at = following
+            entry.next_run_at = entry.fire_after(now)
+            late = now - fire_at
+            if late > self.misfire_grace:
+                logger.warning('Пропускаем %s для чата %s: запуск в %s опоздал на %.0f с',
+                               entry.job, entry.chat_id, datetime.fromtimestamp(fire_at), late)
+                continue
+            runs.setdefault(entry.job, {})[entry.chat_id] = f'{entry.job}:{entry.chat_id}:{int(fire_at)}'
+
+        run_keys = [run_key for chats in runs.values() for run_key in chats.values()]
+        claimed = set(await claim_job_runs(run_keys, (entry.row() for entry in due), now))
+        for job, chats in runs.items():
+            chats = {chat_id: run_key for chat_id, run_key in chats.items() if run_key in claimed}
+            if chats:
+                task = asyncio.create_task(self._execute(job, chats))
+                self._running.add(task)
+                task.add_done_callback(self._running.discard)
+        return 0
+
+    async def _execute(self, job: str, chats: dict[int, str]) -> None:
+        # Задание выполняется для всех чатов сразу, одновременно не больше concurrency чатов
+        logger.info('Запускаем %s для %s чатов', job, len(chats))
+        errors = await fan_out(chats, self.jobs[job], self.concurrency, name=job)
+        for chat_id, run_key in chats.items():
+            error = errors.get(chat_id)
+            await finish_job_run(run_key, time.time(), repr(error) if error is not None else None)
@@ -0,0 +1,199 @@
+import asyncio
+import json
+import logging
+import time
+from collections import Counter
+from typing import Iterable, Optional
+
+from aiogram import exceptions
+
+from databases.database import get_poll_standings, remove_poll_standings, save_poll_standings
+from services.outbound import PRIORITY_BACKGROUND, OutboundDispatcher
+from services.polls import POLL_PLACE, POLL_TIME
+
+
+logger = logging.getLogger(__name__)
+
+# Длина полосы у варианта с наибольшим числом голосов
+BAR_WIDTH = 10
+
+POLL_TITLES = {POLL_TIME: '⏰Время', POLL_PLACE: '🍔Место'}
+
+
+def render_standings(polls: list[tuple[str, Optional[str], list[str]]], tallies: dict[str, Counter]) -> str:
+    # Текст промежуточных итогов: варианты каждого опроса по убыванию голосов с полосой
+    # (polls - тройки (poll_id, kind, options), tallies - голоса за варианты каждого опроса)
+    lines = ['📊ПРОМЕЖУТОЧНЫЕ ИТОГИ ОПРОСОВ📊']
+    for poll_id, kind, options in polls:
+        votes = tallies.get(poll_id, Counter())
+        top = max(votes.values(), default=0)
+        lines += ['', f"{POLL_TITLES.get(kind, 'Опрос')} (голосов: {sum(votes.values())})"]
+        for option_id in sorted(range(len(options)), key=lambda option_id: -votes[option_id]):
+            bar = '▓' * round(BAR_WIDTH * votes[option_id] / top) if top else ''
+            lines.append(f'{options[option_id]} - {votes[option_id]} {bar}'.rstrip())
+    return '\n'.join(lines)
+
+
+class StandingsBoard:
+    # Закрепленное сообщение с промежуточными итогами текущих опросов чата.
+    # Голоса приходят из VoteAggregator (apply вызывается после каждой записи голосов в базу),
+    # а сообщение правится не на каждый голос: после правки следующая правка того же чата
+    # выполняется не раньше чем через interval секунд, и все голоса, пришедшие за это время,
+    # попадают в одну правку. Если текст не изменился (например, голос отозван и отдан снова),
+    # правка не отправляется. Поэтому на чат приходится не больше одного editMessageText
+    # в interval секунд, сколько бы голосов ни пришло.
+    # Голоса опроса считаются с момента его отправки (watch), еще до сообщения с итогами.
+    # Сообщения и их опросы хранятся в poll_standings и после перезапуска загружаются в start.
+
+    def __init__(self, outbound: OutboundDispatcher, interval: float = 10.0) -> None:
+        self.outbound = outbound
+        self.interval = interval
+        # chat_id -> (message_id, опросы (poll_id, kind, options)), текст в сообщении сейчас
+        self._boards: dict[int, tuple[int, list[tuple[str, Optional[str], list[str]]]]] = {}
+        self._texts: dict[int, str] = {}
+        self._tallies: dict[str, Counter] = {}
+        self._poll_chats: dict[str, int] = {}
+        self._last_edit: dict[int, float] = {}
+        self._timers: dict[int, asyncio.TimerHandle] = {}
+        self._refreshing: set[asyncio.Task] = set()
+        self.edits = 0
+        self.skipped = 0
+        self.coalesced = 0
+
+    async def start(self) -> None:
+        standings, polls, votes = await get_poll_standings()
+        definitions = {poll_id: (poll_id, kind, json.loads(options)) for poll_id, kind, options in polls}
+        for chat_id, message_id, poll_ids in standings:
+            chat_polls = [definitions[poll_id] for poll_id in json.loads(poll_ids) if poll_id in definitions]
+            self._track(chat_id, message_id, chat_polls)
+        # Голоса опросов, которых нет в poll_data (например, голос записан раньше самого опроса), не отслеживаются
+        for poll_id, option_id, count in votes:
+            if poll_id in self._tallies:
+                self._tallies[poll_id][option_id] = count
+
+    async def stop(self) -> None:
+        # Отложенные правки отменяются: после запуска сообщение обновится со следующим голосом
+        for timer in self._timers.values():
+            timer.cancel()
+        self._timers.clear()
+        if self._refreshing:
+            await asyncio.gather(*self._refreshing, return_exceptions=True)
+
+    def stats(self) -> dict[str, int]:
+        return {'chats': len(self._boards), 'edits': self.edits, 'skipped': self.skipped,
+                'coalesced': self.coalesced}
+
+    async def open(self, chat_id: int, polls: list[tuple[str, Optional[str], list[str]]]) -> None:
+        # Отправляет и закрепляет сообщение с итогами новых опросов чата (polls - тройки (poll_id, kind, options)).
+        # Предыдущее сообщение чата, если оно было, открепляется
+        if chat_id in self._boards:
+            await self.close(chat_id, refresh=False)
+
+        # Голоса, записанные, пока сообщение отправляется и закрепляется, тоже учитываются
+        self.watch(chat_id, polls)
+        text = render_standings(polls, self._tallies)
+        try:
+            message = await self.outbound.send_message(chat_id, text, priority=PRIORITY_BACKGROUND)
+        except exceptions.TelegramAPIError as error:
+            # Опросы уже отправлены, без промежуточных итогов они тоже работают
+            logger.warning('Не удалось отправить итоги опросов в чат %s: %s', chat_id, error)
+            for poll_id, _, _ in polls:
+                self._tallies.pop(poll_id, None)
+                self._poll_chats.pop(poll_id, None)
+            return
+        try:
+            await self.outbound.pin_chat_message(chat_id, message.message_id, disable_notification=True)
+        except exceptions.TelegramAPIError as error:
+            # Например, у бота нет права закреплять сообщения - итоги все равно обновляются
+            logger.warning('Не удалось закрепить итоги опросов в чате %s: %s', chat_id, error)
+        await save_poll_standings(chat_id, message.message_id, [poll_id for poll_id, _, _ in polls])
+        self._track(chat_id, message.message_id, polls)
+        self._texts[chat_id] = text
+        self._last_edit[chat_id] = time.monotonic()
+        if render_standings(polls, self._tallies) != text:
+            self._schedule(chat_id)
+
+    def watch(self, chat_id: int, polls: Iterable[tuple[str, Optional[str], list[str]]]) -> None:
+        # Начинает считать голоса опросов чата до того, как отправлено сообщение с итогами:
+        # send_chat_poll вызывает watch сразу после отправки каждого опроса
+        for poll_id, _, _ in polls:
+            self._tallies.setdefault(poll_id, Counter())
+            self._poll_chats[poll_id] = chat_id
+
+    async def close(self, chat_id: int, refresh: bool = True) -> None:
+        # Опросы чата завершены: последняя правка с окончательными голосами (если они изменились)
+        # и открепление сообщения
+        board = self._boards.get(chat_id)
+        if board is None:
+            return
+        timer = self._timers.pop(chat_id, None)
+        if timer is not None:
+            timer.cancel()
+        if refresh:
+            await self._refresh(chat_id)
+
+        message_id, polls = self._boards.pop(chat_id)
+        for poll_id, _, _ in polls:
+            self._tallies.pop(poll_id, None)
+            self._poll_chats.pop(poll_id, None)
+        self._texts.pop(chat_id, None)
+        self._last_edit.pop(chat_id, None)
+        await remove_poll_standings(chat_id)
+        try:
+            await self.outbound.unpin_chat_message(chat_id, message_id)
+        except exceptions.TelegramAPIError as error:
+            logger.warning('Не удалось открепить итоги опросов в чате %s: %s', chat_id, error)
+
+    def apply(self, deltas: Counter) -> None:
+        # Наблюдатель VoteAggregator: deltas - {(poll_id, option_id): изменение числа голосов}
+        changed = set()
+        for (poll_id, option_id), delta in deltas.items():
+            chat_id = self._poll_chats.get(poll_id)
+            if chat_id is None or not delta:
+                continue
+            self._tallies[poll_id][option_id] += delta
+            changed.add(chat_id)
+        for chat_id in changed:
+            self._schedule(chat_id)
+
+    def _track(self, chat_id: int, message_id: int, polls: Iterable[tuple[str, Optional[str], list[str]]]) -> None:
+        polls = list(polls)
+        self._boards[chat_id] = (message_id, polls)
+        self.watch(chat_id, polls)
+
+    def _schedule(self, chat_id: int) -> None:
+        # Правка уже запланирована - новые голоса попадут в нее
+        if chat_id in self._timers:
+            self.coalesced += 1
+            return
+        delay = max(0.0, self._last_edit.get(chat_id, float('-inf')) + self.interval - time.monotonic())
+        self._timers[chat_id] = asyncio.get_running_loop().call_later(delay, self._fire, chat_id)
+
+    def _fire(self, chat_id: int) -> None:
+        self._timers.pop(chat_id, None)
+        task = asyncio.create_task(self._refresh(chat_id))
+        self._refreshing.add(task)
+        task.add_done_callback(self._refreshing.discard)
+
+    async def _refresh(self, chat_id: int) -> None:
+        board = self._boards.get(chat_id)
+        if board is None:
+            return
+        message_id, polls = board
+        text = render_standings(polls, self._tallies)
+        if text == self._texts.get(chat_id):
+            self.skipped += 1
+            return
+
+        # Время правки запоминается до отправки: следующая правка не раньше чем через interval
+        self._last_edit[chat_id] = time.monotonic()
+        self._texts[chat_id] = text
+        self.edits += 1
+        try:
+            await self.outbound.edit_message_text(chat_id, message_id, text, priority=PRIORITY_BACKGROUND)
+        except exceptions.MessageNotModified:
+            pass
+        except Exception:
+            # Текст в сообщении остался прежним - следующий голос снова вызовет правку
+            self._texts.pop(chat_id, None)
+            logger.exception('Не удалось обновить итоги опросов в чате %s', chat_id)
@@ -0,0 +1,131 @@
+import asyncio
+import csv
+import json
+from itertools import islice
+from pathlib import Path
+from typing import Iterator, NamedTuple
+
+from databases.database import iter_places, upsert_places
+
+
+# Сколько мест записывается в базу одной транзакцией при импорте
+IMPORT_CHUNK_SIZE = 1000
+
+# Сколько символов JSON читается из файла за раз
+JSON_READ_SIZE = 64 * 1024
+
+EXPORT_FIELDS = ('name', 'address', 'rating')
+
+
+class TransferError(Exception):
+    pass
+
+
+class ImportResult(NamedTuple):
+    imported: int   # добавлено или обновлено мест
+    skipped: int    # записей без названия
+
+
+def read_csv(path: Path) -> Iterator[dict]:
+    # Строки CSV-файла с заголовком (нужна колонка name, колонка address необязательна).
+    # Разделитель (запятая или точка с запятой) определяется по заголовку
+    with open(path, newline='', encoding='utf-8-sig') as file:
+        header = file.readline()
+        delimiter = ';' if header.count(';') > header.count(',') else ','
+        fields = [field.strip().lower() for field in next(csv.reader([header], delimiter=delimiter), [])]
+        if 'name' not in fields:
+            raise TransferError('В первой строке CSV должны быть названия колонок, среди них name')
+        yield from csv.DictReader(file, fieldnames=fields, delimiter=delimiter)
+
+
+def read_json(path: Path) -> Iterator[dict]:
+    # Объекты из JSON-массива [{...}, {...}] или из JSON Lines (по объекту в строке).
+    # Файл читается частями: очередной объект разбирается, как только он прочитан целиком
+    decoder = json.JSONDecoder()
+    with open(path, encoding='utf-8-sig') as file:
+        buffer, position, eof = '', 0, False
+        while True:
+            # Пропускаем пробелы и разделители между объектами
+            while position < len(buffer) and buffer[position] in ' \t\r\n,[]':
+                position += 1
+            if position == len(buffer):
+                if eof:
+                    return
+                buffer, position = file.read(JSON_READ_SIZE), 0
+                eof = not buffer
+                continue
+            try:
+                item, end = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                if eof:
+                    raise TransferError(f'Некорректный JSON около символа {position}') from None
+                # Объект прочитан не полностью - дочитываем файл
+                chunk = file.read(JSON_READ_SIZE)
+                eof = not chunk
+                buffer, position = buffer[position:] + chunk, 0
+                continue
+            if not isinstance(item, dict):
+                raise TransferError('Ожидались объекты с полями name и address')
+            yield item
+            position = end
+
+
+def read_places(path: Path, filename: str) -> Iterator[dict]:
+    # Формат определяется по расширению имени файла
+    suffix = Path(filename).suffix.lower()
+    if suffix == '.csv':
+        return read_csv(path)
+    if suffix in ('.json', '.jsonl', '.ndjson'):
+        return read_json(path)
+    raise TransferError('Поддерживаются файлы .csv, .json и .jsonl')
+
+
+def read_chunk(records: Iterator[dict], size: int, first: int) -> list[dict]:
+    # Следующие size записей (first - номер первой из них, с единицы).
+    # Любая ошибка разбора файла (кодировка, CSV, JSON) становится TransferError с номером записи
+    chunk = []
+    try:
+        chunk.extend(islice(records, size))
+    except (TransferError, csv.Error, ValueError, KeyError) as error:
+        raise TransferError(f'запись №{first + len(chunk)}: {error}') from error
+    return chunk
+
+
+async def import_places(path: Path, filename: str, chunk_size: int = IMPORT_CHUNK_SIZE) -> ImportResult:
+    # Импорт мест из файла: записи читаются потоком и записываются пачками по chunk_size
+    # (executemany в одной транзакции на пачку). Место с существующим названием обновляется.
+    # Файл разбирается в отдельном потоке, чтобы большой импорт не останавливал обработку
+    # обновлений других чатов. Пачки, записанные до ошибки в файле, остаются в базе
+    records = read_places(path, filename)
+    imported = skipped = read = 0
+    while True:
+        try:
+            chunk = await asyncio.to_thread(read_chunk, records, chunk_size, read + 1)
+        except TransferError as error:
+            raise TransferError(f'{error}. Уже сохранено мест: {imported}') from error
+        if not chunk:
+            break
+        read += len(chunk)
+        places = []
+        for record in chunk:
+            name = str(record.get('name') or '').strip()
+            if name:
+                places.append((name, str(record.get('address') or '').strip()))
+            else:
+                skipped += 1
+        imported += await upsert_places(places)
+    return ImportResult(imported, skipped)
+
+
+async def export_places(path: Path) -> int:
+    # Выгрузка каталога в CSV: строки пишутся в файл по мере чтения из базы,
+    # поэтому в памяти одновременно находится только одна пачка. Запись в файл выполняется
+    # в отдельном потоке. Возвращает число мест
+    exported = 0
+    with open(path, 'w', newline='', encoding='utf-8') as file:
+        writer = csv.writer(file)
+        writer.writerow(EXPORT_FIELDS)
+        async for rows in iter_places():
+            await asyncio.to_thread(writer.writerows, rows)
+            exported += len(rows)
+    return exported
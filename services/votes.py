@@ -0,0 +1,111 @@
+import asyncio
+import logging
+from collections import Counter
+from typing import Callable, Iterable, Optional
+
+from databases.database import get_poll_answers, save_poll_answers
+
+
+logger = logging.getLogger(__name__)
+
+
+class VoteAggregator:
+    # Буферизованная запись ответов на опросы (write-behind).
+    # handle_poll_answer только запоминает текущий выбор пользователя в памяти,
+    # а фоновая задача раз в flush_interval секунд (или сразу, когда накопилось
+    # flush_size ответов) одной транзакцией записывает изменения в poll_results.
+    # Для каждого пользователя хранится последний выбор, поэтому повторное голосование
+    # заменяет старые голоса, а отзыв голоса (пустой option_ids) их вычитает.
+    # Ответы на опросы, итоги которых уже подведены (они в poll_archive или переданы в forget),
+    # отбрасываются и в памяти не остаются.
+
+    def __init__(self, flush_interval: float = 0.5, flush_size: int = 200) -> None:
+        self.flush_interval = flush_interval
+        self.flush_size = flush_size
+        self._pending: dict[tuple[str, int], tuple[int, ...]] = {}
+        self._selections: dict[tuple[str, int], tuple[int, ...]] = {}
+        self._lock = asyncio.Lock()
+        self._wakeup = asyncio.Event()
+        self._full = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        # Необязательный наблюдатель observer(deltas): изменения числа голосов
+        # {(poll_id, option_id): на сколько изменилось} после каждой записи в базу
+        self.observer: Optional[Callable[[Counter], None]] = None
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        # Останавливаем фоновую задачу и записываем все, что осталось в буфере
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    def add(self, poll_id: str, user_id: int, option_ids: Iterable[int]) -> None:
+        # Запоминает текущий выбор пользователя; до записи в базу учитывается только последний ответ
+        self._pending[poll_id, user_id] = tuple(option_ids)
+        self._wakeup.set()
+        if len(self._pending) >= self.flush_size:
+            self._full.set()
+
+    def forget(self, poll_ids: Iterable[str]) -> None:
+        # Сбрасывает выбор пользователей в опросах, данные которых перенесены в архив (см. archive_polls)
+        poll_ids = set(poll_ids)
+        self._selections = {key: option_ids for key, option_ids in self._selections.items()
+                            if key[0] not in poll_ids}
+
+    async def flush(self) -> None:
+        async with self._lock:
+            if not self._pending:
+                return
+            pending, self._pending = self._pending, {}
+
+            try:
+                # Предыдущий выбор, которого нет в памяти (например, после перезапуска), берем из базы
+                unknown = [key for key in pending if key not in self._selections]
+                if unknown:
+                    self._selections.update(await get_poll_answers(unknown))
+
+                deltas = Counter()
+                for (poll_id, user_id), option_ids in pending.items():
+                    for option_id in self._selections.get((poll_id, user_id), ()):
+                        deltas[poll_id, option_id] -= 1
+                    for option_id in option_ids:
+                        deltas[poll_id, option_id] += 1
+
+                closed_polls = await save_poll_answers(pending, deltas)
+            except Exception:
+                # Возвращаем ответы в буфер, не затирая более новые, пришедшие во время записи
+                for key, option_ids in pending.items():
+                    self._pending.setdefault(key, option_ids)
+                raise
+
+            # Выбор в закрытых опросах не запоминаем, иначе _selections росли бы каждую неделю
+            for key in unknown:
+                if key[0] in closed_polls:
+                    self._selections.pop(key, None)
+            self._selections.update((key, option_ids) for key, option_ids in pending.items()
+                                    if key[0] not in closed_polls)
+            deltas = Counter({key: delta for key, delta in deltas.items() if key[0] not in closed_polls})
+            if self.observer is not None:
+                self.observer(deltas)
+
+    async def _run(self) -> None:
+        while True:
+            await self._wakeup.wait()
+            try:
+                await asyncio.wait_for(self._full.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            self._full.clear()
+
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception('Не удалось сохранить ответы на опросы')
@@ -0,0 +1,84 @@
+import hmac
+import logging
+from typing import Awaitable, Callable, Optional
+
+from aiogram import Dispatcher
+from aiogram.dispatcher.webhook import WebhookRequestHandler
+from aiogram.utils.executor import Executor
+from aiohttp import web
+
+from config_data.config import WebhookConfig
+from services.pipeline import UpdatePipeline
+
+
+logger = logging.getLogger(__name__)
+
+SECRET_TOKEN_KEY = 'WEBHOOK_SECRET_TOKEN'
+PIPELINE_KEY = 'WEBHOOK_PIPELINE'
+
+
+class FastWebhookRequestHandler(WebhookRequestHandler):
+    # Обработчик вебхука, который отвечает Telegram сразу после получения обновления.
+    # Стандартный WebhookRequestHandler держит запрос открытым, пока обновление не обработано;
+    # здесь обновление ставится в очередь обработки (UpdatePipeline), и запрос держится открытым,
+    # только пока очередь переполнена - так Telegram придерживает следующие обновления.
+
+    async def post(self):
+        secret_token = self.request.app[SECRET_TOKEN_KEY]
+        received = self.request.headers.get('X-Telegram-Bot-Api-Secret-Token', '')
+        if secret_token and not hmac.compare_digest(received, secret_token):
+            raise web.HTTPUnauthorized()
+
+        dispatcher = self.get_dispatcher()
+        update = await self.parse_update(dispatcher.bot)
+        await self.request.app[PIPELINE_KEY].submit(update)
+
+        return web.Response(text='ok')
+
+
+def create_webhook_app(secret_token: str, pipeline: UpdatePipeline) -> web.Application:
+    # Принятые обновления дообрабатываются при остановке в pipeline.stop (см. on_shutdown в main.py)
+    app = web.Application()
+    app[SECRET_TOKEN_KEY] = secret_token
+    app[PIPELINE_KEY] = pipeline
+    return app
+
+
+async def register_webhook(dispatcher: Dispatcher, config: WebhookConfig,
+                           on_startup: Callable[[Dispatcher], Awaitable[None]],
+                           allowed_updates: Optional[list[str]] = None) -> None:
+    # Вебхук регистрируется последним шагом запуска, когда база и очереди уже готовы принимать обновления.
+    # Если запуск не удался, aiohttp не вызывает on_shutdown, поэтому вебхук удаляется здесь,
+    # иначе Telegram продолжит слать обновления на остановленный сервер
+    try:
+        await on_startup(dispatcher)
+        await dispatcher.bot.set_webhook(config.url, secret_token=config.secret_token or None,
+                                         allowed_updates=allowed_updates, drop_pending_updates=True)
+    except Exception:
+        try:
+            await dispatcher.bot.delete_webhook()
+        except Exception:
+            logger.exception('Не удалось удалить вебхук после ошибки запуска')
+        raise
+
+
+def start_webhook(dp: Dispatcher, config: WebhookConfig, pipeline: UpdatePipeline,
+                  on_startup: Callable[[Dispatcher], Awaitable[None]],
+                  on_shutdown: Callable[[Dispatcher], Awaitable[None]],
+                  allowed_updates: Optional[list[str]] = None) -> None:
+    # Запускает бота в режиме вебхука: aiohttp-сервер принимает обновления по config.path,
+    # а адрес вебхука регистрируется в Telegram при запуске и удаляется при остановке
+
+    async def startup(dispatcher: Dispatcher) -> None:
+        await register_webhook(dispatcher, config, on_startup, allowed_updates)
+
+    async def unregister_webhook(dispatcher: Dispatcher) -> None:
+        await on_shutdown(dispatcher)
+        await dispatcher.bot.delete_webhook()
+
+    executor = Executor(dp)
+    executor.on_startup(startup, polling=False)
+    executor.on_shutdown(unregister_webhook, polling=False)
+    executor.set_webhook(config.path, request_handler=FastWebhookRequestHandler,
+                         web_app=create_webhook_app(config.secret_token, pipeline))
+    executor.run_app(host=config.host, port=config.port)
@@ -13,4 +13,7 @@ class Del(StatesGroup):
 class Rating(StatesGroup):
     name = State()
     rating = State()
-    
+
+
+class Near(StatesGroup):
+    location = State()
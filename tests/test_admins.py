@@ -0,0 +1,51 @@
+import unittest
+from types import SimpleNamespace
+
+from aiogram import types
+
+from services.admins import AdminCache
+
+
+class StubOutbound:
+    # Вместо OutboundDispatcher: считает запросы getChatAdministrators
+    def __init__(self) -> None:
+        self.requests = 0
+
+    async def get_chat_administrators(self, chat_id: int) -> list[SimpleNamespace]:
+        self.requests += 1
+        return [SimpleNamespace(user=SimpleNamespace(id=10), status=types.ChatMemberStatus.CREATOR),
+                SimpleNamespace(user=SimpleNamespace(id=11), status=types.ChatMemberStatus.ADMINISTRATOR)]
+
+
+class AdminCacheTest(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self) -> None:
+        self.outbound = StubOutbound()
+        self.admins = AdminCache(self.outbound, overrides=[1])
+
+    async def test_private_chat_is_answered_without_requests(self):
+        self.assertTrue(await self.admins.is_admin(1, 1))
+        self.assertFalse(await self.admins.is_admin(2, 2))
+        self.assertEqual(self.outbound.requests, 0)
+
+    async def test_group_roster_is_loaded_once(self):
+        self.assertTrue(await self.admins.is_admin(-100, 10))
+        self.assertTrue(await self.admins.is_admin(-100, 11))
+        self.assertFalse(await self.admins.is_admin(-100, 12))
+        self.assertTrue(await self.admins.is_admin(-100, 1))
+        self.assertEqual(self.outbound.requests, 1)
+
+    async def test_invalidated_chat_is_loaded_again(self):
+        await self.admins.is_admin(-100, 10)
+        self.admins.update_member(-100, 11, types.ChatMemberStatus.MEMBER)
+        self.assertFalse(await self.admins.is_admin(-100, 11))
+
+        # Бота удалили из чата: при возвращении список загружается заново
+        self.admins.invalidate(-100)
+        self.assertEqual(self.admins.stats()['chats'], 0)
+        self.assertTrue(await self.admins.is_admin(-100, 11))
+        self.assertEqual(self.outbound.requests, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
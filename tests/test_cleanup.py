@@ -0,0 +1,67 @@
+import asyncio
+import tempfile
+import unittest
+from pathlib import Path
+
+from benchmarks.bench_import import reset
+import databases.database as database
+from services.cleanup import MessageCleaner
+
+
+class StubOutbound:
+    # Вместо OutboundDispatcher: удаления в чатах из blocked ждут release (как чат, получивший RetryAfter)
+    def __init__(self, blocked: set[int]) -> None:
+        self.blocked = blocked
+        self.release = asyncio.Event()
+        self.deleted: list[tuple[int, str]] = []
+
+    async def request(self, chat_id: int, method: str, payload: dict, **kwargs) -> bool:
+        if chat_id in self.blocked:
+            await self.release.wait()
+        self.deleted.append((chat_id, method))
+        return True
+
+
+class MessageCleanerTest(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+        await reset(Path(self.directory.name) / 'cleanup.db')
+        self.outbound = StubOutbound(blocked={-1})
+        self.cleaner = MessageCleaner(self.outbound)
+        await self.cleaner.start()
+
+    async def asyncTearDown(self) -> None:
+        self.outbound.release.set()
+        await self.cleaner.stop()
+        await database.db.close()
+        self.directory.cleanup()
+
+    async def wait_pending(self, expected: list[tuple]) -> None:
+        while sorted(row[1:] for row in await database.get_pending_deletions()) != expected:
+            await asyncio.sleep(0.01)
+
+    async def test_waiting_chat_does_not_block_other_chats(self):
+        await self.cleaner.schedule(-1, [1, 2])
+        await self.cleaner.schedule(-2, [3, 4])
+        await self.cleaner.schedule(-3, [5])
+
+        # Удаления в свободных чатах выполнены и убраны из базы, пока чат -1 ждет
+        await asyncio.wait_for(self.wait_pending([(-1, 1), (-1, 2)]), 5)
+        self.assertCountEqual(self.outbound.deleted, [(-2, 'deleteMessages'), (-3, 'deleteMessage')])
+
+        self.outbound.release.set()
+        await asyncio.wait_for(self.wait_pending([]), 5)
+        self.assertIn((-1, 'deleteMessages'), self.outbound.deleted)
+
+    async def test_unfinished_deletions_survive_stop(self):
+        await self.cleaner.schedule(-1, [1])
+        await asyncio.sleep(0.05)
+        await self.cleaner.stop()
+
+        self.assertEqual([row[1:] for row in await database.get_pending_deletions()], [(-1, 1)])
+        self.assertEqual(self.outbound.deleted, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+import asyncio
+import json
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from benchmarks.bench_import import reset
+import databases.database as database
+from databases.fsm_storage import SQLiteStorage
+
+
+class SQLiteStorageTest(unittest.IsolatedAsyncioTestCase):
+    # Состояния записываются во временную базу; on_expire запоминает данные завершенных диалогов
+
+    async def asyncSetUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+        await reset(Path(self.directory.name) / 'fsm.db')
+        self.expired: list[tuple[str, str, dict]] = []
+        self.storage = self.create_storage()
+
+    async def asyncTearDown(self) -> None:
+        await self.storage.close()
+        await database.db.close()
+        self.directory.cleanup()
+
+    def create_storage(self, **kwargs) -> SQLiteStorage:
+        async def on_expire(chat: str, user: str, data: dict) -> None:
+            self.expired.append((chat, user, data))
+        return SQLiteStorage(database.db, ttl=60, on_expire=on_expire, **kwargs)
+
+    async def backdate(self, user: int, seconds: float) -> None:
+        await database.db.execute('UPDATE fsm_storage SET updated_at = updated_at - ? WHERE user = ?',
+                                  (seconds, str(user)))
+
+    async def wait_expired(self) -> None:
+        while not self.expired:
+            await asyncio.sleep(0.01)
+
+    async def test_dialogue_survives_restart(self):
+        await self.storage.set_state(chat=-100, user=1, state='Place:address')
+        await self.storage.update_data(chat=-100, user=1, name='хинкальная')
+        await self.storage.close()
+
+        self.storage = self.create_storage()
+        self.assertEqual(await self.storage.get_state(chat=-100, user=1), 'Place:address')
+        self.assertEqual(await self.storage.get_data(chat=-100, user=1), {'name': 'хинкальная'})
+
+        # Завершенный диалог удаляется из базы
+        await self.storage.finish(chat=-100, user=1)
+        await self.storage.flush()
+        self.assertEqual(await database.db.fetchall('SELECT * FROM fsm_storage'), [])
+
+    async def test_only_stale_dialogues_expire(self):
+        for user in (1, 2):
+            await self.storage.set_state(chat=-100, user=user, state='Rating:name')
+            await self.storage.update_data(chat=-100, user=user, message_id=[user])
+        await self.storage.close()
+        await self.backdate(1, 120)
+
+        self.storage = self.create_storage()
+        self.assertEqual(await self.storage.expire(), 1)
+        self.assertEqual(self.expired, [('-100', '1', {'message_id': [1]})])
+        self.assertIsNone(await self.storage.get_state(chat=-100, user=1))
+        self.assertEqual(await self.storage.get_state(chat=-100, user=2), 'Rating:name')
+
+    async def test_dialogue_continued_in_cache_does_not_expire(self):
+        await self.storage.set_state(chat=-100, user=1, state='Place:name')
+        await self.storage.flush()
+        await self.backdate(1, 120)
+
+        # Запись в базе устарела, но пользователь продолжил диалог уже после записи изменений в базу:
+        # запись изменена только в кэше и вернется в базу при следующей записи
+        await self.storage.update_data(chat=-100, user=1, name='чайхана')
+        with mock.patch.object(self.storage, 'flush', mock.AsyncMock()):
+            self.assertEqual(await self.storage.expire(), 0)
+
+        self.assertEqual(self.expired, [])
+        await self.storage.flush()
+        (state, data), = await database.db.fetchall('SELECT state, data FROM fsm_storage')
+        self.assertEqual((state, json.loads(data)), ('Place:name', {'name': 'чайхана'}))
+
+    async def test_sweep_runs_in_background(self):
+        self.storage = self.create_storage(sweep_interval=0.02, flush_interval=0.01)
+        self.storage.ttl = 0
+        self.storage.start()
+        await self.storage.update_data(chat=-100, user=1, message_id=[5, 6])
+
+        await asyncio.wait_for(self.wait_expired(), 5)
+        self.assertEqual(self.expired, [('-100', '1', {'message_id': [5, 6]})])
+
+    async def test_evicted_records_are_read_back(self):
+        self.storage = self.create_storage(cache_size=2)
+        for user in range(5):
+            await self.storage.update_data(chat=-100, user=user, step=user)
+            await self.storage.flush()
+        self.assertLessEqual(len(self.storage._cache), 2)
+
+        for user in range(5):
+            self.assertEqual(await self.storage.get_data(chat=-100, user=user), {'step': user})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,43 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+import aiosqlite
+
+from databases.catalog import normalize_name
+from databases.migrations import MIGRATIONS, migrate, migration_script
+
+
+class MigrationsTest(unittest.IsolatedAsyncioTestCase):
+    # База создается со схемой первой миграции и заполняется так, как ее заполнял старый бот
+
+    async def asyncSetUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+        self.connection = await aiosqlite.connect(Path(self.directory.name) / 'places.db')
+        await self.connection.executescript(migration_script(*MIGRATIONS[0]))
+
+    async def asyncTearDown(self) -> None:
+        await self.connection.close()
+        self.directory.cleanup()
+
+    async def test_places_differing_in_case_and_spaces_are_merged(self):
+        await self.connection.executemany('INSERT INTO places (name, address) VALUES (?, ?)', [
+            ('хинкальная', 'ул. Руставели, 1'), ('хинкальная ', 'ул. Руставели, 2'), ('Cafe\n', 'пр. Агмашенебели, 3'),
+            ('cafe', 'пр. Агмашенебели, 4'), ('пекарня', 'ул. Леселидзе, 5'),
+        ])
+        await self.connection.executemany('INSERT INTO ratings (name, rating) VALUES (?, ?)',
+                                          [('хинкальная', 8), ('хинкальная ', 4), ('Cafe\n', 6)])
+        await self.connection.commit()
+
+        await migrate(self.connection)
+
+        async with self.connection.execute('SELECT name, address, rating_sum, rating_count FROM places '
+                                           'ORDER BY name') as cursor:
+            places = await cursor.fetchall()
+        self.assertEqual(places, [('cafe', 'пр. Агмашенебели, 3', 6, 1), ('пекарня', 'ул. Леселидзе, 5', 0, 0),
+                                  ('хинкальная', 'ул. Руставели, 1', 12, 2)])
+        self.assertTrue(all(name == normalize_name(name) for name, *_ in places))
+
+
+if __name__ == '__main__':
+    unittest.main()
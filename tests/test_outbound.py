@@ -0,0 +1,119 @@
+import asyncio
+import unittest
+
+from aiogram import exceptions
+
+from services.outbound import PRIORITY_BACKGROUND, PRIORITY_USER, OutboundDispatcher
+
+
+class StubBot:
+    # Вместо Telegram: запоминает порядок запросов; первые retry_after запросов
+    # с текстом из flood получают RetryAfter
+    def __init__(self) -> None:
+        self.sent: list[tuple[int, str]] = []
+        self.flood: dict[str, int] = {}
+        self.started = asyncio.Event()
+        self.release = asyncio.Event()
+        self.release.set()
+
+    async def send_message(self, chat_id: int, text: str, **kwargs) -> str:
+        self.started.set()
+        await self.release.wait()
+        if self.flood.get(text):
+            self.flood[text] -= 1
+            raise exceptions.RetryAfter(1)
+        self.sent.append((chat_id, text))
+        return text
+
+    async def edit_message_text(self, text: str, chat_id: int, message_id: int, **kwargs) -> str:
+        return await self.send_message(chat_id, text)
+
+    async def request(self, method: str, payload: dict) -> bool:
+        self.sent.append((payload['chat_id'], method))
+        return True
+
+
+class OutboundDispatcherTest(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self) -> None:
+        self.bot = StubBot()
+        self.outbound = OutboundDispatcher(self.bot, global_rate=1e9, chat_rate=1e9, chat_burst=1e9,
+                                           group_rate=1e9, group_burst=1e9)
+        self.outbound._global.burst = self.outbound._global.tokens = 1e9
+        self.outbound.start()
+
+    async def asyncTearDown(self) -> None:
+        self.bot.release.set()
+        await self.outbound.stop()
+
+    def test_groups_are_limited_to_twenty_messages_per_minute(self):
+        outbound = OutboundDispatcher(self.bot)
+        self.assertAlmostEqual(outbound._bucket(-100).rate * 60, 20)
+        self.assertEqual(outbound._bucket(100).rate, 1)
+
+    async def test_reply_in_group_is_not_delayed_by_deletes_and_edits(self):
+        outbound = OutboundDispatcher(self.bot, global_rate=1e9)
+        outbound._global.burst = outbound._global.tokens = 1e9
+        outbound.start()
+        try:
+            # Удаления и правки не расходуют лимит группы в 20 сообщений в минуту
+            background = [outbound.request(-100, 'deleteMessage', {'chat_id': -100, 'message_id': message_id})
+                          for message_id in range(20)]
+            background += [outbound.edit_message_text(-100, message_id, f'правка {message_id}')
+                           for message_id in range(5)]
+            reply = outbound.send_message(-100, 'ответ')
+            await asyncio.wait_for(asyncio.gather(*background, reply), 1)
+
+            # Сообщения по-прежнему ограничены: после запаса из трех сообщений следующее ждет
+            more = [asyncio.ensure_future(outbound.send_message(-100, f'еще {number}')) for number in range(3)]
+            await asyncio.sleep(0.1)
+            self.assertEqual([future.done() for future in more], [True, True, False])
+        finally:
+            await outbound.stop()
+
+    async def test_calls_of_one_chat_go_in_order_and_by_priority(self):
+        self.bot.release.clear()
+        first = asyncio.ensure_future(self.outbound.send_message(1, 'первое'))
+        await asyncio.wait_for(self.bot.started.wait(), 5)
+        # Пока в чат идет запрос, остальные ждут в очереди чата
+        later = [asyncio.ensure_future(self.outbound.send_message(1, text, priority=PRIORITY_BACKGROUND))
+                 for text in ('фон 1', 'фон 2')]
+        urgent = asyncio.ensure_future(self.outbound.send_message(1, 'ответ', priority=PRIORITY_USER))
+        other = asyncio.ensure_future(self.outbound.send_message(2, 'другой чат'))
+        await asyncio.sleep(0.05)
+        self.assertEqual(self.outbound.stats()['queue_depth'], 3)
+
+        self.bot.release.set()
+        await asyncio.wait_for(asyncio.gather(first, *later, urgent, other), 5)
+        self.assertEqual([text for chat_id, text in self.bot.sent if chat_id == 1],
+                         ['первое', 'ответ', 'фон 1', 'фон 2'])
+        self.assertEqual(self.outbound.stats()['queue_depth'], 0)
+
+    async def test_retried_edit_is_replaced_by_newer_edit(self):
+        self.bot.flood['правка 1'] = 1
+        first = asyncio.ensure_future(self.outbound.edit_message_text(1, 10, 'правка 1'))
+        await asyncio.wait_for(self.bot.started.wait(), 5)
+        while not self.outbound.retries:
+            await asyncio.sleep(0.01)
+        # Правка вернулась в очередь под своим ключом, и новая правка заменяет ее
+        second = asyncio.ensure_future(self.outbound.edit_message_text(1, 10, 'правка 2'))
+
+        self.assertEqual(await asyncio.wait_for(asyncio.gather(first, second), 5), ['правка 2', 'правка 2'])
+        self.assertEqual(self.bot.sent, [(1, 'правка 2')])
+
+    async def test_edit_queued_during_retried_call_wins(self):
+        self.bot.flood['правка 1'] = 1
+        self.bot.release.clear()
+        first = asyncio.ensure_future(self.outbound.edit_message_text(1, 10, 'правка 1'))
+        await asyncio.wait_for(self.bot.started.wait(), 5)
+        # Новая правка встала в очередь, пока первая выполнялась и получила RetryAfter
+        second = asyncio.ensure_future(self.outbound.edit_message_text(1, 10, 'правка 2'))
+        await asyncio.sleep(0.01)
+        self.bot.release.set()
+
+        self.assertEqual(await asyncio.wait_for(asyncio.gather(first, second), 5), ['правка 2', 'правка 2'])
+        self.assertEqual(self.bot.sent, [(1, 'правка 2')])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,138 @@
+import asyncio
+import json
+import tempfile
+import time
+import unittest
+from collections import Counter
+from pathlib import Path
+
+from benchmarks.bench_import import reset
+import databases.database as database
+from services.polls import (POLL_PLACE, POLL_TIME, archive_polls, iso_week, place_option, render_announcement,
+                            render_stats)
+
+
+CHAT = -100
+SLOTS = ['Суббота | 11:00', 'Суббота | 12:00', 'Воскресенье | 11:00']
+PLACES = [place_option(name, 7.5) for name in ('хинкальная', 'чайхана', 'пекарня')]
+
+
+class ArchivePollsTest(unittest.IsolatedAsyncioTestCase):
+    # Опросы и голоса записываются во временную базу так же, как их записывают send_chat_poll и VoteAggregator
+
+    async def asyncSetUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+        await reset(Path(self.directory.name) / 'polls.db')
+        self.closed_at = time.mktime((2026, 10, 14, 12, 0, 0, 0, 0, -1))
+
+    async def asyncTearDown(self) -> None:
+        await database.db.close()
+        self.directory.cleanup()
+
+    async def open_polls(self, cycle: str, chat_id: int = CHAT) -> tuple[str, str]:
+        time_poll, place_poll = f'{cycle}t', f'{cycle}p'
+        await database.save_polls([(time_poll, chat_id, POLL_TIME, json.dumps(SLOTS), 1),
+                                   (place_poll, chat_id, POLL_PLACE, json.dumps(PLACES), 2)])
+        return time_poll, place_poll
+
+    async def vote(self, answers: dict[tuple[str, int], tuple[int, ...]]) -> None:
+        deltas = Counter((poll_id, option_id) for (poll_id, _), option_ids in answers.items() for option_id in option_ids)
+        await database.save_poll_answers(answers, deltas)
+
+    async def test_results_and_archive(self):
+        time_poll, place_poll = await self.open_polls('1')
+        await self.vote({(time_poll, 1): (0, 1), (time_poll, 2): (1,), (place_poll, 1): (2,), (place_poll, 3): (0, 2)})
+
+        results, archived = await archive_polls(CHAT, self.closed_at)
+        self.assertCountEqual(archived, [(time_poll, 1), (place_poll, 2)])
+        winners = {result.kind: (result.winners, result.top_votes, result.total_votes) for result in results}
+        self.assertEqual(winners, {POLL_TIME: ([1], 2, 3), POLL_PLACE: ([2], 2, 3)})
+        self.assertEqual(render_announcement(results).splitlines()[-2:],
+                         [f'Когда: {SLOTS[1]}', PLACES[2]])
+
+        archive = await database.db.fetchall('SELECT poll_id, kind, results, winners, total_votes, voters '
+                                             'FROM poll_archive ORDER BY poll_id')
+        self.assertEqual(archive, [
+            (place_poll, POLL_PLACE, json.dumps([[text, votes] for text, votes in zip(PLACES, (1, 0, 2))],
+                                                ensure_ascii=False), '[2]', 3, 2),
+            (time_poll, POLL_TIME, json.dumps([[text, votes] for text, votes in zip(SLOTS, (1, 2, 0))],
+                                              ensure_ascii=False), '[1]', 3, 2),
+        ])
+        # Опросы и голоса удалены из текущих таблиц
+        for table in ('poll_data', 'poll_results', 'poll_answers'):
+            self.assertEqual(await database.db.fetchall(f'SELECT * FROM {table}'), [], table)
+
+    async def test_ties_and_polls_without_votes(self):
+        time_poll, place_poll = await self.open_polls('1')
+        other_time, _ = await self.open_polls('2', chat_id=CHAT - 1)
+        await self.vote({(time_poll, 1): (2,), (time_poll, 2): (0,), (time_poll, 3): (1,), (other_time, 1): (0,)})
+
+        results, _ = await archive_polls(CHAT, self.closed_at)
+        winners = {result.poll_id: (result.winners, result.top_votes, result.total_votes) for result in results}
+        # Все варианты с наибольшим числом голосов - победители, в порядке вариантов; опросы другого чата не входят
+        self.assertEqual(winners, {time_poll: ([0, 1, 2], 1, 3), place_poll: ([], 0, 0)})
+        self.assertEqual(render_announcement(results), 'Нет достаточного количества данных для вывода результатов.')
+
+        # При ничьей в объявлении перечисляются все победители
+        time_poll, place_poll = await self.open_polls('3')
+        await self.vote({(time_poll, 1): (0,), (time_poll, 2): (1,), (place_poll, 1): (0,), (place_poll, 2): (2,)})
+        results, _ = await archive_polls(CHAT, self.closed_at)
+        self.assertEqual(render_announcement(results).splitlines()[-2:],
+                         [f'Когда: {SLOTS[0]} или {SLOTS[1]}', f'{PLACES[0]} или {PLACES[2]}'])
+
+    async def test_stats_accumulate_across_weeks(self):
+        for week in range(3):
+            time_poll, place_poll = await self.open_polls(str(week))
+            # Пекарня побеждает дважды, хинкальная - один раз
+            place = 0 if week == 1 else 2
+            await self.vote({(time_poll, 1): (0,), (place_poll, 1): (place,), (place_poll, 2): (place,)})
+            await archive_polls(CHAT, self.closed_at + week * 7 * 86400)
+
+        places, time_slots, turnout = await database.get_poll_stats(CHAT, 5)
+        self.assertEqual(places[:2], [('пекарня', 2, 3, 4), ('хинкальная', 1, 3, 2)])
+        self.assertEqual(time_slots[0], (SLOTS[0], 3, 3))
+        self.assertEqual([row[0] for row in turnout],
+                         [iso_week(self.closed_at + week * 7 * 86400) for week in (2, 1, 0)])
+        self.assertEqual(turnout[0][1:], (2, 2, 3))
+
+        text = render_stats(places, time_slots, turnout)
+        self.assertIn('1. пекарня - побед: 2 из 3, голосов: 4', text)
+        # Статистика другого чата пуста
+        self.assertIn('Статистики пока нет', render_stats(*await database.get_poll_stats(CHAT - 1, 5)))
+
+    async def test_turnout_counts_each_voter_once_per_week(self):
+        # Два цикла опросов за одну неделю с одними и теми же голосующими
+        for cycle, voters in (('1', (1, 2)), ('2', (2, 3))):
+            time_poll, _ = await self.open_polls(cycle)
+            await self.vote({(time_poll, user_id): (0,) for user_id in voters})
+            await archive_polls(CHAT, self.closed_at)
+
+        (week, polls, voters, votes), = (await database.get_poll_stats(CHAT, 5))[2]
+        self.assertEqual((week, polls, voters, votes), (iso_week(self.closed_at), 4, 3, 4))
+
+    async def test_vote_during_archive_is_in_results_and_archive_or_dropped(self):
+        time_poll, _ = await self.open_polls('1')
+        await self.vote({(time_poll, 1): (0,)})
+
+        # Голос записывается одновременно с подведением итогов
+        (results, _), _ = await asyncio.gather(archive_polls(CHAT, self.closed_at), self.vote({(time_poll, 2): (0,)}))
+        total = {result.poll_id: result.total_votes for result in results}[time_poll]
+        archived_total = await database.db.fetchone('SELECT total_votes FROM poll_archive WHERE poll_id = ?',
+                                                     (time_poll,))
+        self.assertEqual(total, archived_total[0])
+        self.assertEqual(await database.db.fetchall('SELECT * FROM poll_results'), [])
+
+    async def test_old_archive_is_pruned(self):
+        await self.open_polls('1')
+        await archive_polls(CHAT, self.closed_at, retention_days=30)
+        await self.open_polls('2')
+        await archive_polls(CHAT, self.closed_at + 31 * 86400, retention_days=30)
+
+        self.assertEqual(await database.db.fetchall('SELECT poll_id FROM poll_archive ORDER BY poll_id'),
+                         [('2p',), ('2t',)])
+        # Накопленная статистика при этом не удаляется
+        self.assertEqual(len((await database.get_poll_stats(CHAT, 5))[2]), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+from benchmarks.bench_import import reset
+import databases.database as database
+
+
+class AddRatingTest(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+        await reset(Path(self.directory.name) / 'ratings.db')
+        await database.add_place('Хинкальная', 'ул. Руставели, 1')
+
+    async def asyncTearDown(self) -> None:
+        await database.db.close()
+        self.directory.cleanup()
+
+    async def place_totals(self, name: str) -> tuple:
+        return await database.db.fetchone('SELECT rating_sum, rating_count, rating FROM places WHERE name = ?', (name,))
+
+    async def test_one_rating_per_user(self):
+        self.assertTrue(await database.add_rating('Хинкальная', 1, 8))
+        self.assertTrue(await database.add_rating('хинкальная ', 2, 4))
+        self.assertEqual(await self.place_totals('хинкальная'), (12, 2, 6.0))
+
+    async def test_new_rating_replaces_previous(self):
+        await database.add_rating('хинкальная', 1, 8)
+        await database.add_rating('хинкальная', 2, 4)
+        await database.add_rating('хинкальная', 1, 2)
+
+        self.assertEqual(await self.place_totals('хинкальная'), (6, 2, 3.0))
+        self.assertEqual((await database.get_place('хинкальная')).rating, 3.0)
+        self.assertEqual(await database.db.fetchall('SELECT user_id, rating FROM ratings ORDER BY user_id'),
+                         [(1, 2), (2, 4)])
+        # В журнал попадает каждая оценка, в том числе замененная
+        self.assertEqual(await database.db.fetchall('SELECT user_id, rating FROM rating_events ORDER BY rowid'),
+                         [(1, 8), (2, 4), (1, 2)])
+
+    async def test_rating_of_missing_place_is_not_saved(self):
+        self.assertFalse(await database.add_rating('чайхана', 1, 9))
+        self.assertEqual(await database.db.fetchall('SELECT * FROM ratings'), [])
+        self.assertEqual(await database.db.fetchall('SELECT * FROM rating_events'), [])
+
+        # Место с тем же названием, добавленное позже, начинает без оценок
+        await database.add_place('чайхана', 'ул. Леселидзе, 5')
+        self.assertEqual(await self.place_totals('чайхана'), (0, 0, 0))
+
+    async def test_deleted_place_loses_its_ratings(self):
+        await database.add_rating('хинкальная', 1, 8)
+        await database.delete_place('хинкальная')
+        await database.add_place('хинкальная', 'ул. Руставели, 1')
+
+        self.assertEqual(await self.place_totals('хинкальная'), (0, 0, 0))
+        self.assertTrue(await database.add_rating('хинкальная', 1, 6))
+        self.assertEqual(await self.place_totals('хинкальная'), (6, 1, 6.0))
+
+
+if __name__ == '__main__':
+    unittest.main()
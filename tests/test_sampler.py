@@ -0,0 +1,82 @@
+import random
+import unittest
+
+from databases.sampler import RandomPlacePicker
+
+
+PLACES = [(rowid, rowid % 11) for rowid in range(1, 201)]
+
+
+def make_picker(seed: int, poll_exclude: int = 1) -> RandomPlacePicker:
+    picker = RandomPlacePicker(poll_exclude=poll_exclude, rng=random.Random(seed))
+    picker.load(PLACES)
+    return picker
+
+
+def run_polls(picker: RandomPlacePicker, chat_id: int, polls: int, k: int) -> list[list[int]]:
+    # Опросы подряд, как в get_poll_places и record_poll_places
+    history = []
+    for _ in range(polls):
+        rowids = picker.sample_for_poll(chat_id, k)
+        picker.record_poll(chat_id, rowids)
+        history.append(rowids)
+    return history
+
+
+class SampleForPollTest(unittest.TestCase):
+
+    def test_same_seed_gives_same_polls(self):
+        self.assertEqual(run_polls(make_picker(42), 1, 20, 7), run_polls(make_picker(42), 1, 20, 7))
+        self.assertNotEqual(run_polls(make_picker(42), 1, 20, 7), run_polls(make_picker(43), 1, 20, 7))
+
+    def test_same_seed_gives_same_reservoir_sample(self):
+        first, second = make_picker(7), make_picker(7)
+        for picker in (first, second):
+            picker.record_poll(1, range(1, 51))
+        self.assertEqual(first.reservoir_for_poll(1, 30), second.reservoir_for_poll(1, 30))
+
+    def test_options_are_distinct(self):
+        for rowids in run_polls(make_picker(1), 1, 50, 7):
+            self.assertEqual(len(rowids), len(set(rowids)))
+
+    def test_places_from_last_polls_are_not_offered(self):
+        for poll_exclude in (1, 2, 3):
+            with self.subTest(poll_exclude=poll_exclude):
+                history = run_polls(make_picker(3, poll_exclude), 1, 60, 10)
+                for number, rowids in enumerate(history):
+                    recent = {rowid for previous in history[max(0, number - poll_exclude):number]
+                              for rowid in previous}
+                    self.assertFalse(recent & set(rowids), f'опрос {number}')
+
+    def test_exclusion_is_per_chat(self):
+        picker = make_picker(5)
+        picker.record_poll(1, [rowid for rowid, _ in PLACES[:195]])
+        # В чате 1 осталось пять подходящих мест, в чате 2 исключений нет
+        self.assertEqual(set(picker.sample_for_poll(1, 5)), {rowid for rowid, _ in PLACES[195:]})
+        self.assertEqual(picker.poll_weight(2, 0), PLACES[0][1] + 1)
+
+    def test_reservoir_falls_back_to_least_recently_offered(self):
+        picker = make_picker(11, poll_exclude=2)
+        picker.record_poll(1, [rowid for rowid, _ in PLACES[:100]])
+        picker.record_poll(1, [rowid for rowid, _ in PLACES[100:195]])
+        # Подходящих мест пять, остальные два берутся из опроса, который был раньше
+        rowids = picker.sample_for_poll(1, 7)
+        self.assertEqual(len(set(rowids)), 7)
+        self.assertTrue({rowid for rowid, _ in PLACES[195:]} <= set(rowids))
+        self.assertTrue(all(rowid <= 100 for rowid in set(rowids) - {rowid for rowid, _ in PLACES[195:]}))
+
+    def test_weight_recovers_after_exclusion(self):
+        picker = make_picker(13, poll_exclude=1)
+        position = 0
+        full = PLACES[0][1] + 1
+        picker.record_poll(1, [PLACES[0][0]])
+        self.assertEqual(picker.poll_weight(1, position), 0.0)
+        weights = []
+        for _ in range(4):
+            picker.record_poll(1, [])
+            weights.append(picker.poll_weight(1, position))
+        self.assertEqual(weights, [full / 2, full * 3 / 4, full * 7 / 8, full * 15 / 16])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,137 @@
+import asyncio
+import sqlite3
+import tempfile
+import time
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from benchmarks.bench_import import reset
+import databases.database as database
+from services.scheduler import JobScheduler
+
+
+EVERY_MINUTE = '* * * * *'
+YEARLY = '0 0 1 1 *'
+
+
+class JobSchedulerTest(unittest.IsolatedAsyncioTestCase):
+    # Расписание и журнал запусков хранятся во временной базе; пропущенные запуски
+    # имитируются сохраненным next_run_at в прошлом, как после остановки бота
+
+    async def asyncSetUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+        await reset(Path(self.directory.name) / 'scheduler.db')
+        self.calls: list[tuple[str, int]] = []
+
+    async def asyncTearDown(self) -> None:
+        await database.db.close()
+        self.directory.cleanup()
+
+    def make_scheduler(self, misfire_grace: float = 3600) -> JobScheduler:
+        async def job(chat_id: int) -> None:
+            self.calls.append(('job', chat_id))
+
+        return JobScheduler({'job': job}, misfire_grace=misfire_grace, timezone='UTC', retry_delay=0.01)
+
+    async def run_due(self, scheduler: JobScheduler) -> None:
+        # Запускает планировщик и останавливает его, когда все пропущенные запуски обработаны:
+        # следующий запуск каждого задания сохранен в базе (в одной транзакции с журналом запусков),
+        # и планировщик успел запустить задания
+        now = time.time()
+        scheduler.start()
+        try:
+            while True:
+                jobs = await database.get_scheduled_jobs()
+                if len(jobs) == len(scheduler._schedules) and all(next_run_at > now for *_, next_run_at in jobs):
+                    break
+                await asyncio.sleep(0.01)
+            await asyncio.sleep(0.1)
+        finally:
+            await asyncio.wait_for(scheduler.stop(), 5)
+
+    async def test_missed_runs_are_coalesced_into_one(self):
+        await database.save_scheduled_jobs([('job', 1, EVERY_MINUTE, time.time() - 600)])
+        scheduler = self.make_scheduler()
+        scheduler.add_schedule('job', 1, EVERY_MINUTE)
+        await self.run_due(scheduler)
+
+        self.assertEqual(self.calls, [('job', 1)])
+        runs = await database.db.fetchall('SELECT run_key, finished_at, error FROM job_runs')
+        self.assertEqual(len(runs), 1)
+        run_key, finished_at, error = runs[0]
+        # Запуск записан по последнему пропущенному плановому времени
+        self.assertTrue(run_key.startswith('job:1:'))
+        self.assertLess(time.time() - int(run_key.rsplit(':', 1)[1]), 60)
+        self.assertIsNotNone(finished_at)
+        self.assertIsNone(error)
+
+    async def test_run_later_than_misfire_grace_is_skipped(self):
+        await database.save_scheduled_jobs([('job', 1, YEARLY, time.time() - 3600),
+                                            ('job', 2, YEARLY, time.time() - 10)])
+        scheduler = self.make_scheduler(misfire_grace=60)
+        scheduler.add_schedule('job', 1, YEARLY)
+        scheduler.add_schedule('job', 2, YEARLY)
+        await self.run_due(scheduler)
+
+        self.assertEqual(self.calls, [('job', 2)])
+        self.assertEqual(await database.db.fetchall('SELECT run_key FROM job_runs WHERE run_key LIKE ?', ('job:1:%',)),
+                         [])
+        # Следующий запуск пропущенного задания все равно перенесен в будущее
+        jobs = {chat_id: next_run_at for _, chat_id, _, next_run_at in await database.get_scheduled_jobs()}
+        self.assertGreater(jobs[1], time.time())
+
+    async def test_claimed_run_key_is_not_run_again(self):
+        next_run_at = time.time() - 10
+        await database.save_scheduled_jobs([('job', 1, YEARLY, next_run_at)])
+        # Тот же плановый запуск уже выполнен (например, до перезапуска бота или другим экземпляром)
+        await database.claim_job_runs([f'job:1:{int(next_run_at)}'], [], time.time())
+        scheduler = self.make_scheduler()
+        scheduler.add_schedule('job', 1, YEARLY)
+        await self.run_due(scheduler)
+
+        self.assertEqual(self.calls, [])
+
+    async def test_interrupted_run_is_marked_and_not_repeated(self):
+        await database.claim_job_runs(['job:1:100'], [], time.time() - 60)
+        scheduler = self.make_scheduler()
+        scheduler.add_schedule('job', 1, YEARLY)
+        with self.assertLogs('services.scheduler', 'WARNING'):
+            await self.run_due(scheduler)
+
+        self.assertEqual(self.calls, [])
+        self.assertEqual(await database.db.fetchall('SELECT error FROM job_runs WHERE run_key = ?', ('job:1:100',)),
+                         [('interrupted',)])
+
+    async def test_database_error_does_not_stop_scheduler(self):
+        await database.save_scheduled_jobs([('job', 1, YEARLY, time.time() - 10)])
+        scheduler = self.make_scheduler()
+        scheduler.add_schedule('job', 1, YEARLY)
+        # Первая запись запуска падает, как при database is locked: запуск повторяется после паузы
+        errors = [sqlite3.OperationalError('database is locked')]
+
+        async def claim_job_runs(*args):
+            if errors:
+                raise errors.pop()
+            return await database.claim_job_runs(*args)
+
+        with mock.patch('services.scheduler.claim_job_runs', claim_job_runs), \
+                self.assertLogs('services.scheduler', 'ERROR'):
+            await self.run_due(scheduler)
+
+        self.assertEqual(self.calls, [('job', 1)])
+
+    async def test_changed_schedule_is_not_treated_as_missed(self):
+        await database.save_scheduled_jobs([('job', 1, EVERY_MINUTE, time.time() - 600)])
+        scheduler = self.make_scheduler()
+        scheduler.add_schedule('job', 1, YEARLY)
+        await self.run_due(scheduler)
+
+        self.assertEqual(self.calls, [])
+        (cron, next_run_at), = [(cron, next_run_at) for _, _, cron, next_run_at in await database.get_scheduled_jobs()]
+        self.assertEqual(cron, YEARLY)
+        self.assertGreater(next_run_at, time.time())
+
+
+if __name__ == '__main__':
+    unittest.main()
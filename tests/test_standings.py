@@ -0,0 +1,134 @@
+import asyncio
+import json
+import tempfile
+import unittest
+from collections import Counter
+from pathlib import Path
+from types import SimpleNamespace
+
+from benchmarks.bench_import import reset
+import databases.database as database
+from services.polls import POLL_PLACE, POLL_TIME
+from services.standings import StandingsBoard, render_standings
+
+
+POLLS = [('t', POLL_TIME, ['Суббота | 11:00', 'Суббота | 12:00']),
+         ('p', POLL_PLACE, ['Место: первое | Рейтинг: 5', 'Место: второе | Рейтинг: 7'])]
+
+
+class StubOutbound:
+    # Вместо OutboundDispatcher: запоминает отправленные тексты и правки;
+    # sendMessage ждет release, чтобы голоса пришли во время open
+    def __init__(self) -> None:
+        self.sent: list[str] = []
+        self.edits: list[str] = []
+        self.release = asyncio.Event()
+        self.release.set()
+
+    async def send_message(self, chat_id: int, text: str, **kwargs) -> SimpleNamespace:
+        await self.release.wait()
+        self.sent.append(text)
+        return SimpleNamespace(message_id=len(self.sent))
+
+    async def edit_message_text(self, chat_id: int, message_id: int, text: str, **kwargs) -> None:
+        self.edits.append(text)
+
+    async def pin_chat_message(self, chat_id: int, message_id: int, **kwargs) -> bool:
+        return True
+
+    async def unpin_chat_message(self, chat_id: int, message_id: int, **kwargs) -> bool:
+        return True
+
+
+def expected_text(votes: dict[tuple[str, int], int]) -> str:
+    tallies = {}
+    for (poll_id, option_id), count in votes.items():
+        tallies.setdefault(poll_id, Counter())[option_id] = count
+    return render_standings(POLLS, tallies)
+
+
+class StandingsBoardTest(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+        await reset(Path(self.directory.name) / 'standings.db')
+        self.outbound = StubOutbound()
+        self.board = StandingsBoard(self.outbound, interval=0.05)
+
+    async def asyncTearDown(self) -> None:
+        await self.board.stop()
+        await database.db.close()
+        self.directory.cleanup()
+
+    async def settle(self) -> None:
+        # Дожидаемся отложенной правки
+        await asyncio.sleep(self.board.interval * 3)
+
+    async def test_votes_during_open_are_counted(self):
+        self.outbound.release.clear()
+        opening = asyncio.create_task(self.board.open(-100, POLLS))
+        await asyncio.sleep(0.01)
+        self.board.apply(Counter({('t', 1): 2, ('p', 0): 1}))
+        self.outbound.release.set()
+        await opening
+        await self.settle()
+
+        self.assertEqual(self.outbound.edits[-1], expected_text({('t', 1): 2, ('p', 0): 1}))
+
+    async def test_votes_before_open_are_counted(self):
+        # Голоса за первый опрос приходят, пока отправляется второй
+        self.board.watch(-100, POLLS[:1])
+        self.board.apply(Counter({('t', 0): 3}))
+        await self.board.open(-100, POLLS)
+
+        self.assertEqual(self.outbound.sent, [expected_text({('t', 0): 3})])
+
+    async def test_votes_within_interval_are_one_edit(self):
+        self.board.interval = 0.2
+        await self.board.open(-100, POLLS)
+        for option_id in (0, 1, 1, 0, 1):
+            self.board.apply(Counter({('t', option_id): 1}))
+            await asyncio.sleep(0.01)
+
+        # Первая правка не раньше чем через interval после отправки сообщения
+        self.assertEqual(self.outbound.edits, [])
+        await self.settle()
+        self.assertEqual(self.outbound.edits, [expected_text({('t', 0): 2, ('t', 1): 3})])
+        self.assertEqual(self.board.stats()['coalesced'], 4)
+
+    async def test_unchanged_text_is_not_sent(self):
+        await self.board.open(-100, POLLS)
+        # Голос отдан и отозван до правки
+        self.board.apply(Counter({('p', 1): 1}))
+        self.board.apply(Counter({('p', 1): -1}))
+        await self.settle()
+
+        self.assertEqual(self.outbound.edits, [])
+        self.assertEqual(self.board.stats()['skipped'], 1)
+
+    async def test_close_sends_final_votes_at_once(self):
+        self.board.interval = 10
+        await self.board.open(-100, POLLS)
+        self.board.apply(Counter({('p', 0): 2}))
+        await self.board.close(-100)
+
+        self.assertEqual(self.outbound.edits, [expected_text({('p', 0): 2})])
+        self.assertEqual(await database.db.fetchall('SELECT * FROM poll_standings'), [])
+        # Голоса закрытых опросов больше не вызывают правок
+        self.board.apply(Counter({('p', 1): 1}))
+        self.assertEqual(self.board.stats()['chats'], 0)
+
+    async def test_start_skips_votes_of_unknown_polls(self):
+        # Опрос 'x' есть в сообщении с итогами, но не в poll_data: его голоса записаны раньше, чем сам опрос
+        await database.save_polls([('t', -100, POLL_TIME, json.dumps(POLLS[0][2]), 1)])
+        await database.save_poll_answers({('t', 1): (0,), ('x', 1): (1,)}, Counter({('t', 0): 1, ('x', 1): 1}))
+        await database.save_poll_standings(-100, 7, ['t', 'x'])
+
+        await self.board.start()
+        self.board.apply(Counter({('t', 1): 1}))
+        await self.settle()
+        self.assertEqual(self.outbound.edits, [render_standings(POLLS[:1], {'t': Counter({0: 1, 1: 1})})])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+import json
+import tempfile
+import unittest
+from pathlib import Path
+
+from benchmarks.bench_import import reset
+import databases.database as database
+from services.transfer import TransferError, export_places, import_places
+
+
+class TransferTest(unittest.IsolatedAsyncioTestCase):
+    # Файлы импорта создаются во временном каталоге рядом с базой
+
+    async def asyncSetUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = Path(self.directory.name)
+        await reset(self.path / 'transfer.db')
+
+    async def asyncTearDown(self) -> None:
+        await database.db.close()
+        self.directory.cleanup()
+
+    def write(self, filename: str, content: str | bytes) -> Path:
+        path = self.path / filename
+        if isinstance(content, bytes):
+            path.write_bytes(content)
+        else:
+            path.write_text(content, encoding='utf-8')
+        return path
+
+    async def places(self) -> list[tuple]:
+        return await database.db.fetchall('SELECT name, address FROM places ORDER BY name')
+
+    async def test_duplicates_update_one_place(self):
+        await database.add_place('хинкальная', 'ул. Руставели, 1')
+        await database.add_rating('хинкальная', 1, 8)
+        path = self.write('places.csv', 'Name;Address\n'
+                                        'Хинкальная ;ул. Руставели, 2\n'
+                                        'пекарня;ул. Леселидзе, 5\n'
+                                        ';без названия\n'
+                                        'ПЕКАРНЯ;ул. Леселидзе, 7\n')
+
+        result = await import_places(path, 'places.csv', chunk_size=2)
+        self.assertEqual(result.skipped, 1)
+        self.assertEqual(await self.places(), [('пекарня', 'ул. Леселидзе, 7'), ('хинкальная', 'ул. Руставели, 2')])
+        # У существующего места обновляется только адрес, оценки сохраняются
+        self.assertEqual((await database.get_place('хинкальная')).rating, 8)
+
+    async def test_malformed_json_stops_import_with_record_number(self):
+        records = [{'name': f'место {number}', 'address': 'адрес'} for number in range(1, 4)]
+        path = self.write('places.jsonl', '\n'.join(json.dumps(record, ensure_ascii=False) for record in records)
+                          + '\n{"name": "место 4", "address": \n{"name": "место 5"}\n')
+
+        with self.assertRaises(TransferError) as raised:
+            await import_places(path, 'places.jsonl', chunk_size=2)
+        self.assertIn('запись №4', str(raised.exception))
+        self.assertIn('Уже сохранено мест: 2', str(raised.exception))
+        # Пачки, записанные до ошибки, остаются в базе
+        self.assertEqual([name for name, _ in await self.places()], ['место 1', 'место 2'])
+
+    async def test_invalid_files_are_rejected(self):
+        cases = [
+            ('places.csv', 'title,address\nхинкальная,ул. Руставели, 1\n', 'среди них name'),
+            ('places.json', '[{"name": "хинкальная"}, ["пекарня"]]', 'запись №2'),
+            ('places.csv', 'name,address\nхинкальная,адрес\n'.encode() + b'\xff\xfe,\n', 'запись №'),
+            ('places.txt', 'хинкальная', 'Поддерживаются файлы'),
+        ]
+        for filename, content, message in cases:
+            with self.subTest(filename=filename, message=message):
+                with self.assertRaises(TransferError) as raised:
+                    await import_places(self.write(filename, content), filename)
+                self.assertIn(message, str(raised.exception))
+
+    async def test_export_can_be_imported_back(self):
+        await database.upsert_places([('хинкальная', 'ул. Руставели, 1'), ('пекарня', 'ул. Леселидзе, "5"')])
+        path = self.path / 'export.csv'
+        self.assertEqual(await export_places(path), 2)
+
+        await database.delete_place('пекарня')
+        result = await import_places(path, 'export.csv')
+        self.assertEqual(result, (2, 0))
+        self.assertEqual(await self.places(), [('пекарня', 'ул. Леселидзе, "5"'), ('хинкальная', 'ул. Руставели, 1')])
+
+
+if __name__ == '__main__':
+    unittest.main()
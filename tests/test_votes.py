@@ -0,0 +1,97 @@
+import json
+import tempfile
+import unittest
+from collections import Counter
+from pathlib import Path
+
+from benchmarks.bench_import import reset
+import databases.database as database
+from services.polls import POLL_TIME, archive_polls
+from services.votes import VoteAggregator
+
+
+OPTIONS = ['Суббота | 11:00', 'Суббота | 12:00', 'Суббота | 15:00']
+
+
+class VoteAggregatorTest(unittest.IsolatedAsyncioTestCase):
+    # Голоса записываются во временную базу; observer запоминает изменения, переданные после каждой записи
+
+    async def asyncSetUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+        await reset(Path(self.directory.name) / 'votes.db')
+        self.votes = VoteAggregator()
+        self.observed = Counter()
+        self.votes.observer = self.observed.update
+
+    async def asyncTearDown(self) -> None:
+        await database.db.close()
+        self.directory.cleanup()
+
+    async def save_poll(self, poll_id: str, chat_id: int = -100) -> None:
+        await database.save_polls([(poll_id, chat_id, POLL_TIME, json.dumps(OPTIONS), 1)])
+
+    async def poll_votes(self, poll_id: str) -> dict[int, int]:
+        rows = await database.db.fetchall('SELECT option_id, votes FROM poll_results WHERE poll_id = ? AND votes != 0',
+                                          (poll_id,))
+        return dict(rows)
+
+    async def test_only_last_answer_before_flush_is_counted(self):
+        await self.save_poll('p1')
+        self.votes.add('p1', 1, [0])
+        self.votes.add('p1', 1, [1, 2])
+        self.votes.add('p1', 2, [1])
+        await self.votes.flush()
+
+        self.assertEqual(await self.poll_votes('p1'), {1: 2, 2: 1})
+        self.assertEqual(self.observed, Counter({('p1', 1): 2, ('p1', 2): 1}))
+
+    async def test_changed_and_retracted_votes(self):
+        await self.save_poll('p1')
+        self.votes.add('p1', 1, [0])
+        self.votes.add('p1', 2, [0])
+        await self.votes.flush()
+
+        # Первый пользователь переголосовал, второй отозвал голос
+        self.votes.add('p1', 1, [2])
+        self.votes.add('p1', 2, [])
+        await self.votes.flush()
+        self.assertEqual(await self.poll_votes('p1'), {2: 1})
+        self.assertEqual(+self.observed, Counter({('p1', 2): 1}))
+
+    async def test_previous_answers_are_read_after_restart(self):
+        await self.save_poll('p1')
+        self.votes.add('p1', 1, [0, 1])
+        await self.votes.flush()
+
+        # Новый агрегатор (после перезапуска) знает о старом выборе только из poll_answers
+        votes = VoteAggregator()
+        votes.add('p1', 1, [1])
+        await votes.flush()
+        self.assertEqual(await self.poll_votes('p1'), {1: 1})
+        self.assertEqual(await database.get_poll_answers([('p1', 1), ('p1', 2)]), {('p1', 1): (1,), ('p1', 2): ()})
+
+    async def test_vote_before_poll_is_saved_is_kept(self):
+        # Голос пришел, пока send_chat_poll еще не записал опрос в poll_data
+        self.votes.add('p1', 1, [0])
+        await self.votes.flush()
+        await self.save_poll('p1')
+
+        self.assertEqual(await self.poll_votes('p1'), {0: 1})
+        self.assertEqual(self.observed, Counter({('p1', 0): 1}))
+
+    async def test_vote_after_archive_is_dropped(self):
+        await self.save_poll('p1')
+        self.votes.add('p1', 1, [0])
+        await self.votes.flush()
+        await archive_polls(-100)
+
+        self.votes.add('p1', 2, [1])
+        await self.votes.flush()
+        self.assertEqual(await self.poll_votes('p1'), {})
+        self.assertEqual(await database.db.fetchall('SELECT * FROM poll_answers'), [])
+        self.assertNotIn(('p1', 2), self.votes._selections)
+        self.assertEqual(self.observed, Counter({('p1', 0): 1}))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,143 @@
+import asyncio
+import unittest
+from typing import Optional
+
+import aiohttp
+from aiogram import Bot, Dispatcher, types
+from aiogram.bot.api import TelegramAPIServer
+from aiogram.dispatcher.webhook import BOT_DISPATCHER_KEY
+from aiohttp import web
+
+from benchmarks.fake_bot_api import FakeBotAPI, message_update
+from services.pipeline import UpdatePipeline
+from config_data.config import WebhookConfig
+from services.webhook import FastWebhookRequestHandler, create_webhook_app, register_webhook
+
+
+TOKEN = '123456:test'
+SECRET = 'secret'
+
+
+class WebhookTest(unittest.IsolatedAsyncioTestCase):
+    # Вебхук на FastWebhookRequestHandler: обновления присылает поддельный Bot API,
+    # обработчик сообщений ждет release, чтобы проверить, что Telegram получает ответ раньше
+
+    async def asyncSetUp(self) -> None:
+        self.api = FakeBotAPI()
+        await self.api.start()
+        self.dp = Dispatcher(Bot(TOKEN, server=TelegramAPIServer.from_base(self.api.url)))
+        self.started = asyncio.Event()
+        self.release = asyncio.Event()
+        self.handled: list[str] = []
+
+        @self.dp.message_handler()
+        async def handle(message: types.Message):
+            self.started.set()
+            await self.release.wait()
+            self.handled.append(message.text)
+
+        self.pipeline = UpdatePipeline(self.dp, workers=4)
+        app = create_webhook_app(SECRET, self.pipeline)
+        app[BOT_DISPATCHER_KEY] = self.dp
+        app['_check_ip'] = False
+        app.router.add_route('*', '/webhook', FastWebhookRequestHandler)
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, '127.0.0.1', 0)
+        await site.start()
+        self.url = f'http://127.0.0.1:{site._server.sockets[0].getsockname()[1]}/webhook'
+
+        Bot.set_current(self.dp.bot)
+        Dispatcher.set_current(self.dp)
+        self.pipeline.start()
+        self.session = aiohttp.ClientSession()
+
+    async def asyncTearDown(self) -> None:
+        self.release.set()
+        await self.session.close()
+        await self.runner.cleanup()
+        await self.pipeline.stop()
+        await (await self.dp.bot.get_session()).close()
+        await self.api.stop()
+
+    async def post(self, update: dict, secret_token: Optional[str] = None) -> aiohttp.ClientResponse:
+        headers = {'X-Telegram-Bot-Api-Secret-Token': secret_token} if secret_token is not None else {}
+        async with self.session.post(self.url, json=update, headers=headers) as response:
+            await response.read()
+            return response
+
+    async def wait_handled(self, count: int) -> None:
+        while len(self.handled) < count:
+            await asyncio.sleep(0.01)
+
+    async def test_update_is_acknowledged_before_it_is_handled(self):
+        response = await asyncio.wait_for(self.post(message_update(1, -100, 10, 'привет'), SECRET), 5)
+        self.assertEqual(response.status, 200)
+
+        await asyncio.wait_for(self.started.wait(), 5)
+        self.assertEqual(self.handled, [])
+        self.release.set()
+        await asyncio.wait_for(self.pipeline.stop(), 5)
+        self.assertEqual(self.handled, ['привет'])
+
+    async def test_updates_from_telegram_reach_dispatcher(self):
+        self.release.set()
+        await self.dp.bot.set_webhook(self.url, secret_token=SECRET)
+        for update_id in range(1, 6):
+            self.api.push_update(message_update(update_id, -100 - update_id, 10, f'сообщение {update_id}'))
+
+        await asyncio.wait_for(self.wait_handled(5), 5)
+        self.assertCountEqual(self.handled, [f'сообщение {update_id}' for update_id in range(1, 6)])
+
+    async def test_wrong_or_missing_secret_token_is_rejected(self):
+        for secret_token in ('wrong', '', None):
+            with self.subTest(secret_token=secret_token):
+                response = await self.post(message_update(1, -100, 10, 'чужое'), secret_token)
+                self.assertEqual(response.status, 401)
+
+        self.release.set()
+        await self.pipeline.stop()
+        self.assertEqual(self.pipeline.processed, 0)
+        self.assertEqual(self.handled, [])
+
+    async def test_in_flight_updates_are_drained_on_shutdown(self):
+        for update_id in range(1, 21):
+            response = await self.post(message_update(update_id, -100 - update_id % 3, update_id, str(update_id)),
+                                       SECRET)
+            self.assertEqual(response.status, 200)
+        await asyncio.wait_for(self.started.wait(), 5)
+        self.assertEqual(self.handled, [])
+
+        # Принятые обновления дообрабатываются, даже если вебхук уже не принимает новые
+        await self.runner.cleanup()
+        self.release.set()
+        await asyncio.wait_for(self.pipeline.stop(), 5)
+        self.assertEqual(self.pipeline.processed, 20)
+        self.assertCountEqual(self.handled, [str(update_id) for update_id in range(1, 21)])
+
+    async def test_webhook_is_registered_after_startup(self):
+        config = WebhookConfig(True, self.url.removesuffix('/webhook'), '/webhook', '127.0.0.1', 0, SECRET)
+        registered_on_startup = []
+
+        async def on_startup(dispatcher: Dispatcher) -> None:
+            registered_on_startup.append(self.api._webhook_url)
+
+        await register_webhook(self.dp, config, on_startup)
+        self.assertEqual(registered_on_startup, [None])
+        self.assertEqual(self.api._webhook_url, self.url)
+
+    async def test_failed_startup_removes_webhook(self):
+        # Вебхук остался от прошлого запуска
+        await self.dp.bot.set_webhook(self.url, secret_token=SECRET)
+        config = WebhookConfig(True, self.url.removesuffix('/webhook'), '/webhook', '127.0.0.1', 0, SECRET)
+
+        async def on_startup(dispatcher: Dispatcher) -> None:
+            raise RuntimeError('база недоступна')
+
+        with self.assertRaises(RuntimeError):
+            await register_webhook(self.dp, config, on_startup)
+        self.assertIsNone(self.api._webhook_url)
+
+
+if __name__ == '__main__':
+    unittest.main()